@@ -1,27 +1,59 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
 
+from app.routing import RoutingSQLAlchemy
 from config import app_config
 
-db = SQLAlchemy()
+# the instances a request has written stay loaded after the commit, as
+# the session is discarded with the request anyway
+db = RoutingSQLAlchemy(session_options={'expire_on_commit': False})
 
 
 def create_app(configuration="development"):
     app = Flask(__name__)
-    CORS(app=app)
+    CORS(app=app, expose_headers=[
+        'RateLimit-Limit', 'RateLimit-Remaining', 'RateLimit-Reset',
+        'Retry-After', 'ETag', 'Idempotent-Replayed'])
     app.config.from_object(app_config[configuration])
     db.init_app(app)
 
+    from app import (audit, coalescing, events, metrics, routing, tasks,
+                     unit_of_work)
+    from app.ratelimit import limiter
+    metrics.init_app(app)  # first, to time what the others do too
+    routing.init_app(app)
+    unit_of_work.init_app(app)
+    events.init_app(app)
+    audit.init_app(app)
+    tasks.init_app(app)
+    coalescing.init_app(app)
+    limiter.init_app(app)
+
     # register blueprints
     from app.endpoints.authentication.views import auth
     from app.endpoints.shoppinglist.views import list_blueprint
     from app.endpoints.items.views import items
+    from app.endpoints.sync.views import sync
+    from app.endpoints.events.views import event_stream
+    from app.endpoints.export.views import export
+    from app.endpoints.bulk_import.views import bulk_import
+    from app.endpoints.batch.views import batch
+    from app.endpoints.trash.views import trash
+    from app.endpoints.audit.views import audit_log
+    from app.endpoints.metrics.views import metrics_blueprint
     from app.docs.views import apiary
 
     app.register_blueprint(auth)
     app.register_blueprint(list_blueprint)
     app.register_blueprint(items)
+    app.register_blueprint(sync)
+    app.register_blueprint(event_stream)
+    app.register_blueprint(export)
+    app.register_blueprint(bulk_import)
+    app.register_blueprint(batch)
+    app.register_blueprint(trash)
+    app.register_blueprint(audit_log)
+    app.register_blueprint(metrics_blueprint)
     app.register_blueprint(apiary)
 
     @app.errorhandler(405)
@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.audit import get_audit_log
+from app.models import (User, ShoppingList, Item, Tombstone, ShardAssignment,
+                        IdempotencyKey, AuditEntry)
+from app.sharding import shard_of, use_shard
+from app.tasks import task, run_in_background
+
+
+def disable_account(user):
+    """ disables the account of <user> right away, which invalidates all
+    of their tokens and stops their reminders, and leaves their data to
+    purge_account"""
+    disabled_at = user.disabled_at = datetime.now()
+    user.save(commit=True)
+    shard, _ = shard_of(user.id)
+    if shard is not None:
+        # the reminders of a shard are sent to the users copied onto it
+        users = User.__table__
+        db.get_engine(current_app, bind=shard).execute(
+            users.update().where(users.c.id == user.id).values(
+                disabled_at=disabled_at))
+
+
+def delete_in_batches(table, condition, batch_size):
+    """
+    Deletes the rows of <table> matching <condition>, <batch_size> rows
+    per committed transaction, so that no lock is held on many rows for
+    long. Returns the number of rows that were deleted.
+    """
+    batch = select([table.c.id]).where(condition).limit(batch_size)
+    deleted = 0
+    while True:
+        count = db.session.execute(
+            table.delete().where(table.c.id.in_(batch))).rowcount
+        db.session.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+@task
+def purge_account(user_id, batch_size=500):
+    """
+    Deletes the items, shoppinglists and tombstones of a disabled user in
+    small batches, then the user and their audit log. Running it again
+    after an interruption carries on where it stopped. Returns the number
+    of rows deleted.
+    """
+    use_shard(user_id)
+    lists, items = ShoppingList.__table__, Item.__table__
+    list_ids = select([lists.c.id]).where(lists.c.user_id == user_id)
+    # the items go first, so that deleting a list cascades to nothing
+    deleted = delete_in_batches(
+        items, items.c.shoppinglist_id.in_(list_ids), batch_size)
+    deleted += delete_in_batches(
+        lists, lists.c.user_id == user_id, batch_size)
+    tombstones = Tombstone.__table__
+    deleted += delete_in_batches(
+        tombstones, tombstones.c.user_id == user_id, batch_size)
+
+    get_audit_log().flush()  # none of their entries is written afterwards
+    users = User.__table__
+    shard = db.session.info.get('shard')
+    if shard is not None:
+        # the copy of the user on its shard
+        db.get_engine(current_app, bind=shard).execute(
+            users.delete().where(users.c.id == user_id))
+    for model in (IdempotencyKey, AuditEntry, ShardAssignment):
+        table = model.__table__
+        db.session.execute(table.delete().where(table.c.user_id == user_id))
+    deleted += db.session.execute(
+        users.delete().where(users.c.id == user_id)).rowcount
+    db.session.commit()
+    return deleted
+
+
+def purge_disabled_accounts(batch_size=500):
+    """ purges every disabled account, such as those whose purge was cut
+    short by a restart, and returns how many there were"""
+    user_ids = [user_id for user_id, in db.session.query(User.id).filter(
+        User.disabled_at.isnot(None))]
+    for user_id in user_ids:
+        purge_account(user_id, batch_size)
+    return len(user_ids)
+
+
+def start_purge(user_id):
+    """ purges the account of <user_id> in the background, see
+    app.tasks.run_in_background"""
+    run_in_background(purge_account, user_id,
+                      current_app.config['ACCOUNT_PURGE_BATCH_SIZE'])
@@ -0,0 +1,134 @@
+import atexit
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, select, tuple_
+
+from app import db
+from app.models import AuditEntry
+
+
+class AuditLog:
+    """
+    AuditLog records who changed which shoppinglist or item, and when.
+    The committed changes are collected in memory and written together,
+    with a single multi-row INSERT, once <flush_events> of them are waiting
+    or every <flush_interval> seconds, by a background thread started with
+    the first change. Without an interval, as in the tests, the change that
+    fills a batch writes it. Up to <max_buffered> changes are kept while the
+    database can't be written to; beyond that the oldest are dropped.
+    """
+
+    def __init__(self, app, flush_interval=0.5, flush_events=100,
+                 max_buffered=10000):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self.max_buffered = max_buffered
+        self.entries = []
+        self.lock = threading.Lock()
+        self.flusher = None
+        self.batch_is_full = threading.Event()
+
+    def record(self, user_id, change):
+        """ buffers an entry for <change>, or one per shoppinglist for the
+        summary of an import"""
+        list_ids = change.get("shoppinglists")
+        if list_ids is None:
+            objects = [(change["id"], change["shoppinglist_id"])]
+        else:
+            objects = [(list_id, list_id) for list_id in list_ids]
+        now = datetime.now()
+        entries = [dict(user_id=user_id, action=change["action"],
+                        object_type=change["type"], object_id=object_id,
+                        shoppinglist_id=list_id, date_created=now)
+                   for object_id, list_id in objects]
+        with self.lock:
+            self.entries.extend(entries)
+            is_full = len(self.entries) >= self.flush_events
+            if self.flush_interval and self.flusher is None:
+                self.start()
+        if not is_full:
+            return
+        if self.flusher is not None:
+            self.batch_is_full.set()
+        else:
+            self.flush()
+
+    def start(self):
+        # whatever is still buffered is written before the process exits
+        atexit.register(self.flush)
+        self.flusher = threading.Thread(target=self.flush_periodically,
+                                        name="audit-log-flusher", daemon=True)
+        self.flusher.start()
+
+    def flush_periodically(self):
+        while True:
+            self.batch_is_full.wait(self.flush_interval)
+            self.batch_is_full.clear()
+            self.flush()
+
+    def flush(self):
+        """ writes the buffered changes with one INSERT and returns how many
+        there were"""
+        with self.lock:
+            entries, self.entries = self.entries, []
+        if not entries:
+            return 0
+        try:
+            # on a connection of its own, outside of any request's transaction
+            db.get_engine(self.app).execute(
+                AuditEntry.__table__.insert().values(entries))
+        except Exception:
+            self.app.logger.exception("the audit log could not be written")
+            with self.lock:
+                self.entries[:0] = entries
+                del self.entries[:-self.max_buffered]
+            return 0
+        return len(entries)
+
+
+def init_app(app):
+    app.extensions['audit'] = AuditLog(
+        app, app.config['AUDIT_FLUSH_INTERVAL_MS'] / 1000,
+        app.config['AUDIT_FLUSH_EVENTS'], app.config['AUDIT_MAX_BUFFERED'])
+
+
+def get_audit_log():
+    return current_app.extensions['audit']
+
+
+def get_entries(user_id, after, limit):
+    """
+    Returns up to <limit> of the user's audit entries that were written
+    after the position <after>, a (txid, id) pair, oldest first, together
+    with the ID of the oldest transaction that may still be running. Like
+    the changes of a sync, an entry is only returned once every older
+    transaction has ended, since a worker's batch with lower IDs can
+    commit after another's. The changes buffered by this process are
+    written first, so that they aren't missed.
+    """
+    get_audit_log().flush()
+    running = db.session.execute(
+        select([func.txid_snapshot_xmin(func.txid_current_snapshot())]),
+        mapper=AuditEntry.__mapper__).scalar()  # on the primary, like them
+    entries = AuditEntry.query.filter(AuditEntry.user_id == user_id).filter(
+        tuple_(AuditEntry.txid, AuditEntry.id) > tuple_(*after)).filter(
+            AuditEntry.txid < running).order_by(
+                AuditEntry.txid, AuditEntry.id).limit(limit).all()
+    return entries, running
+
+
+def parse_cursor(cursor):
+    """ returns the (txid, id) position of an audit log cursor, "<txid>.<id>",
+    or None if it isn't one. The integer cursors handed out before start
+    over from the oldest entry"""
+    parts = cursor.split('.')
+    if not all(part.isdigit() for part in parts) or len(parts) > 2:
+        return None
+    return (int(parts[0]), int(parts[1])) if len(parts) == 2 else (0, 0)
+
+
+def make_cursor(position):
+    return '.'.join(str(n) for n in position)
@@ -0,0 +1,202 @@
+import threading
+import time
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import and_, case, func, literal, not_, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.events import publish_change
+from app.models import Item, PendingBoughtState
+from app.sharding import use_shard
+from app.trash import live_lists_of
+
+TOGGLE = 'toggle'  # flips the state that the item has in the database
+
+
+class BoughtStateBuffer:
+    """
+    BoughtStateBuffer holds the has_been_bought changes that clients ask to
+    be coalesced, per shoppinglist, and writes only the state every item
+    ends up in. The changes are held as PendingBoughtState rows, which
+    every worker process sees, and are committed with the request that
+    accepted them. A list's changes are written with a single UPDATE once
+    its first change is <window> seconds old, checked by a background
+    thread every <flush_interval> seconds and by every new change, or as
+    soon as the list's items are edited. Reads only write them when this
+    process accepted changes of the user, which it remembers in <held>, so
+    that other reads stay on the replicas and a client reads its own
+    changes. Without an interval, as in the tests, only the reads, edits
+    and later changes write them.
+    """
+
+    def __init__(self, app, window=2, flush_interval=0.5):
+        self.app = app
+        self.window = window
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flusher = None
+        self.held = {}  # user_id: when this process last held their change
+
+    def add(self, user_id, list_id, item_id, state):
+        """ holds a change to the item's state in the session, <state> being
+        True, False or TOGGLE, and returns whether the list's window is
+        over. A held state that is toggled is flipped, and a toggle that is
+        toggled again is dropped"""
+        pending = PendingBoughtState.__table__
+        statement = insert(pending).values(
+            item_id=item_id, shoppinglist_id=list_id, user_id=user_id,
+            has_been_bought=None if state == TOGGLE else state,
+            toggled=state == TOGGLE)
+        first_change = select([func.min(pending.c.date_created)]).where(
+            pending.c.shoppinglist_id == list_id).as_scalar()
+        is_over = db.session.execute(statement.on_conflict_do_update(
+            index_elements=[pending.c.item_id],
+            set_=dict(
+                has_been_bought=case(
+                    [(statement.excluded.toggled, pending.c.has_been_bought)],
+                    else_=statement.excluded.has_been_bought),
+                toggled=and_(statement.excluded.toggled,
+                             not_(pending.c.toggled)))).returning(
+            func.now() - func.coalesce(first_change, func.now()) >=
+            timedelta(seconds=self.window))).scalar()
+        with self.lock:
+            self.held[user_id] = time.monotonic()
+            if self.flush_interval and self.flusher is None:
+                self.start()
+        return is_over
+
+    def forget(self, user_id):
+        """ returns whether this process held changes of the user, which it
+        no longer remembers"""
+        with self.lock:
+            return self.held.pop(user_id, None) is not None
+
+    @staticmethod
+    def lists_of(user_id, list_id=None):
+        """ returns the IDs of the user's lists that have changes held, of
+        only <list_id> if it is given"""
+        query = db.session.query(PendingBoughtState.shoppinglist_id).filter(
+            PendingBoughtState.user_id == user_id)
+        if list_id is not None:
+            query = query.filter(PendingBoughtState.shoppinglist_id == list_id)
+        return [pending_list_id for pending_list_id, in query.distinct()]
+
+    @staticmethod
+    def flush(user_id, list_id):
+        """ writes the list's held changes in the session with a single
+        UPDATE, and drops them, to be committed together. Returns the IDs
+        of the items whose state changed. Nothing is written while the
+        user is being moved to another shard"""
+        if use_shard(user_id):
+            return []
+        pending = PendingBoughtState.__table__
+        states = db.session.execute(pending.delete().where(and_(
+            pending.c.user_id == user_id,
+            pending.c.shoppinglist_id == list_id)).returning(
+                pending.c.item_id, pending.c.has_been_bought,
+                pending.c.toggled)).fetchall()
+
+        items = Item.__table__
+        bought = func.coalesce(items.c.has_been_bought, False)
+        # a toggle that was toggled again leaves the item as it is
+        new_states = {
+            item_id: not_(bought) if state is None else literal(
+                state != toggled)
+            for item_id, state, toggled in states
+            if state is not None or toggled}
+        if not new_states:
+            return []
+        new_state = case([(items.c.id == item_id, state)
+                          for item_id, state in new_states.items()])
+        updated = [item_id for item_id, in db.session.execute(
+            items.update().where(and_(
+                items.c.id.in_(list(new_states)),
+                items.c.shoppinglist_id == list_id,
+                items.c.shoppinglist_id.in_(live_lists_of(user_id)),
+                items.c.deleted_at.is_(None),
+                bought.is_distinct_from(new_state))).values(
+                    has_been_bought=new_state).returning(items.c.id))]
+        for item_id in updated:
+            publish_change(user_id, "updated", "item", item_id, list_id)
+        return updated
+
+    def start(self):
+        self.flusher = threading.Thread(target=self.flush_periodically,
+                                        name="bought-state-flusher",
+                                        daemon=True)
+        self.flusher.start()
+
+    def flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_all(older_than=self.window)
+            except Exception:
+                self.app.logger.exception(
+                    "the held bought states could not be written")
+                continue
+            # what was held before the window has been written since
+            written_before = time.monotonic() - self.window - \
+                self.flush_interval
+            with self.lock:
+                for user_id, held_at in list(self.held.items()):
+                    if held_at < written_before:
+                        del self.held[user_id]
+
+    def flush_all(self, older_than=0):
+        """ writes, and commits, the changes of every list, on every shard,
+        whose first change is at least <older_than> seconds old"""
+        for shard in self.app.config['SHARD_BINDS'] or [None]:
+            with self.app.app_context():
+                db.session.info['shard'] = shard
+                due = db.session.query(
+                    PendingBoughtState.user_id,
+                    PendingBoughtState.shoppinglist_id).group_by(
+                        PendingBoughtState.user_id,
+                        PendingBoughtState.shoppinglist_id).having(
+                    func.min(PendingBoughtState.date_created) <=
+                    func.now() - timedelta(seconds=older_than)).all()
+                for user_id, list_id in due:
+                    try:
+                        self.flush(user_id, list_id)
+                        db.session.commit()
+                    except Exception:
+                        db.session.rollback()
+                        self.app.logger.exception(
+                            f"the items of list {list_id} could not be "
+                            f"updated")
+
+
+def init_app(app):
+    app.extensions['bought_state'] = BoughtStateBuffer(
+        app, app.config['ITEM_STATUS_COALESCE_WINDOW_MS'] / 1000,
+        app.config['ITEM_STATUS_FLUSH_INTERVAL_MS'] / 1000)
+
+
+def get_bought_state_buffer():
+    return current_app.extensions['bought_state']
+
+
+def flush_bought_states(user_id, list_id=None):
+    """ writes the user's held has_been_bought changes, of every list or
+    only of <list_id>, in the session, for the request to edit the items as
+    they now are. They are committed with the request. A <list_id> that
+    isn't an integer has nothing held"""
+    if list_id is not None:
+        try:
+            list_id = int(list_id)
+        except ValueError:
+            return
+    buffer = get_bought_state_buffer()
+    for pending_list_id in buffer.lists_of(user_id, list_id):
+        buffer.flush(user_id, pending_list_id)
+
+
+def refresh_bought_states(user_id):
+    """ writes the user's held has_been_bought changes before a read, if
+    this process accepted any of them, so that the client reads its own
+    changes. Any other read costs no query and can go to a replica"""
+    if get_bought_state_buffer().forget(user_id):
+        flush_bought_states(user_id)
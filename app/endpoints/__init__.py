@@ -1,12 +1,26 @@
 from datetime import datetime
+from sqlalchemy import and_, or_
+
+from app import db
 from app.models import User, ShoppingList, Item
+from app.routing import READ_ONLY_METHODS
+from app.sharding import use_shard
 
 
 def parse_auth_header(request):
     """
     parse_auth_header is a helper function for obtaining a user's ID
-    by using the Authorization header.
+    by using the Authorization header. The result is remembered for the
+    rest of the request, so checking the header again costs nothing.
     """
+    result = request.environ.get('shoppinglist.auth')
+    if result is None:
+        result = request.environ['shoppinglist.auth'] = read_auth_header(
+            request)
+    return result
+
+
+def read_auth_header(request):
     auth_header = request.headers.get("Authorization")
     if auth_header:
         # check if we are using the JWT-Based Authentication mechanism
@@ -20,6 +34,11 @@ def parse_auth_header(request):
         user_id, err = User.verify_token(tokn)
 
         if isinstance(user_id, int) and err is None:
+            is_moving = use_shard(user_id)
+            if is_moving and request.method not in READ_ONLY_METHODS:
+                message = "your shopping lists are being moved to another " \
+                    "database, please retry in a moment"
+                return None, message, "failure", 503, None
             return user_id, "successful obtained user_id", "success", 200, tokn
         return None, err, "failure", 401, None
 
@@ -35,7 +54,8 @@ def get_shoppinglist(user_id, list_id):
         list_id = int(list_id)
         shoppinglist = ShoppingList.query.filter(
             ShoppingList.user_id == user_id).filter(
-                ShoppingList.id == list_id).first()
+                ShoppingList.id == list_id).filter(
+                    ShoppingList.deleted_at.is_(None)).first()
         if shoppinglist:
             return shoppinglist, None, "success", 200
         status = "failure"
@@ -59,7 +79,7 @@ def get_item(user_id, list_id, item_id):
     try:
         item_id = int(item_id)
         item = Item.query.filter(Item.shoppinglist_id == list_id).filter(
-            Item.id == item_id).first()
+            Item.id == item_id).filter(Item.deleted_at.is_(None)).first()
         if item:
             return item, None, "success", 200
 
@@ -75,6 +95,110 @@ def get_item(user_id, list_id, item_id):
         return None, message, status, status_code
 
 
+def items_are_expanded(request):
+    """Checks whether the client asked for a shoppinglist's items to be
+    embedded in the response, i.e `?expand=items`"""
+    expand = request.args.get('expand', '', type=str)
+    return 'items' in [field.strip() for field in expand.split(',')]
+
+
+def prefers_async(request):
+    """Checks whether the client would rather have its request accepted now
+    and carried out shortly, i.e `Prefer: respond-async` (RFC 7240)"""
+    preferences = request.headers.get('Prefer', '')
+    return 'respond-async' in [preference.split(';')[0].strip().lower()
+                               for preference in preferences.split(',')]
+
+
+def get_items_by_list(list_ids):
+    """
+    Returns the items of every shoppinglist in <list_ids>, grouped by the
+    shoppinglist ID. All the items are loaded with a single query no matter
+    how many shoppinglists there are, so expanding a page of lists costs
+    one extra statement instead of one per list.
+    """
+    items_by_list = {list_id: [] for list_id in list_ids}
+    if list_ids:
+        list_items = Item.query.filter(
+            Item.shoppinglist_id.in_(list_ids)).filter(
+                Item.deleted_at.is_(None)).order_by(Item.id)
+        for item in list_items:
+            items_by_list[item.shoppinglist_id].append(item_as_dict(item))
+    return items_by_list
+
+
+def shoppinglist_as_dict(shoppinglist):
+    return {
+        "id": shoppinglist.id,
+        "name": shoppinglist.name,
+        "notify_date": shoppinglist.notify_date.strftime("%Y-%m-%d"),
+        "date_created": shoppinglist.date_created.strftime("%Y-%m-%d %H:%M:%S"),
+        "date_modified": shoppinglist.date_modified.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def item_as_dict(item):
+    return {
+        "id": item.id,
+        "name": item.name,
+        "price": item.price,
+        "quantity": item.quantity,
+        "has_been_bought": item.has_been_bought,
+        "date_modified": item.date_modified.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def with_etag(response, version):
+    """ tags a response with the version of the shoppinglist or item in it,
+    for the client to send back in `If-Match` when it edits it"""
+    response.set_etag(str(version))
+    return response
+
+
+def get_expected_versions(request):
+    """
+    Returns the versions that the client's `If-Match` header allows an edit
+    to be made on, or None when any version will do. Tags that aren't
+    versions can never match.
+    """
+    if request.headers.get("If-Match") is None or request.if_match.star_tag:
+        return None
+    return {int(tag) for tag in request.if_match.as_set() if tag.isdigit()}
+
+
+def update_if_unmodified(model, criteria, changes, versions):
+    """
+    Applies <changes> to the row of <model> matching <criteria> with a
+    single conditional UPDATE, which only matches if the row is at one of
+    <versions> and <changes> actually change it. Returns the updated row,
+    or None when nothing matched. The version column is bumped by its
+    onupdate, and date_modified by its own, so no lock is held between
+    reading and writing the row. A change can be a SQL expression on the
+    row, such as a toggle. The update is committed with the request.
+    """
+    table = model.__table__
+    conditions = list(criteria)
+    conditions.append(or_(*[table.c[column].is_distinct_from(value)
+                            for column, value in changes.items()]))
+    if versions is not None:
+        conditions.append(table.c.version.in_(versions))
+
+    row = db.session.execute(table.update().where(and_(*conditions)).values(
+        **changes).returning(*table.c)).first()
+    return row
+
+
+def is_duplicate(error, *constraints):
+    """
+    Tells whether <error>, the IntegrityError of a write, broke one of the
+    unique <constraints>. The session is rolled back, as its transaction
+    can't be used after the error.
+    """
+    db.session.rollback()
+    diagnostics = getattr(error.orig, 'diag', None)
+    return getattr(diagnostics, 'constraint_name', None) in constraints
+
+
 def parse_notify_date(date_string):
     split_date = date_string.split("-")
 
@@ -0,0 +1,65 @@
+from flask import Blueprint, current_app, request, jsonify
+from flask.views import MethodView
+
+from app.audit import get_entries, parse_cursor, make_cursor
+from app.endpoints import parse_auth_header
+
+audit_log = Blueprint("audit_log", __name__, url_prefix="/api/v1")
+
+
+def audit_entry_as_dict(entry):
+    return {
+        "id": entry.id,
+        "action": entry.action,
+        "type": entry.object_type,
+        "object_id": entry.object_id,
+        "shoppinglist_id": entry.shoppinglist_id,
+        "date_created": entry.date_created.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+class AuditLogAPI(MethodView):
+    @staticmethod
+    def get():
+        """
+        Returns a page of the changes that the user made to their lists and
+        items, oldest first, with the cursor to send back as `after` for
+        the next page. Changes show up shortly after they are made, once
+        the audit log has written them.
+        """
+        user_id, message, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        after = parse_cursor(request.args.get('after', '0'))
+        if after is None:
+            return jsonify({
+                "status": "failure",
+                "message": "the audit log cursor is invalid"
+            }), 400
+
+        page_size = current_app.config['AUDIT_PAGE_SIZE']
+        limit = request.args.get('limit', page_size, type=int)
+        if not limit or limit < 1 or limit > page_size:
+            limit = page_size
+
+        entries, running = get_entries(user_id, after, limit)
+        if len(entries) == limit:
+            position = (entries[-1].txid, entries[-1].id)
+        else:
+            # every entry before the oldest running transaction was seen
+            position = max(after, (running, 0))
+        return jsonify({
+            "status": "success",
+            "entries": [audit_entry_as_dict(entry) for entry in entries],
+            "cursor": make_cursor(position),
+            "has_more": len(entries) == limit
+        }), 200
+
+
+audit_log_api = AuditLogAPI.as_view("audit_log_api")
+
+audit_log.add_url_rule("/audit", view_func=audit_log_api, methods=['GET'])
@@ -2,9 +2,14 @@ import re
 from flask import jsonify, request, Blueprint
 from flask.views import MethodView
 from flask_bcrypt import Bcrypt
+from sqlalchemy.exc import IntegrityError
 
 from app.models import User, BlacklistToken
-from app.endpoints import parse_auth_header
+from app.endpoints import parse_auth_header, is_duplicate
+from app.ratelimit import get_login_throttle, get_client_ip
+from app.sharding import assign_shard
+from app.accounts import disable_account, start_purge
+from app.metrics import BCRYPT_DURATION
 
 auth = Blueprint("auth", __name__, url_prefix='/api/v1')
 
@@ -30,21 +35,25 @@ class RegisterUser(MethodView):
                     "message": "invalid email format"
                 }), 400  # Bad Request due to a poorly formatted email address
 
-            email_is_already_registered = User.query.filter_by(
-                email=email).all()
-            if email_is_already_registered:
-                return jsonify({
-                    "status": "failure",
-                    "message": f"user with email '{email}' already exists"
-                }), 409  # Conflict
-
             if len(password) < 6:  # 6 is the minimum expected password length
                 return jsonify({
                     "status": "failure",
                     "message": "password must have a minimum of 6 characters"
                 }), 400
             user = User(email, password)
-            if user.save():
+            try:
+                # committed now, for assign_shard to copy it to its shard
+                has_been_saved = user.save(commit=True)
+            except IntegrityError as error:
+                if not is_duplicate(error, 'users_email_key',
+                                    'uq_users_lower_email'):
+                    raise
+                return jsonify({
+                    "status": "failure",
+                    "message": f"user with email '{email}' already exists"
+                }), 409  # Conflict
+            if has_been_saved:
+                assign_shard(user)
                 return jsonify({
                     "status": "success",
                     "message": f"user with email '{user.email}' has been registered"
@@ -69,18 +78,32 @@ class Login(MethodView):
                     "message": "invalid email format"
                 }), 400
 
+            # refuse locked out attempts before any password hashing
+            throttle = get_login_throttle()
+            ip = get_client_ip()
+            locked_for = throttle.locked_for(email, ip)
+            if locked_for:
+                return jsonify({
+                    "status": "failure",
+                    "message": "too many failed login attempts, "
+                               f"retry in {locked_for} seconds"
+                }), 429, {"Retry-After": str(locked_for)}
+
             user = User.query.filter_by(email=email).first()
-            if user:
+            if user and user.disabled_at is None:  # or being purged
                 if user.validate_password(password):
+                    throttle.reset(email)
                     return jsonify({
                         "status": "success",
                         "message": f"Login successful for '{user.email}'",
                         "token": User.generate_token(user.id).decode()
                     }), 200
+                throttle.record_failure(email, ip)
                 return jsonify({
                     "status": "failure",
                     "message": "Wrong password for the given email address"
                 }), 403
+            throttle.record_failure(email, ip)
             return jsonify({
                 "status": "failure",
                 "message": f"user with email '{email}' doesn't exist"
@@ -95,7 +118,9 @@ class Logout(MethodView):
     @staticmethod
     def post():
         """ User can only logout if and only if a user is
-        logged in and has an authentication token. """
+        logged in and has an authentication token. The token is
+        blacklisted before the response is sent, so that it can't be used
+        once the user has been told they are logged out. """
         user_id, msg, status, status_code, token = parse_auth_header(request)
         if user_id is None:
             return jsonify({
@@ -104,12 +129,15 @@ class Logout(MethodView):
             }), status_code
 
         user = User.query.filter_by(id=user_id).first()
-        blacklist = BlacklistToken(token)
-        if blacklist.save():  # blacklist token
+        if not BlacklistToken(token).save():
             return jsonify({
-                "status": "success",
-                "message": f"Successfully logged out '{user.email}'"
-            }), 200
+                "status": "failure",
+                "message": "the token could not be revoked, please try again"
+            }), 500
+        return jsonify({
+            "status": "success",
+            "message": f"Successfully logged out '{user.email}'"
+        }), 200
 
 
 class ResetPassword(MethodView):
@@ -131,8 +159,12 @@ class ResetPassword(MethodView):
                     "message": "password must have a minimum of 6 characters"
                 }), 400
 
-            password_hash = Bcrypt().generate_password_hash(password).decode('utf8')
-            if Bcrypt().check_password_hash(password_hash, confirm_password):
+            with BCRYPT_DURATION.labels('hash').time():
+                password_hash = Bcrypt().generate_password_hash(password).decode('utf8')
+            with BCRYPT_DURATION.labels('check').time():
+                passwords_match = Bcrypt().check_password_hash(
+                    password_hash, confirm_password)
+            if passwords_match:
                 user = User.query.filter_by(id=user_id).first()
                 if user and not user.validate_password(password):
                     # if old password is not similar to the new password
@@ -158,13 +190,40 @@ class ResetPassword(MethodView):
         }), 400
 
 
+class DeleteAccount(MethodView):
+    @staticmethod
+    def delete():
+        """
+        Deletes the logged in user's account. The account is disabled at
+        once, so none of its tokens work anymore, and its lists and items
+        are purged in small batches in the background.
+        """
+        user_id, msg, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": msg
+            }), status_code
+
+        user = User.query.filter_by(id=user_id).first()
+        disable_account(user)
+        start_purge(user_id)
+        return jsonify({
+            "status": "success",
+            "message": f"the account of '{user.email}' has been deleted"
+        }), 202
+
+
 register_user = RegisterUser.as_view("register_user")
 login = Login.as_view("login")
 logout = Logout.as_view("logout")
 reset_password = ResetPassword.as_view("reset_password")
+delete_account = DeleteAccount.as_view("delete_account")
 
 auth.add_url_rule("/auth/register", view_func=register_user, methods=['POST'])
 auth.add_url_rule("/auth/login", view_func=login, methods=['POST'])
 auth.add_url_rule("/auth/logout", view_func=logout, methods=['POST'])
 auth.add_url_rule("/auth/reset-password",
                   view_func=reset_password, methods=['POST'])
+auth.add_url_rule("/auth/account",
+                  view_func=delete_account, methods=['DELETE'])
@@ -0,0 +1,142 @@
+import json
+
+from flask import Blueprint, current_app, request, jsonify
+from flask.views import MethodView
+from werkzeug.test import EnvironBuilder
+
+from app import db
+from app.endpoints import parse_auth_header
+
+batch = Blueprint("batch", __name__, url_prefix="/api/v1")
+
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# the batch itself, streams that never end and the export and import, whose
+# files would be held in memory whole, can't be part of a batch
+UNBATCHABLE_PATHS = ('/api/v1/batch', '/api/v1/events', '/api/v1/export',
+                     '/api/v1/import')
+
+
+def validate_sub_requests(sub_requests):
+    """ returns an error message for the first malformed sub-request, or
+    None if they can all be run"""
+    max_requests = current_app.config['BATCH_MAX_REQUESTS']
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return "'requests' must be a list of {method, path, body} objects"
+    if len(sub_requests) > max_requests:
+        return f"a batch can have at most {max_requests} requests"
+    for number, sub_request in enumerate(sub_requests):
+        if not isinstance(sub_request, dict):
+            return f"request {number} must be a {{method, path, body}} object"
+        method = str(sub_request.get("method", "")).upper()
+        path = sub_request.get("path")
+        body = sub_request.get("body", {})
+        if method not in BATCH_METHODS:
+            return f"request {number}: the method must be one of " + \
+                ", ".join(BATCH_METHODS)
+        if not isinstance(path, str) or not path.startswith("/api/v1/") or \
+                path.split("?")[0].rstrip("/") in UNBATCHABLE_PATHS:
+            return f"request {number}: '{path}' can't be requested in a batch"
+        if not isinstance(body, dict):
+            return f"request {number}: the body must be an object of fields"
+    return None
+
+
+def dispatch(sub_request, auth):
+    """
+    Runs a sub-request through the app, with its hooks and error handlers,
+    but without a round trip over HTTP. The outcome of the batch's token
+    check is handed down, so the token is verified once per batch.
+    """
+    builder = EnvironBuilder(
+        path=sub_request["path"], method=sub_request["method"].upper(),
+        data=sub_request.get("body") or None,
+        headers={"Authorization": request.headers.get("Authorization")})
+    environ = builder.get_environ()
+    environ['shoppinglist.auth'] = auth
+    environ['shoppinglist.batched'] = True
+
+    with current_app.request_context(environ):
+        response = current_app.full_dispatch_request()
+        body = response.get_data(as_text=True)
+    try:
+        body = json.loads(body)
+    except ValueError:
+        pass  # not every endpoint answers with JSON
+    result = {"status": response.status_code, "body": body}
+    if response.headers.get("ETag"):
+        result["headers"] = {"ETag": response.headers["ETag"]}
+    return result
+
+
+class BatchAPI(MethodView):
+    @staticmethod
+    def post():
+        """
+        Runs up to BATCH_MAX_REQUESTS sub-requests, in order, and returns
+        their responses. With "transaction": true, the changes made by the
+        sub-requests are committed together, and none of them are kept if
+        any sub-request fails; the batch then stops at the failure.
+        """
+        auth = parse_auth_header(request)
+        user_id, message, status, status_code, _ = auth
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        payload = request.get_json(silent=True)
+        if isinstance(payload, list):
+            payload = {"requests": payload}
+        if not isinstance(payload, dict):
+            return jsonify({
+                "status": "failure",
+                "message": "the batch must be sent as JSON"
+            }), 400
+        sub_requests = payload.get("requests")
+        in_transaction = payload.get("transaction") is True
+        message = validate_sub_requests(sub_requests)
+        if message is not None:
+            return jsonify({
+                "status": "failure",
+                "message": message
+            }), 400
+
+        responses = []
+        if not in_transaction:
+            for sub_request in sub_requests:
+                responses.append(dispatch(sub_request, auth))
+            return jsonify({
+                "status": "success",
+                "responses": responses
+            }), 200
+
+        db.session.info['deferred_commits'] = True
+        failed = None
+        try:
+            for number, sub_request in enumerate(sub_requests):
+                responses.append(dispatch(sub_request, auth))
+                if responses[-1]["status"] >= 400:
+                    failed = number
+                    break
+        finally:
+            db.session.info.pop('deferred_commits')
+            if failed is not None or len(responses) < len(sub_requests):
+                db.session.rollback()
+        if failed is not None:
+            return jsonify({
+                "status": "failure",
+                "message": f"request {failed} failed, so none of the "
+                           "changes in the batch were saved",
+                "responses": responses
+            }), 200
+
+        return jsonify({
+            "status": "success",
+            "responses": responses
+        }), 200  # and the whole batch is committed with this request
+
+
+batch_api = BatchAPI.as_view("batch_api")
+
+batch.add_url_rule("/batch", view_func=batch_api, methods=['POST'])
@@ -0,0 +1,64 @@
+from flask import Blueprint, current_app, request, jsonify
+from flask.views import MethodView
+
+from app.importer import import_shoppinglists
+from app.endpoints import parse_auth_header
+
+bulk_import = Blueprint("bulk_import", __name__, url_prefix="/api/v1")
+
+
+def get_file_format(upload, requested_format):
+    """ the format given in the form wins, otherwise it is taken from the
+    file's name or content type. NDJSON, the export format, is the default"""
+    if requested_format:
+        return requested_format.strip().lower()
+    filename = (upload.filename or "").lower()
+    if filename.endswith(".csv") or upload.mimetype == "text/csv":
+        return "csv"
+    return "ndjson"
+
+
+class ImportAPI(MethodView):
+    @staticmethod
+    def post():
+        """
+        Imports the shoppinglists and items in the uploaded 'file', a CSV or
+        an NDJSON file as written by the export. The rows that were
+        rejected are reported together with their line numbers.
+        """
+        user_id, message, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        upload = request.files.get("file")
+        if upload is None:
+            return jsonify({
+                "status": "failure",
+                "message": "a 'file' to import must be uploaded"
+            }), 400
+
+        file_format = get_file_format(upload, request.form.get("format"))
+        if file_format not in ("csv", "ndjson"):
+            return jsonify({
+                "status": "failure",
+                "message": "the acceptable formats are `csv` and `ndjson`"
+            }), 400
+
+        report = import_shoppinglists(
+            user_id, upload.stream, file_format,
+            chunk_size=current_app.config['IMPORT_CHUNK_SIZE'])
+        response = {
+            "status": "success",
+            "message": f"imported {report.lists_created} shoppinglists and "
+                       f"{report.items_created} items"
+        }
+        response.update(report.as_dict())
+        return jsonify(response), 200
+
+
+import_api = ImportAPI.as_view("import_api")
+
+bulk_import.add_url_rule("/import", view_func=import_api, methods=['POST'])
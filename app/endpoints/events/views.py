@@ -0,0 +1,62 @@
+import json
+import queue
+
+from flask import Blueprint, Response, current_app, request, jsonify
+from flask.views import MethodView
+
+from app import db
+from app.events import get_broker
+from app.endpoints import parse_auth_header
+
+event_stream = Blueprint("event_stream", __name__, url_prefix="/api/v1")
+
+
+def stream_changes(broker, user_id, heartbeat):
+    """
+    Yields the user's change events in the Server-Sent Events format.
+    A comment is sent every <heartbeat> seconds without events so that
+    proxies keep the connection open and dead clients are detected.
+    """
+    subscription = broker.subscribe(user_id)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = subscription.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: change\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broker.unsubscribe(user_id, subscription)
+
+
+class EventStreamAPI(MethodView):
+    @staticmethod
+    def get():
+        """
+        Streams a change event whenever one of the user's shoppinglists
+        or items is created, edited or deleted. The stream holds no
+        database connection, so idle clients only cost a greenlet on the
+        gevent workers.
+        """
+        user_id, message, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        db.session.remove()  # give the connection back before streaming
+        heartbeat = current_app.config['EVENT_STREAM_HEARTBEAT_SECONDS']
+        return Response(
+            stream_changes(get_broker(), user_id, heartbeat),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache",
+                     "X-Accel-Buffering": "no"})
+
+
+event_stream_api = EventStreamAPI.as_view("event_stream_api")
+
+event_stream.add_url_rule(
+    "/events", view_func=event_stream_api, methods=['GET'])
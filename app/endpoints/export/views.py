@@ -0,0 +1,105 @@
+import json
+import zlib
+
+from flask import (
+    Blueprint, Response, current_app, request, jsonify, stream_with_context)
+from flask.views import MethodView
+from sqlalchemy import and_
+
+from app import db
+from app.models import ShoppingList, Item
+from app.endpoints import parse_auth_header
+from app.coalescing import refresh_bought_states
+
+export = Blueprint("export", __name__, url_prefix="/api/v1")
+
+
+def export_lines(user_id, batch_size):
+    """
+    Yields every shoppinglist of the user, with its items nested, as one
+    line of JSON. The lists and items are read in a single ordered query
+    through a server-side cursor, <batch_size> rows at a time, so memory
+    stays flat however large the account is.
+    """
+    rows = db.session.query(
+        ShoppingList.id, ShoppingList.name, ShoppingList.notify_date,
+        ShoppingList.date_created, ShoppingList.date_modified,
+        Item.id, Item.name, Item.price, Item.quantity, Item.has_been_bought,
+        Item.date_modified).outerjoin(
+            Item, and_(Item.shoppinglist_id == ShoppingList.id,
+                       Item.deleted_at.is_(None))).filter(
+                ShoppingList.user_id == user_id).filter(
+                    ShoppingList.deleted_at.is_(None)).order_by(
+                        ShoppingList.id, Item.id).yield_per(batch_size)
+
+    shoppinglist = None
+    for row in rows:
+        if shoppinglist is None or shoppinglist["id"] != row[0]:
+            if shoppinglist is not None:
+                yield json.dumps(shoppinglist) + "\n"
+            shoppinglist = {
+                "id": row[0],
+                "name": row[1],
+                "notify_date": row[2].strftime("%Y-%m-%d"),
+                "date_created": row[3].strftime("%Y-%m-%d %H:%M:%S"),
+                "date_modified": row[4].strftime("%Y-%m-%d %H:%M:%S"),
+                "items": []
+            }
+        if row[5] is not None:
+            shoppinglist["items"].append({
+                "id": row[5],
+                "name": row[6],
+                "price": row[7],
+                "quantity": row[8],
+                "has_been_bought": row[9],
+                "date_modified": row[10].strftime("%Y-%m-%d %H:%M:%S")
+            })
+    if shoppinglist is not None:
+        yield json.dumps(shoppinglist) + "\n"
+
+
+def gzip_lines(lines, lines_per_chunk):
+    """ compresses <lines> as a gzip stream, flushing every
+    <lines_per_chunk> lines so the client isn't kept waiting"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for count, line in enumerate(lines, start=1):
+        chunk = compressor.compress(line.encode())
+        if count % lines_per_chunk == 0:
+            chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+class ExportAPI(MethodView):
+    @staticmethod
+    def get():
+        """
+        Streams all the user's shoppinglists and their items as
+        newline delimited JSON, gzipped if the client accepts it.
+        """
+        user_id, message, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        refresh_bought_states(user_id)
+        batch_size = current_app.config['EXPORT_BATCH_SIZE']
+        body = export_lines(user_id, batch_size)
+        headers = {
+            "Content-Disposition": "attachment; filename=shoppinglists.ndjson",
+            "Vary": "Accept-Encoding"
+        }
+        if "gzip" in request.accept_encodings:
+            body = gzip_lines(body, lines_per_chunk=100)
+            headers["Content-Encoding"] = "gzip"
+
+        return Response(stream_with_context(body),
+                        mimetype="application/x-ndjson", headers=headers)
+
+
+export_api = ExportAPI.as_view("export_api")
+
+export.add_url_rule("/export", view_func=export_api, methods=['GET'])
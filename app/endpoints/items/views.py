@@ -1,15 +1,59 @@
-from datetime import datetime
 from flask.views import MethodView
 from flask import Blueprint, request, jsonify
-
-from app.models import Item
-from app.endpoints import parse_auth_header, get_shoppinglist, get_item
+from sqlalchemy import func, not_
+from sqlalchemy.exc import IntegrityError
+
+from app.models import ShoppingList, Item
+from app.events import publish_change
+from app.idempotency import idempotent
+from app.endpoints import (
+    parse_auth_header, get_shoppinglist, get_item, with_etag,
+    get_expected_versions, update_if_unmodified, is_duplicate, prefers_async)
+from app.trash import trash_item
+from app.coalescing import (
+    TOGGLE, get_bought_state_buffer, flush_bought_states,
+    refresh_bought_states)
 
 items = Blueprint("items", __name__, url_prefix="/api/v1")
 
 
+def get_item_changes(form):
+    """
+    Returns the changes to an item that a PATCH <form> asks for, or None
+    and the reason they can't be made. The fields that aren't sent are
+    left as they are.
+    """
+    changes = {}
+    for field in ("name", "price", "quantity"):
+        value = form.get(field)
+        if value is None:
+            continue
+        value = value.strip()
+        if not value:
+            return None, f"'{field}' of an item can't be empty"
+        changes[field] = value.lower() if field == "name" else value
+
+    status = form.get("status")
+    if status is not None:
+        status = status.strip().lower()
+        if status == "toggle":
+            changes["has_been_bought"] = not_(
+                func.coalesce(Item.__table__.c.has_been_bought, False))
+        elif status in ("true", "false"):
+            changes["has_been_bought"] = status == "true"
+        else:
+            return None, "'status' of an item must be 'true', 'false' " \
+                "or 'toggle'"
+
+    if not changes:
+        return None, "send at least one of 'name', 'price', 'quantity' " \
+            "or 'status' to edit an item"
+    return changes, None
+
+
 class ItemsAPI(MethodView):
     @staticmethod
+    @idempotent
     def post(list_id):
         """Adds an item to a shoppinglist"""
 
@@ -35,19 +79,19 @@ class ItemsAPI(MethodView):
 
             if name and price and quantity:
                 name = name.lower()
-
-                name_already_exists = Item.query.filter(
-                    Item.shoppinglist_id == list_id).filter(Item.name == name).all()
-
-                if name_already_exists:
+                item = Item(list_id, name, quantity,
+                            price, status=has_been_bought)
+                try:
+                    item.save()
+                except IntegrityError as error:
+                    if not is_duplicate(error, 'uq_items_shoppinglist_id_name'):
+                        raise
                     return jsonify({
                         "status": "failure",
                         "message": f"an item with name '{name}' already exists"
                     }), 409
-
-                item = Item(list_id, name, quantity,
-                            price, status=has_been_bought)
-                item.save()
+                publish_change(user_id, "created", "item",
+                               item.id, shoppinglist.id)
                 return jsonify({
                     "status": "success",
                     "message": f"'{item.name}' has been added"
@@ -71,6 +115,7 @@ class ItemsAPI(MethodView):
                 "message": message
             }), status_code
 
+        refresh_bought_states(user_id)
         shoppinglist, message, status, status_code = get_shoppinglist(
             user_id, list_id)
         if shoppinglist:
@@ -85,7 +130,9 @@ class ItemsAPI(MethodView):
             if not page or page < 1:  # pragma: no cover
                 page = 1
 
-            query_object = Item.query.filter(Item.shoppinglist_id == list_id)
+            query_object = Item.query.filter(
+                Item.shoppinglist_id == list_id).filter(
+                    Item.deleted_at.is_(None)).order_by(Item.id)
             if search_query is not None:
                 query_object = query_object.filter(
                     Item.name.like('%' + search_query.strip().lower() + '%'))
@@ -162,17 +209,18 @@ class ItemsAPIByID(MethodView):
                 "message": message
             }), status_code
 
+        refresh_bought_states(user_id)
         item, message, status, status_code = get_item(
             user_id, list_id, item_id)
         if item is not None:
-            return jsonify({
+            return with_etag(jsonify({
                 "id": item.id,
                 "name": item.name,
                 "price": item.price,
                 "quantity": item.quantity,
                 "has_been_bought": item.has_been_bought,
                 'date_modified': item.date_modified.strftime("%Y-%m-%d %H:%M:%S")
-            }), 200
+            }), item.version), 200
         return jsonify({
             "status": status,
             "message": message
@@ -187,13 +235,22 @@ class ItemsAPIByID(MethodView):
                 "message": message
             }), status_code
 
-        item, message, status, status_code = get_item(
-            user_id, list_id, item_id)
-        if item is not None and item.delete():
+        try:
+            list_id, item_id = int(list_id), int(item_id)
+            flush_bought_states(user_id, list_id)
+            is_deleted = trash_item(user_id, list_id, item_id)
+        except ValueError:
+            is_deleted = False
+
+        if is_deleted:
+            publish_change(user_id, "deleted", "item", item_id, list_id)
             return jsonify({
-                'status': status,
+                'status': 'success',
                 'message': f'an item with ID {item_id} has been successfully deleted'
-            }), status_code
+            }), 200
+
+        # nothing was deleted: find out why with a read
+        _, message, status, status_code = get_item(user_id, list_id, item_id)
         return jsonify({
             "status": status,
             "message": message
@@ -201,6 +258,7 @@ class ItemsAPIByID(MethodView):
 
     @staticmethod
     def put(list_id, item_id):
+        """ Edits every field of an item, see edit"""
         user_id, message, status, status_code, _ = parse_auth_header(request)
         if user_id is None:
             return jsonify({
@@ -208,69 +266,173 @@ class ItemsAPIByID(MethodView):
                 "message": message
             }), status_code
 
-        item, message, status, status_code = get_item(
-            user_id, list_id, item_id)
+        # form fields
+        name = request.form.get("name")
+        price = request.form.get("price")
+        quantity = request.form.get("quantity")
+        status = request.form.get("status")
+
+        has_been_bought = True if status and status.strip().title() == "True" else False
+
+        name = name.strip().lower() if name else ""
+        price = price.strip() if price else ""
+        quantity = quantity.strip() if quantity else ""
+
+        try:
+            list_id, item_id = int(list_id), int(item_id)
+            is_valid = bool(name and price and quantity)
+        except ValueError:
+            is_valid = False
+
+        if not is_valid:
+            # bad IDs and missing items are reported before the form
+            item, message, status, status_code = get_item(
+                user_id, list_id, item_id)
+            if item is None:
+                return jsonify({
+                    "status": status,
+                    "message": message
+                }), status_code
+            return jsonify({
+                'status': 'failure',
+                'message': "'name', 'price' and 'quantity' of an item must be specified whereas 'status' is optional"
+            }), 400
 
-        if item is not None:
-            # query parameters
-            name = request.form.get("name")
-            price = request.form.get("price")
-            quantity = request.form.get("quantity")
-            status = request.form.get("status")
+        return ItemsAPIByID.edit(
+            user_id, list_id, item_id,
+            {"name": name, "price": price, "quantity": quantity,
+             "has_been_bought": has_been_bought})
 
-            has_been_bought = True if status and status.strip().title() == "True" else False
+    @staticmethod
+    def patch(list_id, item_id):
+        """
+        Edits only the fields of an item that are sent, with the same
+        single UPDATE as put. A `status` of 'toggle' flips has_been_bought
+        in the database, so the client needn't know its current value.
+        A change of `status` alone sent with `Prefer: respond-async` is
+        coalesced with the others made to the list shortly after, see
+        coalesce.
+        """
+        user_id, message, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
 
-            name = name.strip() if name else ""
-            price = price.strip() if price else ""
-            quantity = quantity.strip() if quantity else ""
+        changes, message = get_item_changes(request.form)
+        try:
+            list_id, item_id = int(list_id), int(item_id)
+        except ValueError:
+            changes = None
+
+        if changes is None:
+            # bad IDs and missing items are reported before the form
+            item, not_found, status, status_code = get_item(
+                user_id, list_id, item_id)
+            if item is None:
+                return jsonify({
+                    "status": status,
+                    "message": not_found
+                }), status_code
+            return jsonify({
+                "status": "failure",
+                "message": message
+            }), 400
 
-            if name and price and quantity:
-                name = name.lower()
-                name_already_exists = Item.query.filter(
-                    Item.shoppinglist_id == list_id).filter((
-                        (Item.name == name) & (Item.id != item_id))).all()
-
-                # if no edits were made...
-                if (item.name == name and item.quantity == quantity and
-                        item.price == price and
-                        item.has_been_bought == has_been_bought):
-                    return jsonify({
-                        "status": "failure",
-                        "message": "no changes were made to the item"
-                    }), 200
+        if prefers_async(request) and set(request.form) == {"status"} and \
+                request.headers.get("If-Match") is None:
+            requested = request.form["status"].strip().lower()
+            return ItemsAPIByID.coalesce(
+                user_id, list_id, item_id,
+                TOGGLE if requested == "toggle" else requested == "true")
+        return ItemsAPIByID.edit(user_id, list_id, item_id, changes)
 
-                if name_already_exists:
-                    return jsonify({
-                        "status": 'failure',
-                        "message": f"an item with name '{name}' already exists"
-                    }), 409
+    @staticmethod
+    def coalesce(user_id, list_id, item_id, state):
+        """
+        Holds a change of an item's has_been_bought for a short while, with
+        the others made to the items of the same list, and answers 202
+        once it is committed. Only the state that every item ends up in is
+        written, with a single UPDATE, before the list's items are next
+        read or edited.
+        """
+        item, message, status, status_code = get_item(
+            user_id, list_id, item_id)
+        if item is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        if get_bought_state_buffer().add(user_id, list_id, item_id, state):
+            flush_bought_states(user_id, list_id)
+        response = jsonify({
+            "status": "success",
+            "message": "the item will be updated shortly"
+        })
+        response.headers['Preference-Applied'] = 'respond-async'
+        return response, 202
 
-                item.name = name
-                item.price = price
-                item.quantity = quantity
-                item.has_been_bought = has_been_bought
-                item.date_modified = datetime.now()
-                item.save()
+    @staticmethod
+    def edit(user_id, list_id, item_id, changes):
+        """
+        Applies <changes> to an item of the user with a single conditional
+        UPDATE. When the client sends `If-Match`, the edit is refused with
+        412 if the item was changed since the client read it.
+        """
+        flush_bought_states(user_id, list_id)
+        versions = get_expected_versions(request)
+        try:
+            item = update_if_unmodified(
+                Item,
+                [Item.id == item_id, Item.shoppinglist_id == list_id,
+                 ShoppingList.id == Item.shoppinglist_id,
+                 ShoppingList.user_id == user_id,
+                 Item.deleted_at.is_(None), ShoppingList.deleted_at.is_(None)],
+                changes, versions)
+        except IntegrityError as error:
+            if not is_duplicate(error, 'uq_items_shoppinglist_id_name'):
+                raise
+            return jsonify({
+                "status": 'failure',
+                "message": f"an item with name '{changes['name']}' already exists"
+            }), 409
+
+        if item is None:
+            # nothing was updated: find out why with a read
+            item, message, status, status_code = get_item(
+                user_id, list_id, item_id)
+            if item is None:
                 return jsonify({
-                    'status': 'success',
-                    'data': {
-                        'id': item.id,
-                        'name': item.name,
-                        "price": item.price,
-                        "quantity": item.quantity,
-                        'date_modified': item.date_modified,
-                        'has_been_bought': item.has_been_bought
-                    },
-                    'message': 'item has been updated successfully'
-                }), 200
+                    "status": status,
+                    "message": message
+                }), status_code
+            if versions is not None and item.version not in versions:
+                return with_etag(jsonify({
+                    "status": "failure",
+                    "message": "the item has been changed since you last "
+                               "fetched it, please fetch it again"
+                }), item.version), 412
             return jsonify({
-                'status': 'failure',
-                'message': "'name', 'price' and 'quantity' of an item must be specified whereas 'status' is optional"
-            }), 400
-        return jsonify({
-            "status": status,
-            "message": message
-        }), status_code
+                "status": "failure",
+                "message": "no changes were made to the item"
+            }), 200
+
+        publish_change(user_id, "updated", "item",
+                       item.id, item.shoppinglist_id)
+        return with_etag(jsonify({
+            'status': 'success',
+            'data': {
+                'id': item.id,
+                'name': item.name,
+                "price": item.price,
+                "quantity": item.quantity,
+                'date_modified': item.date_modified,
+                'has_been_bought': item.has_been_bought
+            },
+            'message': 'item has been updated successfully'
+        }), item.version), 200
 
 
 items_api = ItemsAPI.as_view("items_api")
@@ -281,4 +443,4 @@ items.add_url_rule("/shoppinglists/<list_id>/items",
 
 items.add_url_rule(
     "/shoppinglists/<list_id>/items/<item_id>",
-    view_func=items_by_id_api, methods=['GET', 'DELETE', 'PUT'])
+    view_func=items_by_id_api, methods=['GET', 'DELETE', 'PUT', 'PATCH'])
@@ -0,0 +1,31 @@
+import hmac
+
+from flask import Blueprint, Response, current_app, request, jsonify
+from flask.views import MethodView
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from app.metrics import render_metrics
+
+metrics_blueprint = Blueprint("metrics", __name__)
+
+
+class MetricsAPI(MethodView):
+    @staticmethod
+    def get():
+        """ Exposes the request, database and bcrypt metrics in the
+        Prometheus text format, for a Prometheus server to scrape"""
+        token = current_app.config['METRICS_TOKEN']
+        if token and not hmac.compare_digest(
+                request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return jsonify({
+                "status": "failure",
+                "message": "a valid metrics token is required"
+            }), 403
+
+        return Response(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
+metrics_api = MetricsAPI.as_view("metrics_api")
+
+metrics_blueprint.add_url_rule("/metrics", view_func=metrics_api,
+                               methods=['GET'])
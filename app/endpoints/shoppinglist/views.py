@@ -1,16 +1,46 @@
-from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flask.views import MethodView
+from sqlalchemy.exc import IntegrityError
 
 from app.endpoints import (
-    parse_auth_header, get_shoppinglist, parse_notify_date)
+    parse_auth_header, get_shoppinglist, parse_notify_date,
+    items_are_expanded, get_items_by_list, with_etag,
+    get_expected_versions, update_if_unmodified, is_duplicate)
 from app.models import ShoppingList
+from app.events import publish_change
+from app.idempotency import idempotent
+from app.trash import trash_shoppinglist
+from app.coalescing import flush_bought_states, refresh_bought_states
 
 list_blueprint = Blueprint("list_blueprint", __name__, url_prefix="/api/v1")
 
 
+def get_list_changes(form):
+    """ returns the changes to a shoppinglist that a PATCH <form> asks for,
+    or None and the reason they can't be made"""
+    changes = {}
+    name = form.get("name")
+    if name is not None:
+        name = name.strip().lower()
+        if not name:
+            return None, "'name' of a shoppinglist can't be empty"
+        changes["name"] = name
+
+    notify_date = form.get("notify_date")
+    if notify_date is not None:
+        date_string, message = parse_notify_date(notify_date.strip())
+        if date_string is None:
+            return None, message
+        changes["notify_date"] = date_string
+
+    if not changes:
+        return None, "send 'name' or 'notify_date' to edit a shoppinglist"
+    return changes, None
+
+
 class ShoppingListAPI(MethodView):
     @staticmethod
+    @idempotent
     def post():
         """Adds a new shoppinglist to the currently logged in user account"""
         user_id, message, status, status_code, _ = parse_auth_header(request)
@@ -29,15 +59,6 @@ class ShoppingListAPI(MethodView):
 
         if name and notify_date:
             name = name.lower()
-            name_already_exists = ShoppingList.query.filter(
-                ShoppingList.user_id == user_id).filter(
-                    ShoppingList.name == name).all()
-            if name_already_exists:
-                return jsonify({
-                    "status": "failure",
-                    "message": f"a shopping list with name '{name}' already exists"
-                }), 409
-
             date_string, message = parse_notify_date(notify_date)
             if date_string is None:
                 return jsonify({
@@ -46,7 +67,17 @@ class ShoppingListAPI(MethodView):
                 }), 400
 
             shoppinglist = ShoppingList(user_id, name, date_string)
-            shoppinglist.save()
+            try:
+                shoppinglist.save()
+            except IntegrityError as error:
+                if not is_duplicate(error, 'uq_shoppinglists_user_id_name'):
+                    raise
+                return jsonify({
+                    "status": "failure",
+                    "message": f"a shopping list with name '{name}' already exists"
+                }), 409
+            publish_change(user_id, "created", "shoppinglist",
+                           shoppinglist.id, shoppinglist.id)
             return jsonify({
                 "status": "success",
                 "message": f"'{shoppinglist.name}' successfully created"
@@ -61,7 +92,8 @@ class ShoppingListAPI(MethodView):
         """
         Returns the shoppinglists that are owned by the logged in user.
         The lists returned depend on whether there were any specified
-        query parameters.
+        query parameters. With `?expand=items`, the items of every list
+        on the page are embedded in the response.
         """
         user_id, message, status, status_code, _ = parse_auth_header(request)
         if user_id is None:
@@ -80,9 +112,11 @@ class ShoppingListAPI(MethodView):
             per_page = 20
         if not page or page < 1:  # pragma: no cover
             page = 1
+        expand_items = items_are_expanded(request)
 
         query_object = ShoppingList.query.filter(
-            ShoppingList.user_id == user_id)
+            ShoppingList.user_id == user_id).filter(
+                ShoppingList.deleted_at.is_(None)).order_by(ShoppingList.id)
         if search_query is not None:
             query_object = query_object.filter(ShoppingList.name.like(
                 '%' + search_query.strip().lower() + '%'))
@@ -93,17 +127,19 @@ class ShoppingListAPI(MethodView):
 
         next_page = None
         if pg_object.has_next:
-            next_page = "/api/v1/shoppinglists?page={0}{1}{2}".format(
+            next_page = "/api/v1/shoppinglists?page={0}{1}{2}{3}".format(
                 pg_object.next_num,
                 '' if per_page == 20 else f'&limit={per_page}',
-                '' if search_query is None else f'&q={search_query}')
+                '' if search_query is None else f'&q={search_query}',
+                '&expand=items' if expand_items else '')
 
         previous_page = None
         if pg_object.has_prev:
-            previous_page = "/api/v1/shoppinglists?page={0}{1}{2}".format(
+            previous_page = "/api/v1/shoppinglists?page={0}{1}{2}{3}".format(
                 pg_object.prev_num,
                 '' if per_page == 20 else f'&limit={per_page}',
-                '' if search_query is None else f'&q={search_query}')
+                '' if search_query is None else f'&q={search_query}',
+                '&expand=items' if expand_items else '')
 
         shoppinglists = []
         for shoppinglist in pg_object.items:
@@ -115,6 +151,13 @@ class ShoppingListAPI(MethodView):
                 "date_modified": shoppinglist.date_modified.strftime("%Y-%m-%d %H:%M:%S")
             })
 
+        if expand_items:
+            refresh_bought_states(user_id)
+            items_by_list = get_items_by_list(
+                [shoppinglist["id"] for shoppinglist in shoppinglists])
+            for shoppinglist in shoppinglists:
+                shoppinglist["items"] = items_by_list[shoppinglist["id"]]
+
         if shoppinglists:
             if search_query is not None:
                 return jsonify({
@@ -156,13 +199,18 @@ class ShoppingListByID(MethodView):
         shoppinglist, message, status, status_code = get_shoppinglist(
             user_id, list_id)
         if shoppinglist:
-            return jsonify({
+            data = {
                 "id": shoppinglist.id,
                 "name": shoppinglist.name,
                 "notify_date": shoppinglist.notify_date.strftime("%Y-%m-%d"),
                 "date_created": shoppinglist.date_created.strftime("%Y-%m-%d %H:%M:%S"),
                 "date_modified": shoppinglist.date_modified.strftime("%Y-%m-%d %H:%M:%S")
-            }), status_code
+            }
+            if items_are_expanded(request):
+                refresh_bought_states(user_id)
+                data["items"] = get_items_by_list(
+                    [shoppinglist.id])[shoppinglist.id]
+            return with_etag(jsonify(data), shoppinglist.version), status_code
         return jsonify({
             "status": status,
             "message": message
@@ -177,21 +225,31 @@ class ShoppingListByID(MethodView):
                 "message": message
             }), status_code
 
-        shoppinglist, message, status, status_code = get_shoppinglist(
-            user_id, list_id)
-        if shoppinglist and shoppinglist.delete():
+        try:
+            list_id = int(list_id)
+        except ValueError:
             return jsonify({
-                "status": status,
+                "status": "failure",
+                "message": "shopping list IDs must be integers"
+            }), 400
+
+        flush_bought_states(user_id, list_id)  # to be restored as they are
+        if trash_shoppinglist(user_id, list_id):
+            publish_change(user_id, "deleted", "shoppinglist",
+                           list_id, list_id)
+            return jsonify({
+                "status": "success",
                 "message": f"shopping list with ID {list_id} deleted successfully"
-            }), status_code
+            }), 200
 
         return jsonify({
-            "status": status,
-            "message": message
-        }), status_code
+            "status": "failure",
+            "message": "shopping list with that ID cannot be found!"
+        }), 404
 
     @staticmethod
     def put(list_id):
+        """ Edits every field of a shoppinglist, see edit"""
         user_id, message, status, status_code, _ = parse_auth_header(request)
         if user_id is None:
             return jsonify({
@@ -199,66 +257,133 @@ class ShoppingListByID(MethodView):
                 "message": message
             }), status_code
 
-        shoppinglist, message, status, status_code = get_shoppinglist(
-            user_id, list_id)
-        if shoppinglist:  # a shoppinglist with list_id exists in the database
-
-            name = request.form.get("name")
-            notify_date = request.form.get("notify_date")
-
-            name = name.strip() if name else ""
-            notify_date = notify_date.strip() if notify_date else ""
-
-            if name and notify_date:
-                name = name.lower()
-                name_already_exists = ShoppingList.query.filter(
-                    ShoppingList.user_id == user_id).filter(
-                        ((ShoppingList.name == name) &
-                         (ShoppingList.id != list_id))).all()
-
-                date_string, message = parse_notify_date(notify_date)
-                if date_string is None:
-                    return jsonify({
-                        "status": "failure",
-                        "message": message,
-                    }), 400
-
-                stored_date = shoppinglist.notify_date.strftime("%Y-%m-%d")
-                if shoppinglist.name == name and stored_date == date_string:
-                    return jsonify({
-                        "status": "failure",
-                        "message": "No changes were made to the list"
-                    }), 200
-
-                if name_already_exists:
-                    return jsonify({
-                        "status": "failure",
-                        "message": f"a shopping list with name '{name}' already exists"
-                    }), 409
-
-                shoppinglist.name = name
-                shoppinglist.notify_date = date_string
-                shoppinglist.date_modified = datetime.now()
-                shoppinglist.save()
+        try:
+            list_id = int(list_id)
+        except ValueError:
+            return jsonify({
+                "status": "failure",
+                "message": "shopping list IDs must be integers"
+            }), 400
+
+        name = request.form.get("name")
+        notify_date = request.form.get("notify_date")
+
+        name = name.strip().lower() if name else ""
+        notify_date = notify_date.strip() if notify_date else ""
+
+        date_string = None
+        message = "'name' and 'notify_date' of the shoppinglist are required fields"
+        if name and notify_date:
+            date_string, message = parse_notify_date(notify_date)
+
+        if date_string is None:
+            # a missing list is reported before what's wrong with the form
+            shoppinglist, not_found, status, status_code = get_shoppinglist(
+                user_id, list_id)
+            if shoppinglist is None:
                 return jsonify({
-                    "status": "success",
-                    "data": {
-                        "id": shoppinglist.id,
-                        "name": shoppinglist.name,
-                        "date_modified": shoppinglist.date_modified,
-                        "notify_date": shoppinglist.notify_date
-                    },
-                    "message": "shoppinglist has been successfully edited!"
-                }), 200
+                    "status": status,
+                    "message": not_found
+                }), status_code
             return jsonify({
                 "status": "failure",
-                "message": "'name' and 'notify_date' of the shoppinglist are required fields"
+                "message": message
             }), 400
 
-        return jsonify({
-            "status": status,
-            "message": message
-        }), status_code
+        return ShoppingListByID.edit(
+            user_id, list_id, {"name": name, "notify_date": date_string})
+
+    @staticmethod
+    def patch(list_id):
+        """ Edits only the fields of a shoppinglist that are sent, with the
+        same single UPDATE as put"""
+        user_id, message, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        try:
+            list_id = int(list_id)
+        except ValueError:
+            return jsonify({
+                "status": "failure",
+                "message": "shopping list IDs must be integers"
+            }), 400
+
+        changes, message = get_list_changes(request.form)
+        if changes is None:
+            # a missing list is reported before what's wrong with the form
+            shoppinglist, not_found, status, status_code = get_shoppinglist(
+                user_id, list_id)
+            if shoppinglist is None:
+                return jsonify({
+                    "status": status,
+                    "message": not_found
+                }), status_code
+            return jsonify({
+                "status": "failure",
+                "message": message
+            }), 400
+
+        return ShoppingListByID.edit(user_id, list_id, changes)
+
+    @staticmethod
+    def edit(user_id, list_id, changes):
+        """
+        Applies <changes> to a shoppinglist of the user with a single
+        conditional UPDATE. When the client sends `If-Match`, the edit is
+        refused with 412 if the list was changed since the client read it.
+        """
+        versions = get_expected_versions(request)
+        try:
+            shoppinglist = update_if_unmodified(
+                ShoppingList,
+                [ShoppingList.id == list_id, ShoppingList.user_id == user_id,
+                 ShoppingList.deleted_at.is_(None)],
+                changes, versions)
+        except IntegrityError as error:
+            if not is_duplicate(error, 'uq_shoppinglists_user_id_name'):
+                raise
+            return jsonify({
+                "status": "failure",
+                "message": "a shopping list with name "
+                           f"'{changes['name']}' already exists"
+            }), 409
+
+        if shoppinglist is None:
+            # nothing was updated: find out why with a read
+            shoppinglist, message, status, status_code = get_shoppinglist(
+                user_id, list_id)
+            if shoppinglist is None:
+                return jsonify({
+                    "status": status,
+                    "message": message
+                }), status_code
+            if versions is not None and shoppinglist.version not in versions:
+                return with_etag(jsonify({
+                    "status": "failure",
+                    "message": "the shoppinglist has been changed since you "
+                               "last fetched it, please fetch it again"
+                }), shoppinglist.version), 412
+            return jsonify({
+                "status": "failure",
+                "message": "No changes were made to the list"
+            }), 200
+
+        publish_change(user_id, "updated", "shoppinglist",
+                       shoppinglist.id, shoppinglist.id)
+        return with_etag(jsonify({
+            "status": "success",
+            "data": {
+                "id": shoppinglist.id,
+                "name": shoppinglist.name,
+                "date_modified": shoppinglist.date_modified,
+                "notify_date": shoppinglist.notify_date.strftime("%Y-%m-%d")
+            },
+            "message": "shoppinglist has been successfully edited!"
+        }), shoppinglist.version), 200
 
 
 shopping_list_api = ShoppingListAPI.as_view("shopping_list_api")
@@ -270,4 +395,4 @@ list_blueprint.add_url_rule(
 list_blueprint.add_url_rule(
     "/shoppinglists/<list_id>",
     view_func=shopping_list_by_id,
-    methods=['GET', 'DELETE', 'PUT'])
+    methods=['GET', 'DELETE', 'PUT', 'PATCH'])
@@ -0,0 +1,169 @@
+from flask import Blueprint, request, jsonify
+from flask.views import MethodView
+from sqlalchemy import select, union_all, literal, and_, func, tuple_
+
+from app import db
+from app.models import ShoppingList, Item, Tombstone
+from app.endpoints import (
+    parse_auth_header, shoppinglist_as_dict, item_as_dict)
+from app.coalescing import refresh_bought_states
+
+sync = Blueprint("sync", __name__, url_prefix="/api/v1")
+
+
+def get_changes(user_id, after, limit):
+    """
+    Returns (kind, id, change_txid, change_seq) for every shoppinglist, item
+    and tombstone of the user that changed after the position <after>, a
+    (change_txid, change_seq) pair, oldest first, together with the ID of
+    the oldest transaction that may still be running.
+
+    A change is only returned once every transaction older than the one
+    that made it has ended: the change_seq of a change that commits late
+    can be lower than that of changes already handed out, but its
+    transaction is never older than the oldest one still running. The
+    three sources are scanned in a single statement, each through its
+    (owner, change_txid, change_seq) index.
+    """
+    running = db.session.execute(
+        select([func.txid_snapshot_xmin(func.txid_current_snapshot())])
+    ).scalar()
+
+    def changed(model):
+        return and_(
+            tuple_(model.change_txid, model.change_seq) > tuple_(*after),
+            model.change_txid < running)
+
+    lists = select([
+        literal("shoppinglist").label("kind"),
+        ShoppingList.id.label("id"),
+        ShoppingList.change_txid.label("change_txid"),
+        ShoppingList.change_seq.label("change_seq")]).where(and_(
+            ShoppingList.user_id == user_id, changed(ShoppingList)))
+
+    list_items = select([
+        literal("item").label("kind"),
+        Item.id.label("id"),
+        Item.change_txid.label("change_txid"),
+        Item.change_seq.label("change_seq")]).select_from(
+            Item.__table__.join(ShoppingList.__table__)).where(and_(
+                ShoppingList.user_id == user_id, changed(Item)))
+
+    tombstones = select([
+        (literal("deleted_") + Tombstone.object_type).label("kind"),
+        Tombstone.object_id.label("id"),
+        Tombstone.change_txid.label("change_txid"),
+        Tombstone.change_seq.label("change_seq")]).where(and_(
+            Tombstone.user_id == user_id, changed(Tombstone)))
+
+    changes = union_all(lists, list_items, tombstones).alias("changes")
+    query = select([changes]).order_by(
+        changes.c.change_txid, changes.c.change_seq).limit(limit)
+    return db.session.execute(query).fetchall(), running
+
+
+def parse_sync_token(token, shard):
+    """
+    Returns the (change_txid, change_seq) position of a sync token, or None
+    if it isn't one. Tokens are "<txid>.<seq>", prefixed with "<shard>." when
+    the lists are sharded, as transaction IDs are only comparable within a
+    database: the token of another shard, like the integer tokens handed
+    out before, starts the sync over.
+    """
+    parts = token.split('.')
+    if len(parts) == 1:
+        return (0, 0) if token.isdigit() else None
+    *token_shard, txid, seq = parts
+    if len(token_shard) > 1 or not (txid.isdigit() and seq.isdigit()):
+        return None
+    if token_shard != ([shard] if shard else []):
+        return 0, 0
+    return int(txid), int(seq)
+
+
+def make_sync_token(position, shard):
+    return '.'.join(([shard] if shard else []) + [str(n) for n in position])
+
+
+class SyncAPI(MethodView):
+    @staticmethod
+    def get():
+        """
+        Returns the shoppinglists and items that were created, edited or
+        deleted after the `since` token, together with a new token to use
+        on the next sync. Deleting a shoppinglist deletes its items too,
+        so only the list itself is reported under 'deleted'. Restoring it
+        from the trash reports it again, along with its items.
+        """
+        user_id, message, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        shard = db.session.info.get('shard')
+        since = parse_sync_token(request.args.get('since', '0'), shard)
+        if since is None:
+            return jsonify({
+                "status": "failure",
+                "message": "the sync token is invalid"
+            }), 400
+
+        limit = request.args.get('limit', 500, type=int)
+        if not limit or limit < 1 or limit > 500:  # pragma: no cover
+            limit = 500
+
+        refresh_bought_states(user_id)
+        changes, running = get_changes(user_id, since, limit)
+        changed_ids = {"shoppinglist": [], "item": [],
+                       "deleted_shoppinglist": [], "deleted_item": []}
+        for kind, object_id, _, _ in changes:
+            changed_ids[kind].append(object_id)
+        if len(changes) == limit:
+            position = changes[-1][2:]
+        else:
+            # everything of the transactions that ended has been handed out
+            position = max(since, (running, 0))
+
+        shoppinglists = []
+        if changed_ids["shoppinglist"]:
+            shoppinglists = ShoppingList.query.filter(
+                ShoppingList.id.in_(changed_ids["shoppinglist"])).order_by(
+                    ShoppingList.id).all()
+
+        list_items = []
+        if changed_ids["item"]:
+            # the items of a trashed list went with it
+            list_items = Item.query.join(ShoppingList).filter(
+                Item.id.in_(changed_ids["item"])).filter(
+                    ShoppingList.deleted_at.is_(None)).order_by(Item.id).all()
+
+        # trashing a list or an item is a change to it, reported as deleted
+        for shoppinglist in shoppinglists:
+            if shoppinglist.deleted_at is not None:
+                changed_ids["deleted_shoppinglist"].append(shoppinglist.id)
+        for item in list_items:
+            if item.deleted_at is not None:
+                changed_ids["deleted_item"].append(item.id)
+
+        return jsonify({
+            "status": "success",
+            "token": make_sync_token(position, shard),
+            "has_more": len(changes) == limit,
+            "lists": [shoppinglist_as_dict(shoppinglist)
+                      for shoppinglist in shoppinglists
+                      if shoppinglist.deleted_at is None],
+            "items": [dict(item_as_dict(item),
+                           shoppinglist_id=item.shoppinglist_id)
+                      for item in list_items if item.deleted_at is None],
+            "deleted": {
+                "lists": changed_ids["deleted_shoppinglist"],
+                "items": changed_ids["deleted_item"]
+            }
+        }), 200
+
+
+sync_api = SyncAPI.as_view("sync_api")
+
+sync.add_url_rule("/sync", view_func=sync_api, methods=['GET'])
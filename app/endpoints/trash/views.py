@@ -0,0 +1,158 @@
+from flask import Blueprint, request, jsonify
+from flask.views import MethodView
+from sqlalchemy.exc import IntegrityError
+
+from app.endpoints import (
+    parse_auth_header, shoppinglist_as_dict, item_as_dict, is_duplicate)
+from app.events import publish_change
+from app.trash import get_trash, restore_shoppinglist, restore_item
+
+trash = Blueprint("trash", __name__, url_prefix="/api/v1")
+
+
+def as_trashed(record, as_dict):
+    """ returns the dict of a trashed shoppinglist or item, with the time it
+    was moved to the trash"""
+    return dict(as_dict(record),
+                deleted_at=record.deleted_at.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+class TrashAPI(MethodView):
+    @staticmethod
+    def get():
+        """ Returns the shoppinglists and items that the user has deleted
+        and can still restore, most recently deleted first. A page, chosen
+        with `?page=` and `?limit=`, holds up to <limit> of each"""
+        user_id, message, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('limit', 20, type=int)
+        if not per_page or per_page < 1 or per_page > 20:
+            per_page = 20
+        if not page or page < 1:
+            page = 1
+
+        shoppinglists, list_items = get_trash(user_id, page, per_page)
+        next_page = None
+        if shoppinglists.has_next or list_items.has_next:
+            next_page = "/api/v1/trash?page={0}{1}".format(
+                page + 1, '' if per_page == 20 else f'&limit={per_page}')
+
+        previous_page = None
+        if page > 1:
+            previous_page = "/api/v1/trash?page={0}{1}".format(
+                page - 1, '' if per_page == 20 else f'&limit={per_page}')
+
+        return jsonify({
+            "status": "success",
+            "lists": [as_trashed(shoppinglist, shoppinglist_as_dict)
+                      for shoppinglist in shoppinglists.items],
+            "items": [dict(as_trashed(item, item_as_dict),
+                           shoppinglist_id=item.shoppinglist_id)
+                      for item in list_items.items],
+            "next_page": next_page,
+            "previous_page": previous_page
+        }), 200
+
+
+class RestoreShoppingList(MethodView):
+    @staticmethod
+    def post(list_id):
+        """ Takes a shoppinglist, with its items, out of the trash"""
+        user_id, message, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        try:
+            list_id = int(list_id)
+        except ValueError:
+            return jsonify({
+                "status": "failure",
+                "message": "shopping list IDs must be integers"
+            }), 400
+
+        try:
+            restored = restore_shoppinglist(user_id, list_id)
+        except IntegrityError as error:
+            if not is_duplicate(error, 'uq_shoppinglists_user_id_name'):
+                raise
+            return jsonify({
+                "status": "failure",
+                "message": "a shopping list with the same name already "
+                           "exists, rename it before restoring this one"
+            }), 409
+
+        if not restored:
+            return jsonify({
+                "status": "failure",
+                "message": "shopping list with that ID isn't in the trash"
+            }), 404
+
+        publish_change(user_id, "created", "shoppinglist", list_id, list_id)
+        return jsonify({
+            "status": "success",
+            "message": f"shopping list with ID {list_id} restored successfully"
+        }), 200
+
+
+class RestoreItem(MethodView):
+    @staticmethod
+    def post(list_id, item_id):
+        """ Takes an item of a shoppinglist out of the trash"""
+        user_id, message, status, status_code, _ = parse_auth_header(request)
+        if user_id is None:
+            return jsonify({
+                "status": status,
+                "message": message
+            }), status_code
+
+        try:
+            list_id, item_id = int(list_id), int(item_id)
+        except ValueError:
+            return jsonify({
+                "status": "failure",
+                "message": "shopping list and item IDs must be integers"
+            }), 400
+
+        try:
+            restored = restore_item(user_id, list_id, item_id)
+        except IntegrityError as error:
+            if not is_duplicate(error, 'uq_items_shoppinglist_id_name'):
+                raise
+            return jsonify({
+                "status": "failure",
+                "message": "an item with the same name already exists in "
+                           "the shopping list, rename it before restoring "
+                           "this one"
+            }), 409
+
+        if not restored:
+            return jsonify({
+                "status": "failure",
+                "message": "item with that ID isn't in the trash"
+            }), 404
+
+        publish_change(user_id, "created", "item", item_id, list_id)
+        return jsonify({
+            "status": "success",
+            "message": f"item with ID {item_id} restored successfully"
+        }), 200
+
+
+trash_api = TrashAPI.as_view("trash_api")
+restore_list_api = RestoreShoppingList.as_view("restore_list_api")
+restore_item_api = RestoreItem.as_view("restore_item_api")
+
+trash.add_url_rule("/trash", view_func=trash_api, methods=['GET'])
+trash.add_url_rule("/trash/shoppinglists/<list_id>/restore",
+                   view_func=restore_list_api, methods=['POST'])
+trash.add_url_rule("/trash/shoppinglists/<list_id>/items/<item_id>/restore",
+                   view_func=restore_item_api, methods=['POST'])
@@ -0,0 +1,188 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from flask import current_app
+from sqlalchemy import event, text
+
+from app import db
+from app.routing import RoutingSession
+
+
+class LocalBroker:
+    """
+    LocalBroker fans change events out to the event streams that are
+    open in this process. Every stream gets its own bounded queue so that
+    a slow client drops events instead of holding up the publisher.
+    """
+
+    def __init__(self, max_queued_events=100):
+        self.max_queued_events = max_queued_events
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = queue.Queue(maxsize=self.max_queued_events)
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscribers.pop(user_id, None)
+
+    def publish(self, user_id, event):
+        self.publish_all([(user_id, event)])
+
+    def publish_all(self, events):
+        """ publishes the (user_id, event) pairs of <events>, in order"""
+        for user_id, change in events:
+            self.dispatch(user_id, change)
+
+    def dispatch(self, user_id, event):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:  # pragma: no cover
+                pass
+
+
+class PostgresBroker(LocalBroker):
+    """
+    PostgresBroker publishes events with Postgres NOTIFY so that they
+    reach the streams held by every worker process. Each process LISTENs
+    on one dedicated connection from a background thread, started with
+    the first stream, and hands the notifications to its local streams.
+    A lost connection is opened again, after a delay that doubles from
+    <reconnect_delay> up to <max_reconnect_delay> seconds while it keeps
+    failing; the events published in the meantime are missed.
+    """
+
+    def __init__(self, database_url, channel, max_queued_events=100,
+                 reconnect_delay=0.5, max_reconnect_delay=30, logger=None):
+        super().__init__(max_queued_events)
+        self.database_url = database_url
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.logger = logger or logging.getLogger(__name__)
+        self.listener = None
+        self.listening = threading.Event()
+
+    def subscribe(self, user_id):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen,
+                                                 daemon=True)
+                self.listener.start()
+        return super().subscribe(user_id)
+
+    def publish_all(self, events):
+        """ sends a NOTIFY for each of <events>, all with a single statement
+        so that a transaction's changes cost a single round trip"""
+        payloads = [json.dumps(dict(change, user_id=user_id))
+                    for user_id, change in events]
+        db.engine.execute(
+            text("SELECT pg_notify(:channel, payload) "
+                 "FROM unnest(CAST(:payloads AS text[])) AS payload"
+                 ).execution_options(autocommit=True),
+            channel=self.channel, payloads=payloads)
+
+    def listen(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                connection = psycopg2.connect(self.database_url)
+                try:
+                    connection.set_isolation_level(
+                        psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                    connection.cursor().execute(f'LISTEN "{self.channel}"')
+                    self.listening.set()
+                    delay = self.reconnect_delay
+                    self.receive(connection)
+                finally:
+                    connection.close()
+            except Exception:
+                self.listening.clear()
+                self.logger.exception(
+                    f"listening on {self.channel} failed, trying again in "
+                    f"{delay} seconds")
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def receive(self, connection):
+        """ dispatches the notifications of <connection> until it fails """
+        while True:
+            if select.select([connection], [], [], 60) == ([], [], []):
+                # a connection dropped without a word only fails when used
+                connection.cursor().execute("SELECT 1")
+                continue
+            connection.poll()
+            while connection.notifies:
+                event = json.loads(connection.notifies.pop(0).payload)
+                self.dispatch(event.pop("user_id"), event)
+
+
+def init_app(app):
+    if app.config['EVENT_BROKER'] == 'postgres':
+        broker = PostgresBroker(app.config['SQLALCHEMY_DATABASE_URI'],
+                                app.config['EVENT_CHANNEL'],
+                                logger=app.logger)
+    else:
+        broker = LocalBroker()
+    app.extensions['events'] = broker
+
+
+def get_broker():
+    return current_app.extensions['events']
+
+
+def publish_change(user_id, action, object_type, object_id, list_id):
+    """ tells the user's open event streams that one of their shoppinglists
+    or items has been 'created', 'updated' or 'deleted'. The event is held
+    back until the change is committed, and dropped if it is rolled back"""
+    db.session.info.setdefault('changes', []).append((user_id, {
+        "action": action,
+        "type": object_type,
+        "id": object_id,
+        "shoppinglist_id": list_id
+    }))
+
+
+def publish_import(user_id, list_ids):
+    """ tells the user's open event streams, with a single event, that an
+    import added to the shoppinglists <list_ids>, for them to be read
+    again, instead of with an event per new list and item"""
+    db.session.info.setdefault('changes', []).append((user_id, {
+        "action": "imported",
+        "type": "shoppinglist",
+        "id": None,
+        "shoppinglist_id": None,
+        "shoppinglists": list_ids
+    }))
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def publish_committed_changes(session):
+    broker = session.app.extensions['events']
+    audit_log = session.app.extensions['audit']
+    changes = session.info.pop('changes', [])
+    if not changes:
+        return
+    broker.publish_all(changes)
+    for user_id, change in changes:
+        audit_log.record(user_id, change)
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def drop_rolled_back_changes(session, _):
+    session.info.pop('changes', None)
@@ -0,0 +1,140 @@
+import functools
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify, request
+from sqlalchemy import and_, or_, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models import IdempotencyKey
+from app.endpoints import parse_auth_header
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def get_fingerprint():
+    """ identifies a request by its method, URL and form, so that a key
+    that is reused for a different request can be told apart from a retry"""
+    form = sorted(request.form.items(multi=True))
+    request_summary = json.dumps([request.method, request.full_path, form])
+    return hashlib.sha256(request_summary.encode()).hexdigest()
+
+
+def expiry_cutoff():
+    return datetime.now() - timedelta(
+        seconds=current_app.config['IDEMPOTENCY_KEY_TTL_SECONDS'])
+
+
+def abandonment_cutoff():
+    return datetime.now() - timedelta(
+        seconds=current_app.config['IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS'])
+
+
+def claim(user_id, key, fingerprint):
+    """
+    Records that the request with <key> is running, and returns whether
+    this request is the one that got to run it. The unique (user_id, key)
+    constraint decides between concurrent duplicates, so no lock is taken.
+    Keys older than IDEMPOTENCY_KEY_TTL_SECONDS are claimed afresh, and
+    so are those whose request has run for longer than
+    IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS without a response, as it must have
+    crashed or timed out.
+    """
+    table = IdempotencyKey.__table__
+    db.session.execute(table.delete().where(and_(
+        table.c.user_id == user_id, table.c.key == key,
+        or_(table.c.date_created < expiry_cutoff(),
+            and_(table.c.status_code.is_(None),
+                 table.c.date_created < abandonment_cutoff())))))
+    claimed = db.session.execute(insert(table).values(
+        user_id=user_id, key=key, fingerprint=fingerprint,
+        date_created=datetime.now()).on_conflict_do_nothing(
+            index_elements=['user_id', 'key']).returning(table.c.id)).first()
+    db.session.commit()
+    return claimed is not None
+
+
+def delete_expired_keys():
+    """ deletes the keys that are past IDEMPOTENCY_KEY_TTL_SECONDS and
+    returns how many there were"""
+    table = IdempotencyKey.__table__
+    deleted = db.session.execute(table.delete().where(
+        table.c.date_created < expiry_cutoff())).rowcount
+    db.session.commit()
+    return deleted
+
+
+def replay(user_id, key, fingerprint):
+    table = IdempotencyKey.__table__
+    stored = db.session.execute(select([table]).where(and_(
+        table.c.user_id == user_id, table.c.key == key))).first()
+    if stored is None or stored.fingerprint != fingerprint:
+        return jsonify({
+            "status": "failure",
+            "message": "this Idempotency-Key has already been used "
+                       "for a different request"
+        }), 422
+    if stored.status_code is None:
+        return jsonify({
+            "status": "failure",
+            "message": "a request with this Idempotency-Key is still "
+                       "being processed, please retry in a moment"
+        }), 409
+    response = current_app.response_class(
+        stored.body, status=stored.status_code, mimetype='application/json')
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def record(user_id, key, response):
+    """ stores the response for the retries to be given, committing it
+    with the changes of a successful view. A server error isn't stored, and
+    frees the key for the retry to run the view again"""
+    table = IdempotencyKey.__table__
+    matches = and_(table.c.user_id == user_id, table.c.key == key)
+    if response.status_code >= 400:
+        db.session.rollback()  # what the view staged isn't kept
+    if response.status_code >= 500:
+        db.session.execute(table.delete().where(matches))
+    else:
+        db.session.execute(table.update().where(matches).values(
+            status_code=response.status_code,
+            body=response.get_data(as_text=True)))
+    db.session.commit()
+
+
+def idempotent(view):
+    """
+    Makes a POST view safe to retry. The first response to a request with
+    an `Idempotency-Key` header is stored for the user, and returned to
+    every retry with the same key without running the view again.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if key is None:
+            return view(*args, **kwargs)
+        user_id = parse_auth_header(request)[0]
+        if user_id is None:
+            return view(*args, **kwargs)  # which reports the auth failure
+        if not key or len(key) > 255:
+            return jsonify({
+                "status": "failure",
+                "message": "an Idempotency-Key must have 1 to 255 characters"
+            }), 400
+
+        fingerprint = get_fingerprint()
+        if not claim(user_id, key, fingerprint):
+            return replay(user_id, key, fingerprint)
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            record(user_id, key, current_app.response_class(status=500))
+            raise
+        record(user_id, key, response)
+        return response
+    return wrapper
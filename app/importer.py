@@ -0,0 +1,293 @@
+import csv
+import io
+import json
+import re
+from collections import namedtuple, OrderedDict
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.events import publish_import
+from app.models import ShoppingList, Item
+
+# a shoppinglist, or one of its items, read from line <line> of an import
+ImportRow = namedtuple('ImportRow', ['line', 'list_name', 'notify_date',
+                                     'item'])
+
+CSV_FIELDS = ('list_name', 'notify_date', 'item_name', 'price', 'quantity',
+              'has_been_bought')
+
+
+class ImportReport:
+    """ImportReport counts what an import wrote and keeps the first
+    <max_errors> rejected rows, so that a file full of bad rows can't
+    use up the memory either"""
+
+    def __init__(self, max_errors=100):
+        self.max_errors = max_errors
+        self.lists_created = 0
+        self.items_created = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "message": message})
+
+    def as_dict(self):
+        return {
+            "lists_created": self.lists_created,
+            "items_created": self.items_created,
+            "rejected": self.rejected,
+            "errors": self.errors
+        }
+
+
+def decode_lines(binary_file):
+    """ lazily decodes the lines of an uploaded file as UTF-8, dropping
+    the byte order mark that spreadsheet programs like to add"""
+    for number, line in enumerate(binary_file):
+        line = line.decode('utf-8', errors='replace')
+        yield line.lstrip('\ufeff') if number == 0 else line
+
+
+def is_true(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().title() == "True"
+
+
+def read_ndjson(lines):
+    """ yields (line, record, error) for every shoppinglist of an NDJSON
+    file in the format written by the export"""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            shoppinglist = json.loads(line)
+        except ValueError:
+            yield line_number, None, "the line is not valid JSON"
+            continue
+        if not isinstance(shoppinglist, dict) or \
+                not isinstance(shoppinglist.get("items", []), list):
+            yield line_number, None, \
+                "every line must be a shoppinglist with a list of 'items'"
+            continue
+
+        yield line_number, {"list_name": shoppinglist.get("name"),
+                            "notify_date": shoppinglist.get("notify_date")}, None
+        for item in shoppinglist.get("items", []):
+            if not isinstance(item, dict):
+                yield line_number, None, "every item must be an object"
+                continue
+            yield line_number, {
+                "list_name": shoppinglist.get("name"),
+                "notify_date": shoppinglist.get("notify_date"),
+                "item_name": item.get("name"),
+                "price": item.get("price"),
+                "quantity": item.get("quantity"),
+                "has_been_bought": item.get("has_been_bought", False)
+            }, None
+
+
+def read_csv(lines):
+    """ yields (line, record, error) for every row of a CSV file with a
+    header of CSV_FIELDS. A row without an 'item_name' adds an empty list"""
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None or \
+            not {'list_name', 'notify_date'} <= set(reader.fieldnames):
+        yield 1, None, "the header must name the columns: " + \
+            ", ".join(CSV_FIELDS)
+        return
+    for record in reader:
+        yield reader.line_num, record, None
+
+
+def parse_date(date_string):
+    """ returns (date, None) if <date_string> is a `yyyy-mm-dd` date that
+    exists on the calendar, or (None, error). Unlike the notify date of a
+    new list, it may have passed: the lists of a backup are restored as
+    they were"""
+    if not re.fullmatch(r"\d{4}-\d{1,2}-\d{1,2}", date_string):
+        return None, "the acceptable date format is `yyyy-mm-dd`"
+    try:
+        date = datetime.strptime(date_string, "%Y-%m-%d")
+    except ValueError:
+        return None, "The given date is invalid and doesn't " \
+            "exist on the calendar"
+    return date.strftime("%Y-%m-%d"), None
+
+
+def validate(line, record):
+    """ cleans up a record the way the shoppinglist and item views clean
+    their form fields, returning (ImportRow, None) or (None, error)"""
+    list_name = str(record.get("list_name") or "").strip().lower()
+    notify_date = str(record.get("notify_date") or "").strip()
+    if not list_name or not notify_date:
+        return None, "'name' and 'notify_date' of the shoppinglist " \
+            "are required fields"
+
+    date_string, message = parse_date(notify_date)
+    if date_string is None:
+        return None, message
+
+    item_name = str(record.get("item_name") or "").strip().lower()
+    if not item_name:
+        return ImportRow(line, list_name, date_string, None), None
+
+    price = str(record.get("price") or "").strip()
+    quantity = str(record.get("quantity") or "").strip()
+    if not price or not quantity:
+        return None, "'name', 'price' and 'quantity' of an item must be" \
+            " specified whereas 'status' is optional"
+    return ImportRow(line, list_name, date_string, {
+        "name": item_name,
+        "price": price,
+        "quantity": quantity,
+        "has_been_bought": is_true(record.get("has_been_bought") or False)
+    }), None
+
+
+def insert_lists(user_id, new_lists):
+    """ inserts the shoppinglists in <new_lists>, a mapping of name to
+    notify date, with one multi-row INSERT and returns their IDs by name.
+    A list that was created meanwhile, by another request, is left out"""
+    table = ShoppingList.__table__
+    result = db.session.execute(insert(table).values([
+        {"user_id": user_id, "name": name, "notify_date": notify_date}
+        for name, notify_date in new_lists.items()
+    ]).on_conflict_do_nothing().returning(table.c.id, table.c.name))
+    return {name: list_id for list_id, name in result}
+
+
+ITEM_COLUMNS = ('shoppinglist_id', 'name', 'price', 'quantity',
+                'has_been_bought')
+
+
+def insert_items(items):
+    """
+    Writes <items> with a single COPY, which is several times faster than
+    even a multi-row INSERT for large batches, into a temporary table that
+    empties on commit. They are then moved into the items with one
+    INSERT ... ON CONFLICT DO NOTHING, which leaves out the items that
+    already exist, and the (shoppinglist_id, name) and ID of those that
+    were written are returned.
+    """
+    connection = db.session.connection(Item.__mapper__)
+    connection.execute(
+        "CREATE TEMPORARY TABLE IF NOT EXISTS imported_items ("
+        " line serial, shoppinglist_id integer, name varchar,"
+        " price varchar, quantity varchar, has_been_bought boolean"
+        ") ON COMMIT DELETE ROWS")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for item in items:
+        writer.writerow([item[column] for column in ITEM_COLUMNS])
+    buffer.seek(0)
+    connection.connection.cursor().copy_expert(
+        f"COPY imported_items ({', '.join(ITEM_COLUMNS)}) "
+        f"FROM STDIN WITH (FORMAT csv)", buffer)
+
+    columns = ', '.join(ITEM_COLUMNS)
+    result = db.session.execute(text(
+        f"INSERT INTO items ({columns}) "
+        f"SELECT {columns} FROM imported_items ORDER BY line "
+        f"ON CONFLICT DO NOTHING "
+        f"RETURNING shoppinglist_id, name, id"), mapper=Item.__mapper__)
+    return {(list_id, name): item_id for list_id, name, item_id in result}
+
+
+def write_chunk(user_id, rows, report):
+    """
+    Writes a chunk of validated rows with one query for the lists that
+    already exist, one INSERT for the new lists and one COPY and INSERT for
+    the items, then commits. The database refuses the lists and items that
+    exist already, even those created meanwhile by another request, which
+    are added to and reported as rejected rows respectively. The event
+    streams and the audit log hear of the chunk with a single event.
+    """
+    list_names = {row.list_name for row in rows}
+    existing_lists = db.session.query(
+        ShoppingList.name, ShoppingList.id).filter(
+            ShoppingList.user_id == user_id).filter(
+                ShoppingList.name.in_(list_names)).filter(
+                    ShoppingList.deleted_at.is_(None))
+    list_ids = dict(existing_lists)
+
+    new_lists = OrderedDict()
+    for row in rows:
+        if row.list_name not in list_ids:
+            new_lists.setdefault(row.list_name, row.notify_date)
+    if new_lists:
+        created_lists = insert_lists(user_id, new_lists)
+        report.lists_created += len(created_lists)
+        list_ids.update(created_lists)
+        if len(created_lists) < len(new_lists):
+            list_ids.update(existing_lists)  # created by another request
+    changed_lists = set(list_ids[name] for name in new_lists
+                        if name in list_ids)
+
+    new_items, lines = [], {}
+    for row in rows:
+        if row.item is None:
+            continue
+        if row.list_name not in list_ids:  # pragma: no cover
+            report.reject(row.line, f"'{row.list_name}' could not be "
+                          f"created, please try again")
+            continue
+        key = (list_ids[row.list_name], row.item["name"])
+        if key in lines:
+            report.reject(row.line, f"an item with name '{row.item['name']}' "
+                          f"already exists in '{row.list_name}'")
+            continue
+        lines[key] = row
+        new_items.append(dict(row.item, shoppinglist_id=key[0]))
+    if new_items:
+        created_items = insert_items(new_items)
+        report.items_created += len(created_items)
+        for key, row in lines.items():
+            if key in created_items:
+                changed_lists.add(key[0])
+            else:
+                report.reject(
+                    row.line, f"an item with name '{row.item['name']}' "
+                    f"already exists in '{row.list_name}'")
+
+    if changed_lists:
+        publish_import(user_id, sorted(changed_lists))
+    db.session.commit()
+
+
+def import_shoppinglists(user_id, binary_file, file_format, chunk_size=500,
+                         max_errors=100):
+    """
+    Imports the shoppinglists and items in <binary_file>, a 'csv' or
+    'ndjson' file, into the account of <user_id> and returns an
+    ImportReport. The file is read a line at a time and written
+    <chunk_size> rows at a time, each chunk in its own transaction, so
+    memory stays bounded whatever the size of the file. Lists that the
+    user already has are added to rather than duplicated.
+    """
+    reader = read_csv if file_format == 'csv' else read_ndjson
+    report = ImportReport(max_errors)
+    rows = []
+    last_error = None
+    for line, record, error in reader(decode_lines(binary_file)):
+        if error is None:
+            row, error = validate(line, record)
+        if error is not None:
+            if (line, error) != last_error:  # once per line, not per item
+                report.reject(line, error)
+            last_error = (line, error)
+            continue
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            write_chunk(user_id, rows, report)
+            rows = []
+    if rows:
+        write_chunk(user_id, rows, report)
+    return report
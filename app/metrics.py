@@ -0,0 +1,147 @@
+import os
+import time
+
+from flask import has_request_context, request
+from prometheus_client import (
+    Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LOGIN_LOCKOUTS = Counter(
+    'login_lockouts_total',
+    'Number of times repeated login failures locked out an account or an IP',
+    ['scope'])
+
+LOGIN_ATTEMPTS_BLOCKED = Counter(
+    'login_attempts_blocked_total',
+    'Login attempts refused without checking the password during a lockout',
+    ['scope'])
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Time taken to answer a request, commit included',
+    ['blueprint', 'method'])
+
+REQUESTS = Counter(
+    'http_requests_total',
+    'Number of requests answered, by status code',
+    ['blueprint', 'method', 'status'])
+
+DB_STATEMENTS_PER_REQUEST = Histogram(
+    'db_statements_per_request',
+    'Number of SQL statements executed while answering a request',
+    ['blueprint'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+
+DB_DURATION_PER_REQUEST = Histogram(
+    'db_duration_per_request_seconds',
+    'Time spent executing SQL statements while answering a request',
+    ['blueprint'])
+
+BCRYPT_DURATION = Histogram(
+    'bcrypt_duration_seconds',
+    'Time taken to hash a password or to check one against its hash',
+    ['operation'], buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5))
+
+# other methods are counted together, for clients not to make up labels
+METHODS = ('GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+REQUEST_METRICS = 'shoppinglist.metrics'
+
+# the labelled metrics of every (blueprint, method, status) seen so far, as
+# looking them up by their labels costs more than recording the request
+request_metrics_by_labels = {}
+
+
+def get_request_metrics(blueprint, method, status):
+    labels = (blueprint, method, status)
+    children = request_metrics_by_labels.get(labels)
+    if children is None:
+        children = request_metrics_by_labels[labels] = (
+            REQUEST_DURATION.labels(blueprint, method),
+            REQUESTS.labels(blueprint, method, status),
+            DB_STATEMENTS_PER_REQUEST.labels(blueprint),
+            DB_DURATION_PER_REQUEST.labels(blueprint))
+    return children
+
+
+class RequestMetrics:
+    """ what is measured while a request is handled, recorded when it has
+    been answered"""
+    __slots__ = ('started', 'statements', 'db_duration')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_duration = 0.0
+
+    def record(self, status_code):
+        duration, requests, statements, db_duration = get_request_metrics(
+            request.blueprint or '',
+            request.method if request.method in METHODS else 'other',
+            str(status_code))
+        duration.observe(time.perf_counter() - self.started)
+        requests.inc()
+        statements.observe(self.statements)
+        db_duration.observe(self.db_duration)
+
+
+def current_request_metrics():
+    if has_request_context():
+        return request.environ.get(REQUEST_METRICS)
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context,
+                          executemany):
+    context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    metrics = current_request_metrics()
+    if metrics is not None:
+        metrics.statements += 1
+        metrics.db_duration += time.perf_counter() - context._metrics_started
+
+
+def get_registry():
+    """ returns the registry to expose: the metrics of this process, or
+    those of every gunicorn worker when prometheus_multiproc_dir is set"""
+    if 'prometheus_multiproc_dir' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics():
+    return generate_latest(get_registry())
+
+
+def init_app(app):
+    """
+    Measures every request, from before the first hook to after the last,
+    which commits the request, so init_app is called before the other
+    extensions register theirs.
+    """
+
+    @app.before_request
+    def start_request_metrics():
+        request.environ[REQUEST_METRICS] = RequestMetrics()
+
+    @app.after_request
+    def record_request_metrics(response):
+        metrics = request.environ.pop(REQUEST_METRICS, None)
+        if metrics is not None:
+            metrics.record(response.status_code)
+        return response
+
+    @app.teardown_request
+    def record_failed_request_metrics(error):
+        # the request raised, so it wasn't recorded after it was answered
+        metrics = request.environ.pop(REQUEST_METRICS, None)
+        if metrics is not None and error is not None:
+            metrics.record(500)
@@ -2,12 +2,25 @@ from datetime import datetime, timedelta
 
 import psycopg2
 import jwt
-from sqlalchemy import (Column, Integer, String,
-                        DateTime, Date, ForeignKey, Boolean)
+from sqlalchemy import (Column, Integer, BigInteger, String, Text, DateTime,
+                        Date, ForeignKey, Boolean, Index, Sequence,
+                        UniqueConstraint, literal_column, exists, func,
+                        text)
 from flask import current_app
 from flask_bcrypt import Bcrypt
 
 from app import db
+from app.metrics import BCRYPT_DURATION
+from app.unit_of_work import in_unit_of_work
+
+
+# every insert or update of a shoppinglist or an item, and every deletion
+# recorded as a Tombstone, takes the next value of this sequence, and is
+# stamped with the ID of the transaction that wrote it (change_txid). The
+# values are taken before the transaction commits, so they don't say in
+# which order the changes became visible; syncing only hands out the changes
+# of transactions older than any that is still running, see app.endpoints.sync
+change_sequence = Sequence('change_sequence', metadata=db.Model.metadata)
 
 
 class BaseModel:
@@ -15,23 +28,30 @@ class BaseModel:
     BaseModel is an abstract class consisting of methods
     that are common amongst all the models. """
 
-    def save(self):
+    def save(self, commit=False):
+        """ save stages an instance of a model to be inserted or updated.
+        The change is committed at the end of the request, or right away
+        with <commit>=True or when there is no request being handled"""
         has_been_saved = False
         try:
             db.session.add(self)
-            db.session.commit()
+            db.session.flush()  # so that the instance has its ID
+            if commit or not in_unit_of_work():
+                db.session.commit()
             has_been_saved = True
         except (RuntimeError, psycopg2.Error):  # pragma: no cover
             db.session.rollback()
         return has_been_saved
 
-    def delete(self):
+    def delete(self, commit=False):
         """ delete is a utility method that deletes an instance of
-        a model from a database"""
+        a model from a database, committed like the changes of save"""
         is_deleted = False
         try:
             db.session.delete(self)
-            db.session.commit()
+            db.session.flush()
+            if commit or not in_unit_of_work():
+                db.session.commit()
             is_deleted = True
         except (RuntimeError, psycopg2.Error):  # pragma: no cover
             db.session.rollback()
@@ -45,17 +65,33 @@ class User(db.Model, BaseModel):
     id = Column(Integer, primary_key=True, autoincrement=True)
     email = Column(String, unique=True, nullable=False)
     password = Column(String, nullable=False)
-    date_added = Column(DateTime, default=datetime.now())
+    date_added = Column(DateTime, server_default=func.now())
+    # set when the user deletes their account, until it has been purged
+    disabled_at = Column(DateTime)
+    # the database deletes the lists of a deleted user, and their items,
+    # without them being loaded first
     shoppinglists = db.relationship(
         'ShoppingList', order_by='ShoppingList.id',
-        cascade='all, delete-orphan')
+        cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        # emails differing only in case belong to the same person
+        Index('uq_users_lower_email', func.lower(email), unique=True),
+        # tokens are checked against the primary, like the blacklist, so
+        # that a new user or a deleted account is never missed on a replica
+        {'info': {'primary_only': True}},
+    )
+    __mapper_args__ = {'eager_defaults': True}
 
     def __init__(self, email, pwd):
         self.email = email
-        self.password = Bcrypt().generate_password_hash(pwd).decode('utf-8')
+        with BCRYPT_DURATION.labels('hash').time():
+            self.password = Bcrypt().generate_password_hash(pwd).decode(
+                'utf-8')
 
     def validate_password(self, password):
-        return Bcrypt().check_password_hash(self.password, password)
+        with BCRYPT_DURATION.labels('check').time():
+            return Bcrypt().check_password_hash(self.password, password)
 
     @staticmethod
     def generate_token(user_id):
@@ -75,12 +111,19 @@ class User(db.Model, BaseModel):
     @staticmethod
     def verify_token(token):
         try:
-            if BlacklistToken.is_blacklisted(token):
-                return None, "token has already expired: please re-login"
             payload = jwt.decode(
                 token,
                 key=current_app.config['SECRET_KEY'],
                 algorithms=['HS256', 'HS512'])
+            # whether the token was logged out and whether the user still
+            # has an account, in one round trip to the primary
+            account = db.session.query(User.disabled_at, exists().where(
+                BlacklistToken.token == str(token)).label(
+                    'blacklisted')).filter(User.id == payload['sub']).first()
+            if account is not None and account.blacklisted:
+                return None, "token has already expired: please re-login"
+            if account is None or account.disabled_at is not None:
+                return None, "this account has been deleted"
             return payload['sub'], None
 
         except jwt.DecodeError:
@@ -95,6 +138,10 @@ class BlacklistToken(db.Model, BaseModel):
     token that have expired and therefore ceased from being used"""
 
     __tablename__ = 'blacklisted_tokens'
+    # a token that was just logged out must not be honoured by a lagging
+    # replica, so the blacklist is always read from the primary
+    __table_args__ = {'info': {'primary_only': True}}
+
     id = Column(Integer, primary_key=True)
     token = Column(String, unique=True, nullable=False)
     # token is unique such that once a token has been
@@ -115,15 +162,44 @@ class ShoppingList(db.Model, BaseModel):
     __tablename__ = "shoppinglists"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey(User.id))
+    user_id = Column(Integer, ForeignKey(User.id, ondelete='CASCADE'))
 
     name = Column(String, nullable=False)
     notify_date = Column(Date, nullable=False)
     items = db.relationship('Item', order_by="Item.id",
-                            cascade="all, delete-orphan")
+                            cascade="all, delete-orphan", passive_deletes=True)
 
-    date_created = Column(DateTime, default=datetime.now())
-    date_modified = Column(DateTime, default=datetime.now())
+    date_created = Column(DateTime, server_default=func.now())
+    date_modified = Column(DateTime, server_default=func.now(),
+                           onupdate=func.now())
+    change_seq = Column(BigInteger, nullable=False,
+                        server_default=change_sequence.next_value(),
+                        onupdate=change_sequence.next_value())
+    change_txid = Column(BigInteger, nullable=False,
+                         server_default=func.txid_current(),
+                         onupdate=func.txid_current())
+    # bumped by every update, and sent to clients as the ETag of the list
+    version = Column(Integer, nullable=False, server_default='1',
+                     onupdate=literal_column('shoppinglists.version') + 1)
+    # set while the list is in the trash, from which it can be restored
+    deleted_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_shoppinglists_user_id_change_txid',
+              'user_id', 'change_txid', 'change_seq'),
+        Index('ix_shoppinglists_notify_date_user_id',
+              'notify_date', 'user_id', 'id'),
+        # only the lists that aren't in the trash are indexed by owner,
+        # and a trashed list doesn't hold on to its name
+        Index('uq_shoppinglists_user_id_name', 'user_id', 'name',
+              unique=True, postgresql_where=text('deleted_at IS NULL')),
+        Index('ix_shoppinglists_deleted_at', 'deleted_at',
+              postgresql_where=text('deleted_at IS NOT NULL')),
+        {'info': {'sharded': True}},
+    )
+    # the columns filled in by the database come back with the INSERT or
+    # UPDATE that wrote the row, instead of with a SELECT when read
+    __mapper_args__ = {'eager_defaults': True}
 
     def __init__(self, user_id, name, notify_date):
         self.user_id = user_id
@@ -136,14 +212,38 @@ class Item(db.Model, BaseModel):
 
     __tablename__ = 'items'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    shoppinglist_id = Column(Integer, ForeignKey(ShoppingList.id))
+    shoppinglist_id = Column(Integer, ForeignKey(ShoppingList.id,
+                                                 ondelete='CASCADE'))
     name = Column(String)
     price = Column(String)
     quantity = Column(String)
     has_been_bought = Column(Boolean, default=False)
 
-    date_added = Column(DateTime, default=datetime.now())
-    date_modified = Column(DateTime, default=datetime.now())
+    date_added = Column(DateTime, server_default=func.now())
+    date_modified = Column(DateTime, server_default=func.now(),
+                           onupdate=func.now())
+    change_seq = Column(BigInteger, nullable=False,
+                        server_default=change_sequence.next_value(),
+                        onupdate=change_sequence.next_value())
+    change_txid = Column(BigInteger, nullable=False,
+                         server_default=func.txid_current(),
+                         onupdate=func.txid_current())
+    # bumped by every update, and sent to clients as the ETag of the item
+    version = Column(Integer, nullable=False, server_default='1',
+                     onupdate=literal_column('items.version') + 1)
+    # set while the item is in the trash, from which it can be restored
+    deleted_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_items_shoppinglist_id_change_txid',
+              'shoppinglist_id', 'change_txid', 'change_seq'),
+        Index('uq_items_shoppinglist_id_name', 'shoppinglist_id', 'name',
+              unique=True, postgresql_where=text('deleted_at IS NULL')),
+        Index('ix_items_deleted_at', 'deleted_at',
+              postgresql_where=text('deleted_at IS NOT NULL')),
+        {'info': {'sharded': True}},
+    )
+    __mapper_args__ = {'eager_defaults': True}
 
     def __init__(self, list_id, name, quantity, price, status=False):
         self.name = name
@@ -151,3 +251,159 @@ class Item(db.Model, BaseModel):
         self.quantity = quantity
         self.shoppinglist_id = list_id
         self.has_been_bought = status
+
+
+class Tombstone(db.Model, BaseModel):
+    """Tombstone remembers a deleted shoppinglist or item so that
+    clients syncing their changes can find out about the deletion"""
+
+    __tablename__ = 'tombstones'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, nullable=False)
+    object_type = Column(String, nullable=False)  # 'shoppinglist' or 'item'
+    object_id = Column(Integer, nullable=False)
+    change_seq = Column(BigInteger, nullable=False,
+                        server_default=change_sequence.next_value())
+    change_txid = Column(BigInteger, nullable=False,
+                         server_default=func.txid_current())
+    date_deleted = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index('ix_tombstones_user_id_change_txid',
+              'user_id', 'change_txid', 'change_seq'),
+        {'info': {'sharded': True}},
+    )
+
+    def __init__(self, user_id, object_type, object_id):
+        self.user_id = user_id
+        self.object_type = object_type
+        self.object_id = object_id
+
+    @staticmethod
+    def record(user_id, object_type, object_id):
+        """ adds a tombstone to the session without committing it so that
+        it is committed together with the deletion it stands for"""
+        db.session.add(Tombstone(user_id, object_type, object_id))
+
+
+class PendingBoughtState(db.Model, BaseModel):
+    """PendingBoughtState holds a change to an item's has_been_bought that
+    is being coalesced with the others made to its list, until it is
+    written by app.coalescing. It is kept next to the items, so that it
+    is dropped in the same transaction as the item is updated"""
+
+    __tablename__ = 'pending_bought_states'
+    __table_args__ = (
+        Index('ix_pending_bought_states_user_id_shoppinglist_id',
+              'user_id', 'shoppinglist_id'),
+        {'info': {'sharded': True, 'primary_only': True}},
+    )
+
+    item_id = Column(Integer, ForeignKey(Item.id, ondelete='CASCADE'),
+                     primary_key=True)
+    shoppinglist_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    # the state the item was set to, null if it was only toggled, and
+    # whether it is to be flipped after that
+    has_been_bought = Column(Boolean)
+    toggled = Column(Boolean, nullable=False)
+    date_created = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class ReminderCheckpoint(db.Model, BaseModel):
+    """ReminderCheckpoint remembers the last user that was reminded of
+    the shoppinglists due on a given date, so that an interrupted or
+    repeated run of the reminder scheduler picks up after that user.
+    Every shard is scanned on its own and so has its own checkpoint"""
+
+    __tablename__ = 'reminder_checkpoints'
+    notify_date = Column(Date, primary_key=True)
+    shard = Column(String, primary_key=True, server_default='')  # unsharded
+    last_user_id = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, notify_date, shard=''):
+        self.notify_date = notify_date
+        self.shard = shard
+        self.last_user_id = 0
+
+
+class ShardAssignment(db.Model, BaseModel):
+    """ShardAssignment records the shard that holds a user's shoppinglists,
+    items and tombstones, and whether they are being moved to another"""
+
+    __tablename__ = 'shard_assignments'
+    __table_args__ = {'info': {'primary_only': True}}
+
+    user_id = Column(Integer, ForeignKey(User.id), primary_key=True)
+    shard = Column(String, nullable=False)
+    is_moving = Column(Boolean, nullable=False, default=False)
+
+    def __init__(self, user_id, shard):
+        self.user_id = user_id
+        self.shard = shard
+        self.is_moving = False
+
+
+class IdempotencyKey(db.Model, BaseModel):
+    """IdempotencyKey holds the response to the first request that a user
+    made with an `Idempotency-Key`, for it to be replayed to the retries"""
+
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'key',
+                         name='uq_idempotency_keys_user_id_key'),
+        Index('ix_idempotency_keys_date_created', 'date_created'),
+        {'info': {'primary_only': True}},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey(User.id), nullable=False)
+    key = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)  # of the request
+    status_code = Column(Integer)  # null while the request is running
+    body = Column(Text)
+    date_created = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class AuditEntry(db.Model, BaseModel):
+    """AuditEntry records that a user created, updated or deleted one of
+    their shoppinglists or items. Entries are written in batches by
+    app.audit.AuditLog, after the changes are committed"""
+
+    __tablename__ = 'audit_log'
+    __table_args__ = (
+        Index('ix_audit_log_user_id_txid', 'user_id', 'txid', 'id'),
+        {'info': {'primary_only': True}},
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, nullable=False)
+    # 'created', 'updated', 'deleted', or 'imported' into a shoppinglist
+    action = Column(String, nullable=False)
+    object_type = Column(String, nullable=False)  # 'shoppinglist' or 'item'
+    object_id = Column(Integer, nullable=False)
+    shoppinglist_id = Column(Integer, nullable=False)
+    date_created = Column(DateTime, nullable=False)  # when it was committed
+    # the transaction that wrote the entry: the batches of the workers are
+    # committed in any order, so the entries are paged in that of txid
+    txid = Column(BigInteger, nullable=False,
+                  server_default=func.txid_current())
+
+
+class BackgroundTask(db.Model, BaseModel):
+    """BackgroundTask is a task waiting to be run by `manage.py run_tasks`,
+    when tasks are run out of process (TASKS_BACKEND = 'database')"""
+
+    __tablename__ = 'background_tasks'
+    __table_args__ = {'info': {'primary_only': True}}
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False)  # of a function registered by @task
+    arguments = Column(Text, nullable=False)  # JSON [args, kwargs]
+    attempts = Column(Integer, nullable=False, server_default='0')
+    claimed_at = Column(DateTime)  # set while a worker is running it
+    date_created = Column(DateTime, server_default=func.now())
+
+    def __init__(self, name, arguments):
+        self.name = name
+        self.arguments = arguments
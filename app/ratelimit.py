@@ -0,0 +1,321 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from flask import current_app, g, jsonify, request
+
+from app.metrics import LOGIN_LOCKOUTS, LOGIN_ATTEMPTS_BLOCKED
+
+
+class MemoryBackend:
+    """
+    MemoryBackend keeps the token buckets in this process. It is the
+    fastest option but every gunicorn worker counts on its own. The
+    buckets are kept least recently used first, and the oldest are
+    dropped beyond <max_buckets>, so that requests from endless new IPs
+    can't use up the memory or refill the buckets of everyone else.
+    """
+
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, cost, capacity, refill_rate):
+        """ takes <cost> tokens from the bucket at <key> if it holds enough
+        of them and returns (allowed, tokens left in the bucket)"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, last_update = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last_update) * refill_rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        return allowed, tokens
+
+
+def connect_redis(url):  # pragma: no cover
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError(
+            "the 'redis' rate limit backend requires the redis package")
+    return redis.StrictRedis.from_url(url)
+
+
+class RedisBackend:
+    """
+    RedisBackend shares the token buckets between all the workers and
+    hosts. The refill and take happen atomically inside Redis in a
+    single round trip.
+    """
+
+    script = """
+    local capacity = tonumber(ARGV[1])
+    local refill_rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated) * refill_rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill_rate))
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url):  # pragma: no cover
+        self.take_tokens = connect_redis(url).register_script(self.script)
+
+    def take(self, key, cost, capacity, refill_rate):  # pragma: no cover
+        allowed, tokens = self.take_tokens(
+            keys=[f"ratelimit:{key}"], args=[capacity, refill_rate, cost])
+        return bool(allowed), float(tokens)
+
+
+def get_user_id(auth_header):
+    """
+    Reads the user ID from a bearer token without touching the database.
+    The views still fully verify the token; this is only used to pick the
+    bucket, so a forged token at worst spends someone's tokens.
+    """
+    parts = auth_header.split() if auth_header else []
+    if len(parts) != 2 or parts[0].title() != "Bearer":
+        return None
+    try:
+        payload = jwt.decode(parts[1], key=current_app.config['SECRET_KEY'],
+                             algorithms=['HS256', 'HS512'])
+        return payload.get('sub')
+    except jwt.InvalidTokenError:
+        return None
+
+
+def get_client_ip():
+    proxy_count = current_app.config['RATELIMIT_PROXY_COUNT']
+    route = request.access_route
+    if proxy_count and len(route) >= proxy_count:
+        return route[-proxy_count]
+    return request.remote_addr
+
+
+def login_throttle_keys(email, ip):
+    config = current_app.config
+    return (("account", f"account:{email}",
+             config['LOGIN_MAX_FAILURES_PER_ACCOUNT']),
+            ("ip", f"ip:{ip}", config['LOGIN_MAX_FAILURES_PER_IP']))
+
+
+class LoginThrottle:
+    """
+    LoginThrottle counts failed logins per account and per client IP.
+    Once either reaches its limit, further attempts are refused for a
+    lockout that doubles with every additional failure. The check is a
+    dictionary lookup, so a locked out attempt never pays for bcrypt.
+
+    The counters are kept in this process, least recently failed first,
+    and the oldest are dropped beyond <max_entries>, so that logins with
+    endless made up emails can't use up the memory. Every gunicorn worker
+    counts on its own; RedisLoginThrottle shares the counters.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.failures = OrderedDict()  # key: (failures, locked_until, last)
+        self.lock = threading.Lock()
+
+    def locked_for(self, email, ip):
+        """ returns the number of seconds for which logging into <email>
+        from <ip> is refused, 0 if it isn't locked out"""
+        now = time.monotonic()
+        for scope, key, _ in login_throttle_keys(email, ip):
+            _, locked_until, _ = self.failures.get(key, (0, 0, 0))
+            if locked_until > now:
+                LOGIN_ATTEMPTS_BLOCKED.labels(scope=scope).inc()
+                return math.ceil(locked_until - now)
+        return 0
+
+    def record_failure(self, email, ip):
+        config = current_app.config
+        lockout = config['LOGIN_LOCKOUT_SECONDS']
+        max_lockout = config['LOGIN_MAX_LOCKOUT_SECONDS']
+        now = time.monotonic()
+        with self.lock:
+            for scope, key, max_failures in login_throttle_keys(email, ip):
+                failures, locked_until, last_failure = self.failures.pop(
+                    key, (0, 0, now))
+                if now - last_failure > max_lockout:
+                    failures = 0  # the earlier failures are forgiven
+                failures += 1
+                if failures >= max_failures:
+                    locked_until = now + min(
+                        max_lockout, lockout * 2 ** (failures - max_failures))
+                    LOGIN_LOCKOUTS.labels(scope=scope).inc()
+                self.failures[key] = (failures, locked_until, now)
+
+            while len(self.failures) > self.max_entries:
+                self.failures.popitem(last=False)
+
+    def reset(self, email):
+        with self.lock:
+            self.failures.pop(f"account:{email}", None)
+
+
+class RedisLoginThrottle:
+    """
+    RedisLoginThrottle keeps the counters of LoginThrottle in Redis, so
+    that every worker and host counts the same failures. A counter expires
+    once its failures are forgiven.
+    """
+
+    locked_for_script = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local locked_for = {}
+    for i, key in ipairs(KEYS) do
+        local locked_until = tonumber(redis.call('HGET', key, 'locked_until'))
+        locked_for[i] = tostring(math.max(0, (locked_until or 0) - now))
+    end
+    return locked_for
+    """
+
+    record_failure_script = """
+    local lockout = tonumber(ARGV[1])
+    local max_lockout = tonumber(ARGV[2])
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local locked_out = {}
+    for i, key in ipairs(KEYS) do
+        local max_failures = tonumber(ARGV[i + 2])
+        local entry = redis.call('HMGET', key, 'failures', 'locked_until',
+                                 'last_failure')
+        local failures = tonumber(entry[1]) or 0
+        local locked_until = tonumber(entry[2]) or 0
+        if now - (tonumber(entry[3]) or now) > max_lockout then
+            failures = 0
+        end
+        failures = failures + 1
+        locked_out[i] = 0
+        if failures >= max_failures then
+            locked_until = now + math.min(
+                max_lockout, lockout * 2 ^ (failures - max_failures))
+            locked_out[i] = 1
+        end
+        redis.call('HMSET', key, 'failures', failures,
+                   'locked_until', tostring(locked_until),
+                   'last_failure', tostring(now))
+        redis.call('EXPIRE', key, math.ceil(max_lockout))
+    end
+    return locked_out
+    """
+
+    def __init__(self, url):  # pragma: no cover
+        self.redis = connect_redis(url)
+        self.get_locked_for = self.redis.register_script(
+            self.locked_for_script)
+        self.record_failures = self.redis.register_script(
+            self.record_failure_script)
+
+    def locked_for(self, email, ip):  # pragma: no cover
+        keys = login_throttle_keys(email, ip)
+        locked_for = self.get_locked_for(
+            keys=[f"login:{key}" for _, key, _ in keys])
+        for (scope, _, _), seconds in zip(keys, locked_for):
+            if float(seconds) > 0:
+                LOGIN_ATTEMPTS_BLOCKED.labels(scope=scope).inc()
+                return math.ceil(float(seconds))
+        return 0
+
+    def record_failure(self, email, ip):  # pragma: no cover
+        config = current_app.config
+        keys = login_throttle_keys(email, ip)
+        locked_out = self.record_failures(
+            keys=[f"login:{key}" for _, key, _ in keys],
+            args=[config['LOGIN_LOCKOUT_SECONDS'],
+                  config['LOGIN_MAX_LOCKOUT_SECONDS']] +
+            [max_failures for _, _, max_failures in keys])
+        for (scope, _, _), is_locked_out in zip(keys, locked_out):
+            if is_locked_out:
+                LOGIN_LOCKOUTS.labels(scope=scope).inc()
+
+    def reset(self, email):  # pragma: no cover
+        self.redis.delete(f"login:account:{email}")
+
+
+class RateLimiter:
+    """
+    RateLimiter applies a token bucket per user, identified by their
+    bearer token, and per client IP for requests without a valid token
+    such as the public /auth routes.
+    """
+
+    def init_app(self, app):
+        if app.config['RATELIMIT_BACKEND'] == 'redis':  # pragma: no cover
+            backend = RedisBackend(app.config['RATELIMIT_REDIS_URL'])
+            login_throttle = RedisLoginThrottle(
+                app.config['RATELIMIT_REDIS_URL'])
+        else:
+            backend = MemoryBackend()
+            login_throttle = LoginThrottle()
+        app.extensions['ratelimit'] = backend
+        app.extensions['login_throttle'] = login_throttle
+        app.before_request(self.check)
+        app.after_request(self.add_headers)
+
+    @staticmethod
+    def check():
+        config = current_app.config
+        if not config['RATELIMIT_ENABLED']:
+            return None
+
+        user_id = get_user_id(request.headers.get("Authorization"))
+        if user_id is not None:
+            key = f"user:{user_id}"
+            capacity, refill_rate = config['RATELIMIT_USER_BUCKET']
+        else:
+            key = f"ip:{get_client_ip()}"
+            capacity, refill_rate = config['RATELIMIT_IP_BUCKET']
+        cost = config['RATELIMIT_COSTS'].get(request.endpoint, 1)
+
+        allowed, tokens = current_app.extensions['ratelimit'].take(
+            key, cost, capacity, refill_rate)
+        g.ratelimit = (capacity, refill_rate, tokens)
+        if allowed:
+            return None
+
+        retry_after = math.ceil((cost - tokens) / refill_rate)
+        response = jsonify({
+            "status": "failure",
+            "message": f"too many requests, retry in {retry_after} seconds"
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    @staticmethod
+    def add_headers(response):
+        ratelimit = g.get('ratelimit')
+        if ratelimit is not None:
+            capacity, refill_rate, tokens = ratelimit
+            response.headers['RateLimit-Limit'] = str(capacity)
+            response.headers['RateLimit-Remaining'] = str(int(tokens))
+            response.headers['RateLimit-Reset'] = str(
+                math.ceil((capacity - tokens) / refill_rate))
+        return response
+
+
+limiter = RateLimiter()
+
+
+def get_login_throttle():
+    return current_app.extensions['login_throttle']
@@ -0,0 +1,121 @@
+import json
+import smtplib
+from collections import namedtuple, OrderedDict
+from email.message import EmailMessage
+
+from flask import current_app
+
+from app import db
+from app.models import User, ShoppingList, ReminderCheckpoint
+
+Reminder = namedtuple('Reminder', ['user_id', 'email', 'shoppinglists'])
+
+
+class FileSender:
+    """FileSender appends every reminder as a line of JSON to a file.
+    It stands in for a mail server in development and in the tests."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, reminders):
+        with open(self.path, 'a') as reminder_file:
+            for reminder in reminders:
+                reminder_file.write(json.dumps(reminder._asdict()) + '\n')
+
+
+class SMTPSender:
+    """SMTPSender emails the reminders of a batch over one connection"""
+
+    def __init__(self, host, port, from_address):
+        self.host = host
+        self.port = port
+        self.from_address = from_address
+
+    def send(self, reminders):  # pragma: no cover
+        with smtplib.SMTP(self.host, self.port) as smtp:
+            for reminder in reminders:
+                message = EmailMessage()
+                message['From'] = self.from_address
+                message['To'] = reminder.email
+                message['Subject'] = "Your shopping lists for today"
+                message.set_content(
+                    "Don't forget your shopping today:\n\n" +
+                    "\n".join(f"* {name}" for name in reminder.shoppinglists))
+                smtp.send_message(message)
+
+
+def get_sender(config):
+    if config['REMINDER_SENDER'] == 'smtp':  # pragma: no cover
+        return SMTPSender(config['SMTP_HOST'], config['SMTP_PORT'],
+                          config['REMINDER_FROM_ADDRESS'])
+    return FileSender(config['REMINDER_FILE'])
+
+
+def get_due_lists(notify_date, after_user_id, batch_size):
+    """
+    Returns the next page of shoppinglists due on <notify_date> for
+    users after <after_user_id>, leaving out the users who deleted their
+    account. A page never splits a user's lists, so every user gets
+    exactly one reminder.
+    """
+    query = db.session.query(
+        ShoppingList.user_id, User.email, ShoppingList.name).join(
+            User, User.id == ShoppingList.user_id).filter(
+                User.disabled_at.is_(None)).filter(
+                    ShoppingList.notify_date == notify_date).filter(
+                        ShoppingList.deleted_at.is_(None)).order_by(
+                            ShoppingList.user_id, ShoppingList.id)
+
+    rows = query.filter(
+        ShoppingList.user_id > after_user_id).limit(batch_size).all()
+    if len(rows) < batch_size:
+        return rows
+
+    last_user_id = rows[-1].user_id
+    if rows[0].user_id != last_user_id:
+        # the last user may have more lists on the next page
+        return [row for row in rows if row.user_id != last_user_id]
+    # a single user has more lists than fit on a page
+    return query.filter(ShoppingList.user_id == last_user_id).all()
+
+
+def send_reminders(notify_date, sender, batch_size=500):
+    """
+    Reminds every user of their shoppinglists that are due on
+    <notify_date>, a batch of users at a time, and returns the number of
+    reminders that were sent. When the lists are sharded, the shards are
+    scanned one after the other.
+
+    The checkpoint is committed before each batch is handed to the sender,
+    so running the scheduler again for the same date never reminds a user
+    twice. If the process dies mid-batch, that batch is skipped rather
+    than repeated.
+    """
+    sent = 0
+    for shard in current_app.config['SHARD_BINDS'] or ('',):
+        if shard:
+            db.session.info['shard'] = shard
+        checkpoint = ReminderCheckpoint.query.get((notify_date, shard))
+        if checkpoint is None:
+            checkpoint = ReminderCheckpoint(notify_date, shard)
+            db.session.add(checkpoint)
+
+        while True:
+            rows = get_due_lists(
+                notify_date, checkpoint.last_user_id, batch_size)
+            if not rows:
+                break
+
+            reminders = OrderedDict()
+            for user_id, email, name in rows:
+                reminders.setdefault(user_id, Reminder(
+                    user_id, email, [])).shoppinglists.append(name)
+
+            checkpoint.last_user_id = rows[-1].user_id
+            db.session.commit()
+            sender.send(list(reminders.values()))
+            sent += len(reminders)
+
+        db.session.commit()
+    return sent
@@ -0,0 +1,174 @@
+import random
+import threading
+import time
+
+from flask import current_app, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import orm, text
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.util import find_tables
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# zero when the replica streams from the primary and has replayed everything
+# it received, otherwise the age of the last transaction it replayed: a
+# replica cut off from the primary can't tell how much it is missing. A
+# primary is never lagging
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN EXISTS (SELECT 1 FROM pg_stat_wal_receiver)
+            AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(CAST(extract(
+            epoch FROM now() - pg_last_xact_replay_timestamp()) AS float8),
+            'Infinity')
+    END
+""")
+
+
+class ReplicaMonitor:
+    """
+    ReplicaMonitor knows how far behind the primary every replica is.
+    The lag of a replica is measured at most once every <check_interval>
+    seconds per process, so routing a read costs a dictionary lookup.
+    """
+
+    def __init__(self, max_lag, check_interval):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lags = {}  # bind: (lag in seconds, when it was measured)
+        self.lock = threading.Lock()
+
+    def measure(self, engine):
+        if engine.dialect.name != 'postgresql':  # pragma: no cover
+            return 0
+        try:
+            return float(engine.execute(REPLICA_LAG_QUERY).scalar() or 0)
+        except Exception:  # pragma: no cover
+            return float('inf')  # an unreachable replica is never fresh
+
+    def is_fresh(self, bind, engine):
+        now = time.monotonic()
+        lag, measured_at = self.lags.get(bind, (None, 0))
+        if lag is None or now - measured_at > self.check_interval:
+            lag = self.measure(engine)
+            with self.lock:
+                self.lags[bind] = (lag, now)
+        return lag <= self.max_lag
+
+
+class RoutingSession(SignallingSession):
+    """
+    RoutingSession sends the reads made while handling GET requests to one
+    of the REPLICA_BINDS that is within REPLICA_MAX_LAG_SECONDS of the
+    primary. The replica is picked once per request, so that all of its
+    reads see the same snapshot of the data. Everything else goes to the primary: writes, reads outside a
+    request (management commands included), reads of tables marked
+    `primary_only`, and every statement of a request after its first
+    write, so that a request reads its writes.
+
+    When SHARD_BINDS are configured, every statement on a table marked
+    `sharded` goes to the shard of the user the session is working for.
+    """
+
+    def commit(self):
+        if self.info.get('deferred_commits'):
+            self.flush()  # committed, or rolled back, with the whole batch
+            return
+        super().commit()
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.app.config['SHARD_BINDS'] and \
+                self.is_sharded(mapper, clause):
+            return self.get_shard()
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        elif not self.info.get('wrote'):
+            replica = self.get_replica(mapper)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause)
+
+    @staticmethod
+    def is_sharded(mapper, clause):
+        if mapper is not None:
+            return mapper.mapped_table.info.get('sharded', False)
+        if clause is None:
+            return False
+        return any(
+            getattr(table, 'info', {}).get('sharded', False)
+            for table in find_tables(
+                clause, include_aliases=True, include_joins=True,
+                include_selects=True, include_crud=True))
+
+    def get_shard(self):
+        """ returns the engine of the shard picked with app.sharding.use_shard
+        for the shoppinglists, items and tombstones of the current user"""
+        shard = self.info.get('shard')
+        if shard is None:
+            raise RuntimeError("the shard of the user must be picked with "
+                               "use_shard() before their lists are queried")
+        return get_state(self.app).db.get_engine(self.app, bind=shard)
+
+    def get_replica(self, mapper):
+        if not self.info.get('read_only_request'):
+            return None
+        replica_binds = self.app.config['REPLICA_BINDS']
+        if not replica_binds:
+            return None
+        if mapper is not None and \
+                mapper.mapped_table.info.get('primary_only'):
+            return None
+
+        if 'replica' not in self.info:
+            self.info['replica'] = self.pick_replica(replica_binds)
+        if self.info['replica'] is None:
+            return None
+        return get_state(self.app).db.get_engine(
+            self.app, bind=self.info['replica'])
+
+    def pick_replica(self, replica_binds):
+        """ returns the bind of a random replica that is fresh enough, or
+        None if every replica is too stale and the primary must be read"""
+        db = get_state(self.app).db
+        monitor = self.app.extensions['replicas']
+        binds = list(replica_binds)
+        random.shuffle(binds)
+        for bind in binds:
+            engine = db.get_engine(self.app, bind=bind)
+            if monitor.is_fresh(bind, engine):
+                return bind
+        return None
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def init_app(app):
+    app.extensions['replicas'] = ReplicaMonitor(
+        app.config['REPLICA_MAX_LAG_SECONDS'],
+        app.config['REPLICA_LAG_CHECK_INTERVAL'])
+
+    @app.before_request
+    def start_on_the_replicas():
+        if request.environ.get('shoppinglist.batched'):
+            return  # a sub-request carries on where its batch is
+        # the session outlives a request when the app context is shared,
+        # as it is in the tests, so a write must only pin its own request
+        session = get_state(current_app).db.session
+        session.info.pop('wrote', None)
+        session.info.pop('shard', None)
+        session.info.pop('replica', None)
+        session.info['read_only_request'] = \
+            request.method in READ_ONLY_METHODS
+
+    @app.teardown_request
+    def stop_reading_from_the_replicas(_):
+        if request.environ.get('shoppinglist.batched'):
+            return
+        session = get_state(current_app).db.session
+        if session.registry.has():
+            session.info.pop('read_only_request', None)
+            session.info.pop('replica', None)
@@ -0,0 +1,169 @@
+import time
+import zlib
+
+from flask import current_app
+from sqlalchemy import select, text
+
+from app import db
+from app.models import (User, ShoppingList, Item, Tombstone,
+                        PendingBoughtState, ShardAssignment)
+
+# the IDs handed out by shard k are k + 1, k + 1 + MAX_SHARDS, ... so that a
+# user's lists and items keep their IDs when they are moved to another shard
+MAX_SHARDS = 64
+
+# users are copied onto the shards too, for the foreign keys of their lists
+SHARD_TABLES = (User.__table__, ShoppingList.__table__, Item.__table__,
+                Tombstone.__table__, PendingBoughtState.__table__)
+
+
+def hash_shard(user_id, shards):
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def shard_of(user_id):
+    """
+    Returns (shard, is_moving) for the user, the shard being a key of
+    SHARD_BINDS, or (None, False) when the lists aren't sharded. Users
+    without a ShardAssignment are on the shard their ID hashes to.
+    """
+    shards = current_app.config['SHARD_BINDS']
+    if not shards:
+        return None, False
+    assignment = db.session.query(
+        ShardAssignment.shard, ShardAssignment.is_moving).filter(
+            ShardAssignment.user_id == user_id).first()
+    if assignment is None:
+        return hash_shard(user_id, shards), False
+    return assignment
+
+
+def use_shard(user_id):
+    """ sends the session's statements on the sharded tables to the user's
+    shard and returns whether the user is being moved to another one"""
+    shard, is_moving = shard_of(user_id)
+    if shard is not None:
+        db.session.info['shard'] = shard
+    return is_moving
+
+
+def copy_user(user_id, connection):
+    """ copies the user's row from the primary onto a shard, unless it is
+    there already"""
+    users = User.__table__
+    if connection.execute(
+            select([users.c.id]).where(users.c.id == user_id)).first():
+        return
+    user = db.engine.execute(
+        select([users]).where(users.c.id == user_id)).first()
+    connection.execute(users.insert().values(dict(user)))
+
+
+def assign_shard(user):
+    """ records the shard of a newly registered user and copies the user
+    onto it"""
+    shards = current_app.config['SHARD_BINDS']
+    if not shards:
+        return
+    shard = hash_shard(user.id, shards)
+    db.session.add(ShardAssignment(user.id, shard))
+    db.session.commit()
+    with db.get_engine(current_app, bind=shard).begin() as connection:
+        copy_user(user.id, connection)
+
+
+def init_shards():
+    """
+    Creates the sharded tables on every shard, and interleaves the IDs the
+    shards hand out. The IDs of a shard are only interleaved before it has
+    handed out any, so running this again is harmless.
+    """
+    shards = current_app.config['SHARD_BINDS']
+    if len(shards) > MAX_SHARDS:  # pragma: no cover
+        raise RuntimeError(f"there can't be more than {MAX_SHARDS} shards")
+    for number, shard in enumerate(shards):
+        engine = db.get_engine(current_app, bind=shard)
+        db.Model.metadata.create_all(engine, tables=SHARD_TABLES)
+        with engine.begin() as connection:
+            for table in SHARD_TABLES[1:]:
+                if 'id' not in table.c:
+                    continue  # keyed by the item it holds a state for
+                sequence = f"{table.name}_id_seq"
+                if not connection.execute(
+                        text(f"SELECT is_called FROM {sequence}")).scalar():
+                    connection.execute(text(
+                        f"ALTER SEQUENCE {sequence} INCREMENT BY {MAX_SHARDS}"
+                        f" RESTART WITH {number + 1}"))
+
+
+def move_user(user_id, target, grace_seconds=5, batch_size=1000):
+    """
+    Moves the user's shoppinglists, items, tombstones and held item states
+    to the <target> shard while the app keeps serving the user, and returns
+    the number of rows that were moved.
+
+    The user is marked as moving first, which makes the API refuse their
+    writes while still serving their reads from the old shard. After
+    <grace_seconds>, for writes that had already started to finish, the
+    rows are copied in a single transaction on the target. Only once the
+    assignment points at the target are the rows deleted from the source.
+    """
+    if target not in current_app.config['SHARD_BINDS']:
+        raise ValueError(f"'{target}' is not one of the SHARD_BINDS")
+    source, is_moving = shard_of(user_id)
+    if is_moving:
+        raise RuntimeError(f"user {user_id} is already being moved")
+    if source == target:
+        return 0
+
+    assignment = ShardAssignment.query.get(user_id)
+    if assignment is None:
+        assignment = ShardAssignment(user_id, source)
+        db.session.add(assignment)
+    assignment.is_moving = True
+    db.session.commit()
+
+    lists, items, tombstones, pending = SHARD_TABLES[1:]
+    list_ids = select([lists.c.id]).where(lists.c.user_id == user_id)
+    user_rows = ((lists, lists.c.user_id == user_id),
+                 (items, items.c.shoppinglist_id.in_(list_ids)),
+                 (tombstones, tombstones.c.user_id == user_id),
+                 (pending, pending.c.user_id == user_id))
+    source_engine = db.get_engine(current_app, bind=source)
+    moved = 0
+    try:
+        time.sleep(grace_seconds)
+        last_change_seq = 1
+        with db.get_engine(current_app, bind=target).begin() as connection:
+            copy_user(user_id, connection)
+            for table, condition in user_rows:
+                result = source_engine.execute(
+                    select([table]).where(condition).order_by(
+                        *table.primary_key).execution_options(
+                            stream_results=True))
+                rows = result.fetchmany(batch_size)
+                while rows:
+                    # the copies get the ID of this transaction on the
+                    # target, where the source's transaction IDs mean nothing
+                    connection.execute(table.insert(), [
+                        {column: value for column, value in row.items()
+                         if column != 'change_txid'} for row in rows])
+                    if 'change_seq' in table.c:
+                        last_change_seq = max([last_change_seq] +
+                                              [row.change_seq for row in rows])
+                    moved += len(rows)
+                    rows = result.fetchmany(batch_size)
+            # later changes must sort after the copied ones for syncing
+            connection.execute(text(
+                "SELECT setval('change_sequence', GREATEST("
+                "(SELECT last_value FROM change_sequence), :change_seq))"),
+                change_seq=last_change_seq)
+        assignment.shard = target
+    finally:
+        assignment.is_moving = False
+        db.session.commit()
+
+    with source_engine.begin() as connection:
+        for table, condition in reversed(user_rows):
+            connection.execute(table.delete().where(condition))
+    return moved
@@ -0,0 +1,207 @@
+import atexit
+import json
+import queue
+import threading
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import and_, event, or_, select, func
+
+from app import db
+from app.models import BackgroundTask
+from app.routing import RoutingSession
+from app.unit_of_work import in_unit_of_work
+
+# the functions that can be run in the background, by name, so that a task
+# stored in the database can be found again by another process
+TASKS = {}
+
+STOP = object()  # tells a worker thread to exit once the queue is drained
+
+
+def task(function):
+    """ registers <function> to be run in the background with
+    run_in_background. Its arguments must be JSON serializable"""
+    TASKS[function.__name__] = function
+    return function
+
+
+def run_task(app, name, args, kwargs):
+    """ runs a task in its own app context and session, committing what it
+    did, and returns whether it succeeded"""
+    with app.app_context():
+        try:
+            TASKS[name](*args, **kwargs)
+            db.session.commit()
+            return True
+        except Exception:
+            db.session.rollback()
+            app.logger.exception(f"background task {name} failed")
+            return False
+        finally:
+            db.session.remove()
+
+
+class ThreadExecutor:
+    """
+    ThreadExecutor runs tasks on a pool of threads of this process, started
+    with the first task. A task submitted by a request is held in its
+    session and queued once the request's changes are committed, or
+    dropped if they are rolled back, so that it sees what the request
+    wrote, like a task of the DatabaseExecutor. The queue is bounded: when the pool has fallen
+    behind by <max_queued> tasks, submitting waits for room in the queue,
+    which slows the requests down rather than losing tasks or memory.
+    Shutting down lets the workers finish every task that was queued.
+    """
+
+    def __init__(self, app, workers=2, max_queued=1000, shutdown_timeout=30):
+        self.app = app
+        self.workers = workers
+        self.shutdown_timeout = shutdown_timeout
+        self.tasks = queue.Queue(maxsize=max_queued)
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, name, args, kwargs):
+        if in_unit_of_work():
+            db.session.info.setdefault('tasks', []).append(
+                (name, args, kwargs))
+        else:
+            self.enqueue(name, args, kwargs)
+
+    def enqueue(self, name, args, kwargs):
+        with self.lock:
+            if not self.threads:
+                self.start()
+        self.tasks.put((name, args, kwargs))
+
+    def start(self):
+        # the process waits for the queue to drain before it exits
+        atexit.register(self.shutdown)
+        for number in range(self.workers):
+            thread = threading.Thread(target=self.work,
+                                      name=f"background-task-{number}",
+                                      daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def work(self):
+        while True:
+            queued = self.tasks.get()
+            try:
+                if queued is STOP:
+                    return
+                run_task(self.app, *queued)
+            finally:
+                self.tasks.task_done()
+
+    def shutdown(self, timeout=None):
+        """ waits for up to <timeout> seconds, shutdown_timeout by default,
+        for the queued tasks to be run, then stops the workers"""
+        if timeout is None:
+            timeout = self.shutdown_timeout
+        with self.lock:
+            threads, self.threads = self.threads, []
+        atexit.unregister(self.shutdown)
+        for _ in threads:
+            self.tasks.put(STOP)  # after every task that is already queued
+        for thread in threads:
+            thread.join(timeout)
+
+
+class DatabaseExecutor:
+    """
+    DatabaseExecutor stores tasks as rows of the background_tasks table,
+    committed with the request that submitted them, for `manage.py
+    run_tasks` processes to run. A task that fails, or whose process dies,
+    is retried <claim_timeout> seconds later, until it has been attempted
+    <max_attempts> times.
+    """
+
+    def __init__(self, app, claim_timeout=600, max_attempts=5):
+        self.app = app
+        self.claim_timeout = claim_timeout
+        self.max_attempts = max_attempts
+
+    @staticmethod
+    def submit(name, args, kwargs):
+        BackgroundTask(name, json.dumps([args, kwargs])).save()
+
+    def claim(self):
+        """ marks the oldest runnable task as being run by this process and
+        returns it, or None if there isn't any. Concurrent workers skip the
+        rows the others are claiming instead of waiting for them"""
+        tasks = BackgroundTask.__table__
+        runnable = select([tasks.c.id]).where(and_(
+            tasks.c.attempts < self.max_attempts,
+            or_(tasks.c.claimed_at.is_(None),
+                tasks.c.claimed_at < func.now() - timedelta(
+                    seconds=self.claim_timeout)))).order_by(
+                        tasks.c.id).limit(1).with_for_update(skip_locked=True)
+        claimed = db.session.execute(tasks.update().where(
+            tasks.c.id == runnable.as_scalar()).values(
+                claimed_at=func.now(),
+                attempts=tasks.c.attempts + 1).returning(*tasks.c)).first()
+        db.session.commit()
+        return claimed
+
+    def run_pending(self):
+        """ runs the stored tasks until there are none left to run, and
+        returns how many of them succeeded"""
+        tasks = BackgroundTask.__table__
+        succeeded = 0
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                return succeeded
+            args, kwargs = json.loads(claimed.arguments)
+            # a task that failed stays claimed, to be retried once its
+            # claim times out
+            if run_task(self.app, claimed.name, args, kwargs):
+                succeeded += 1
+                db.session.execute(
+                    tasks.delete().where(tasks.c.id == claimed.id))
+                db.session.commit()
+
+    def shutdown(self, timeout=None):
+        pass  # the stored tasks outlive the process
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def queue_committed_tasks(session):
+    for name, args, kwargs in session.info.pop('tasks', []):
+        session.app.extensions['tasks'].enqueue(name, args, kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def drop_rolled_back_tasks(session, _):
+    session.info.pop('tasks', None)
+
+
+def init_app(app):
+    if app.config['TASKS_BACKEND'] == 'database':
+        executor = DatabaseExecutor(app, app.config['TASKS_CLAIM_TIMEOUT'],
+                                    app.config['TASKS_MAX_ATTEMPTS'])
+    else:
+        executor = ThreadExecutor(app, app.config['TASKS_WORKERS'],
+                                  app.config['TASKS_MAX_QUEUED'],
+                                  app.config['TASKS_SHUTDOWN_TIMEOUT'])
+    app.extensions['tasks'] = executor
+
+
+def get_executor():
+    return current_app.extensions['tasks']
+
+
+def run_in_background(function, *args, **kwargs):
+    """
+    Hands <function>, a registered task, over to the executor so that the
+    request doesn't wait for it. With TASKS_EAGER, as in the tests, it is
+    run right away instead, in the caller's session and transaction.
+    """
+    if TASKS.get(function.__name__) is not function:
+        raise ValueError(f"{function.__name__} isn't a registered task")
+    if current_app.config['TASKS_EAGER']:
+        function(*args, **kwargs)
+        return
+    get_executor().submit(function.__name__, list(args), kwargs)
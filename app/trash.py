@@ -0,0 +1,152 @@
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import and_, select, literal, func
+
+from app import db
+from app.accounts import delete_in_batches
+from app.models import ShoppingList, Item, Tombstone, change_sequence
+
+
+def live_lists_of(user_id):
+    """ returns a SELECT of the IDs of the user's lists that aren't in the
+    trash"""
+    lists = ShoppingList.__table__
+    return select([lists.c.id]).where(and_(
+        lists.c.user_id == user_id, lists.c.deleted_at.is_(None)))
+
+
+def trash_shoppinglist(user_id, list_id):
+    """ moves the user's shoppinglist <list_id>, with its items, to the
+    trash with a single UPDATE and returns whether there was such a list"""
+    lists = ShoppingList.__table__
+    return db.session.execute(lists.update().where(and_(
+        lists.c.id == list_id, lists.c.user_id == user_id,
+        lists.c.deleted_at.is_(None))).values(deleted_at=func.now()).returning(
+            lists.c.id)).first() is not None
+
+
+def trash_item(user_id, list_id, item_id):
+    """ moves the item <item_id> of the user's shoppinglist <list_id> to
+    the trash with a single UPDATE and returns whether there was such an
+    item"""
+    items = Item.__table__
+    return db.session.execute(items.update().where(and_(
+        items.c.id == item_id, items.c.shoppinglist_id == list_id,
+        items.c.shoppinglist_id.in_(live_lists_of(user_id)),
+        items.c.deleted_at.is_(None))).values(deleted_at=func.now()).returning(
+            items.c.id)).first() is not None
+
+
+def restore_shoppinglist(user_id, list_id):
+    """
+    Takes the user's shoppinglist <list_id> out of the trash and returns
+    whether it was there. Its items are touched too, for the clients that
+    dropped them with the list to get them again on their next sync.
+    Raises IntegrityError if another list has taken its name since.
+    """
+    lists, items = ShoppingList.__table__, Item.__table__
+    restored = db.session.execute(lists.update().where(and_(
+        lists.c.id == list_id, lists.c.user_id == user_id,
+        lists.c.deleted_at.isnot(None))).values(deleted_at=None).returning(
+            lists.c.id)).first()
+    if restored is None:
+        return False
+    # only the sync position of the items changes, not their ETag
+    db.session.execute(items.update().where(and_(
+        items.c.shoppinglist_id == list_id,
+        items.c.deleted_at.is_(None))).values(
+            change_seq=change_sequence.next_value(),
+            version=items.c.version, date_modified=items.c.date_modified))
+    return True
+
+
+def restore_item(user_id, list_id, item_id):
+    """ takes an item of the user's shoppinglist <list_id> out of the trash
+    and returns whether it was there. Raises IntegrityError if another item
+    of the list has taken its name since"""
+    items = Item.__table__
+    return db.session.execute(items.update().where(and_(
+        items.c.id == item_id, items.c.shoppinglist_id == list_id,
+        items.c.shoppinglist_id.in_(live_lists_of(user_id)),
+        items.c.deleted_at.isnot(None))).values(deleted_at=None).returning(
+            items.c.id)).first() is not None
+
+
+def get_trash(user_id, page=1, per_page=20):
+    """ returns page <page> of the user's trashed shoppinglists, and of
+    their trashed items of lists that aren't in the trash themselves, most
+    recent first and <per_page> of each, as pagination objects"""
+    shoppinglists = ShoppingList.query.filter(
+        ShoppingList.user_id == user_id).filter(
+            ShoppingList.deleted_at.isnot(None)).order_by(
+                ShoppingList.deleted_at.desc(), ShoppingList.id.desc())
+    list_items = Item.query.filter(
+        Item.shoppinglist_id.in_(live_lists_of(user_id))).filter(
+            Item.deleted_at.isnot(None)).order_by(
+                Item.deleted_at.desc(), Item.id.desc())
+    return (shoppinglists.paginate(page=page, per_page=per_page,
+                                   error_out=False),
+            list_items.paginate(page=page, per_page=per_page,
+                                error_out=False))
+
+
+def record_deletion(object_type, deleted):
+    """ returns an INSERT of the Tombstones for the rows that <deleted>, a
+    DELETE ... RETURNING id, user_id made into a CTE, deletes"""
+    tombstones = Tombstone.__table__
+    return tombstones.insert().from_select(
+        ['user_id', 'object_type', 'object_id'],
+        select([deleted.c.user_id, literal(object_type), deleted.c.id])
+    ).returning(tombstones.c.object_id)
+
+
+def delete_with_tombstones(table, condition, object_type, owner, batch_size):
+    """
+    Deletes the rows of <table> matching <condition> like
+    delete_in_batches, and records a Tombstone owned by <owner> for each of
+    them with the same statement, for the clients that haven't synced
+    since the rows were trashed.
+    """
+    batch = select([table.c.id]).where(condition).limit(batch_size)
+    deleted = table.delete().where(table.c.id.in_(batch)).returning(
+        table.c.id, owner.label('user_id')).cte('deleted')
+    statement = record_deletion(object_type, deleted)
+    purged = 0
+    while True:
+        count = len(db.session.execute(statement).fetchall())
+        db.session.commit()
+        purged += count
+        if count < batch_size:
+            return purged
+
+
+def purge_trash(retention_seconds, batch_size=500):
+    """
+    Deletes the shoppinglists and items that have been in the trash for
+    longer than <retention_seconds>, <batch_size> rows per transaction,
+    and returns how many were deleted. When the lists are sharded, the
+    shards are purged one after the other.
+    """
+    # by the clock of the database, which set deleted_at
+    cutoff = func.now() - timedelta(seconds=retention_seconds)
+    lists, items = ShoppingList.__table__, Item.__table__
+    expired_lists = select([lists.c.id]).where(lists.c.deleted_at < cutoff)
+    list_owner = select([lists.c.user_id]).where(
+        lists.c.id == items.c.shoppinglist_id).as_scalar()
+
+    purged = 0
+    for shard in current_app.config['SHARD_BINDS'] or ('',):
+        if shard:
+            db.session.info['shard'] = shard
+        # the items of an expired list go with it, without tombstones of
+        # their own, but first so that deleting the list cascades to none
+        purged += delete_in_batches(
+            items, items.c.shoppinglist_id.in_(expired_lists), batch_size)
+        purged += delete_with_tombstones(
+            items, items.c.deleted_at < cutoff, "item", list_owner,
+            batch_size)
+        purged += delete_with_tombstones(
+            lists, lists.c.deleted_at < cutoff, "shoppinglist",
+            lists.c.user_id, batch_size)
+    return purged
@@ -0,0 +1,37 @@
+from flask import has_request_context, request
+
+from app import db
+
+UNIT_OF_WORK = 'shoppinglist.unit_of_work'
+
+
+def in_unit_of_work():
+    """ whether the session's changes are committed by the request being
+    handled, rather than by whoever staged them. Management commands run in
+    a request context too, but one that is never dispatched"""
+    return has_request_context() and request.environ.get(UNIT_OF_WORK, False)
+
+
+def init_app(app):
+    """
+    Makes every request one transaction. The changes a view stages are
+    committed together once it has answered with a success, and rolled
+    back if it answered with an error or raised.
+    """
+
+    @app.before_request
+    def begin_unit_of_work():
+        request.environ[UNIT_OF_WORK] = True
+
+    @app.after_request
+    def end_unit_of_work(response):
+        if response.status_code < 400:
+            db.session.commit()
+        else:
+            db.session.rollback()
+        return response
+
+    @app.teardown_request
+    def abandon_unit_of_work(error):
+        if error is not None:
+            db.session.rollback()
@@ -4,18 +4,99 @@ import secrets
 try:
     import settings
     TEST_DATABASE_URL = settings.TEST_DATABASE_URL
+    TEST_REPLICA_DATABASE_URL = getattr(
+        settings, 'TEST_REPLICA_DATABASE_URL', None)
+    TEST_SHARD_DATABASE_URLS = getattr(
+        settings, 'TEST_SHARD_DATABASE_URLS', None)
     DATABASE_URL = settings.DATABASE_URL
 except ImportError:  # pragma: no cover
     TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+    TEST_REPLICA_DATABASE_URL = os.getenv('TEST_REPLICA_DATABASE_URL')
+    TEST_SHARD_DATABASE_URLS = os.getenv('TEST_SHARD_DATABASE_URLS')
     DATABASE_URL = os.getenv('DATABASE_URL')
 
+# comma separated URLs of the read replicas of DATABASE_URL
+REPLICA_DATABASE_URLS = [
+    url for url in os.getenv('REPLICA_DATABASE_URLS', '').split(',') if url]
+# comma separated URLs of the databases that the lists are sharded across
+SHARD_DATABASE_URLS = [
+    url for url in os.getenv('SHARD_DATABASE_URLS', '').split(',') if url]
+
 
 class BaseConfig:
     DEBUG = False
     TESTING = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_BINDS = {}
+    REPLICA_BINDS = ()  # keys of SQLALCHEMY_BINDS that GET requests read from
+    REPLICA_MAX_LAG_SECONDS = 5  # a replica further behind isn't read from
+    REPLICA_LAG_CHECK_INTERVAL = 1
+    # keys of SQLALCHEMY_BINDS that hold the shoppinglists, items and
+    # tombstones, each for the users assigned to it. Empty, they stay on
+    # the primary
+    SHARD_BINDS = ()
     SECRET_KEY = secrets.token_hex(32)  # random string
     AUTH_EXPIRY_TIME_IN_SECONDS = 86400  # token can last a day before it expires
+    EVENT_BROKER = os.getenv('EVENT_BROKER', 'local')  # or 'postgres'
+    EVENT_CHANNEL = 'shoppinglist_changes'
+    EVENT_STREAM_HEARTBEAT_SECONDS = 15
+    REMINDER_SENDER = os.getenv('REMINDER_SENDER', 'file')  # or 'smtp'
+    REMINDER_FILE = os.getenv('REMINDER_FILE', 'reminders.jsonl')
+    REMINDER_FROM_ADDRESS = os.getenv(
+        'REMINDER_FROM_ADDRESS', 'reminders@shoppinglistapi.com')
+    SMTP_HOST = os.getenv('SMTP_HOST', 'localhost')
+    SMTP_PORT = int(os.getenv('SMTP_PORT', 25))
+    EXPORT_BATCH_SIZE = 1000  # rows fetched from the cursor at a time
+    IMPORT_CHUNK_SIZE = 500  # rows validated and written at a time
+    IDEMPOTENCY_KEY_TTL_SECONDS = 86400  # how long a response is replayed
+    # a request still without a response after this long has crashed or
+    # timed out, and its key can be claimed by a retry
+    IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS = 60
+    BATCH_MAX_REQUESTS = 20
+    ACCOUNT_PURGE_BATCH_SIZE = 500  # rows deleted per transaction
+    TRASH_RETENTION_SECONDS = 2592000  # 30 days before the trash is purged
+    # work that a request hands off is run by a pool of threads of the same
+    # process, or stored for `manage.py run_tasks` with 'database'
+    TASKS_BACKEND = os.getenv('TASKS_BACKEND', 'thread')
+    TASKS_EAGER = False  # run tasks right away, in the request
+    TASKS_WORKERS = 2
+    TASKS_MAX_QUEUED = 1000  # beyond which a request waits for room
+    TASKS_SHUTDOWN_TIMEOUT = 30  # seconds for the queue to drain on exit
+    TASKS_CLAIM_TIMEOUT = 600  # seconds before a stored task is run again
+    TASKS_MAX_ATTEMPTS = 5
+    # changes are written to the audit log in batches, whichever comes first
+    AUDIT_FLUSH_INTERVAL_MS = 500
+    AUDIT_FLUSH_EVENTS = 100
+    AUDIT_MAX_BUFFERED = 10000  # kept while the log can't be written
+    AUDIT_PAGE_SIZE = 100
+    # has_been_bought changes sent with `Prefer: respond-async` are held
+    # this long per list, and only the state each item ends up in is written
+    ITEM_STATUS_COALESCE_WINDOW_MS = 2000
+    ITEM_STATUS_FLUSH_INTERVAL_MS = 500  # how often held lists are checked
+    # when set, /metrics must be scraped with `Authorization: Bearer <token>`
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    RATELIMIT_ENABLED = True
+    # where the token buckets and the failed login counters are kept
+    RATELIMIT_BACKEND = os.getenv('RATELIMIT_BACKEND', 'memory')  # or 'redis'
+    RATELIMIT_REDIS_URL = os.getenv('REDIS_URL')
+    # (capacity, tokens added per second) of every bucket
+    RATELIMIT_USER_BUCKET = (120, 10)
+    RATELIMIT_IP_BUCKET = (30, 0.5)
+    # tokens taken by a request to an endpoint, 1 if it isn't listed.
+    # Hashing passwords with bcrypt is what makes these expensive
+    RATELIMIT_COSTS = {
+        'auth.register_user': 5,
+        'auth.login': 5,
+        'auth.reset_password': 5,
+        'export.export_api': 20,
+        'bulk_import.import_api': 20,
+    }
+    # number of proxies in front of the app that append to X-Forwarded-For
+    RATELIMIT_PROXY_COUNT = 0
+    LOGIN_MAX_FAILURES_PER_ACCOUNT = 5
+    LOGIN_MAX_FAILURES_PER_IP = 20
+    LOGIN_LOCKOUT_SECONDS = 30  # doubles with every further failure
+    LOGIN_MAX_LOCKOUT_SECONDS = 3600
 
 
 class TestingConfig(BaseConfig):
@@ -23,6 +104,9 @@ class TestingConfig(BaseConfig):
     DEBUG = True
     AUTH_EXPIRY_TIME_IN_SECONDS = 3  # just 3 seconds and the token expires
     SQLALCHEMY_DATABASE_URI = TEST_DATABASE_URL
+    TASKS_EAGER = True
+    AUDIT_FLUSH_INTERVAL_MS = 0  # no flusher thread, batches flush when full
+    ITEM_STATUS_FLUSH_INTERVAL_MS = 0  # held lists are written when read
 
 
 class DevelopmentConfig(BaseConfig):
@@ -32,6 +116,18 @@ class DevelopmentConfig(BaseConfig):
 
 class ProductionConfig(BaseConfig):
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
+    SQLALCHEMY_BINDS = dict(
+        [(f'replica_{number}', url)
+         for number, url in enumerate(REPLICA_DATABASE_URLS)] +
+        [(f'shard_{number}', url)
+         for number, url in enumerate(SHARD_DATABASE_URLS)])
+    REPLICA_BINDS = tuple(f'replica_{number}'
+                          for number in range(len(REPLICA_DATABASE_URLS)))
+    SHARD_BINDS = tuple(f'shard_{number}'
+                        for number in range(len(SHARD_DATABASE_URLS)))
+    # events must reach the streams held by every gunicorn worker
+    EVENT_BROKER = os.getenv('EVENT_BROKER', 'postgres')
+    RATELIMIT_PROXY_COUNT = 1  # the Heroku router
 
 
 app_config = dict(testing=TestingConfig,
@@ -0,0 +1,29 @@
+import os
+
+# Event streams stay open for as long as a client is watching its lists.
+# gevent workers serve each of them from a greenlet instead of tying up
+# a whole sync worker per connection.
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+worker_class = 'gevent'
+worker_connections = 1000
+
+
+def post_fork(server, worker):
+    # let other greenlets run while psycopg2 waits on Postgres
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def worker_exit(server, worker):
+    # let the background tasks handed off by this worker's requests finish,
+    # and write the changes that the audit log is holding
+    worker.wsgi.extensions['tasks'].shutdown()
+    worker.wsgi.extensions['audit'].flush()
+
+
+def child_exit(server, worker):
+    # the metrics of a worker that is gone stop being reported, but for its
+    # counters, which the other workers carry on from
+    if 'prometheus_multiproc_dir' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,9 +1,18 @@
 import os
-from flask_script import Manager
+import time
+from datetime import date, datetime
+from flask_script import Manager, Command, Option
 from flask_migrate import Migrate, MigrateCommand
 
 from app import create_app
 from app.models import *
+from app.reminders import send_reminders, get_sender
+from app.importer import import_shoppinglists
+from app.sharding import use_shard, init_shards, move_user
+from app.idempotency import delete_expired_keys
+from app.accounts import purge_disabled_accounts
+from app.trash import purge_trash as purge_expired_trash
+from app.tasks import DatabaseExecutor
 
 app = create_app(os.getenv('APP_SETTINGS', 'development'))
 
@@ -14,5 +23,112 @@ migrate = Migrate(app, db)
 # Add migrations commands to the manager
 manager.add_command('db', MigrateCommand)
 
+
+@manager.option('-d', '--date', dest='notify_date', default=None,
+                help='remind users of lists due on this date (yyyy-mm-dd), '
+                     'today by default')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=500, help='number of lists loaded at a time')
+def remind(notify_date=None, batch_size=500):
+    """Reminds users of their shoppinglists that are due"""
+    if notify_date is None:
+        notify_date = date.today()
+    else:
+        notify_date = datetime.strptime(notify_date, "%Y-%m-%d").date()
+    sent = send_reminders(notify_date, get_sender(app.config), batch_size)
+    print(f"sent {sent} reminders for {notify_date}")
+
+
+@manager.command
+def expire_idempotency_keys():
+    """Deletes the stored responses of expired Idempotency-Keys"""
+    print(f"deleted {delete_expired_keys()} expired idempotency keys")
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=500, help='number of rows deleted per transaction')
+def purge_accounts(batch_size=500):
+    """Finishes purging the accounts that users have deleted"""
+    print(f"purged {purge_disabled_accounts(batch_size)} deleted accounts")
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=500, help='number of rows deleted per transaction')
+def purge_trash(batch_size=500):
+    """Deletes the lists and items that have been in the trash for too long"""
+    purged = purge_expired_trash(app.config['TRASH_RETENTION_SECONDS'],
+                                 batch_size)
+    print(f"purged {purged} lists and items from the trash")
+
+
+@manager.option('-i', '--interval', dest='interval', type=float, default=1,
+                help='seconds to wait for new tasks when there are none')
+@manager.option('--burst', dest='burst', action='store_true',
+                help='exit once there are no tasks left to run')
+def run_tasks(interval=1, burst=False):
+    """Runs the background tasks stored with TASKS_BACKEND = 'database'"""
+    executor = DatabaseExecutor(app, app.config['TASKS_CLAIM_TIMEOUT'],
+                                app.config['TASKS_MAX_ATTEMPTS'])
+    while True:
+        succeeded = executor.run_pending()
+        if succeeded:
+            print(f"ran {succeeded} background tasks")
+        if burst:
+            return
+        time.sleep(interval)
+
+
+@manager.command
+def create_shards():
+    """Creates the tables of the lists on every one of the SHARD_BINDS"""
+    init_shards()
+    print(f"created the tables on {len(app.config['SHARD_BINDS'])} shards")
+
+
+@manager.option('-u', '--user-id', dest='user_id', type=int, required=True,
+                help='ID of the user whose lists are moved')
+@manager.option('-t', '--to', dest='target', required=True,
+                help='the shard, one of SHARD_BINDS, to move the lists to')
+@manager.option('-w', '--wait', dest='grace_seconds', type=float, default=5,
+                help='seconds for the writes in flight to finish')
+def rebalance(user_id, target, grace_seconds=5):
+    """Moves a user's lists to another shard while the API keeps running"""
+    moved = move_user(user_id, target, grace_seconds)
+    print(f"moved {moved} rows of user {user_id} to {target}")
+
+
+class ImportCommand(Command):
+    """Imports shoppinglists and items from a CSV or NDJSON file"""
+
+    option_list = (
+        Option('path', help='the CSV or NDJSON file to import'),
+        Option('-e', '--email', dest='email', required=True,
+               help='email of the user that the lists are imported for'),
+        Option('-f', '--format', dest='file_format', default=None,
+               help='csv or ndjson, taken from the file extension by default'),
+        Option('-c', '--chunk-size', dest='chunk_size', type=int,
+               default=500, help='number of rows written at a time'),
+    )
+
+    def run(self, path, email, file_format=None, chunk_size=500):
+        user = User.query.filter_by(email=email).first()
+        if user is None:
+            print(f"no user has the email {email}")
+            return
+        if file_format is None:
+            file_format = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+        use_shard(user.id)
+        with open(path, 'rb') as import_file:
+            report = import_shoppinglists(user.id, import_file, file_format,
+                                          chunk_size)
+        print(f"imported {report.lists_created} shoppinglists and "
+              f"{report.items_created} items, rejected {report.rejected} rows")
+        for error in report.errors:
+            print(f"line {error['line']}: {error['message']}")
+
+
+manager.add_command('import', ImportCommand())
+
+
 if __name__ == "__main__":
     manager.run()
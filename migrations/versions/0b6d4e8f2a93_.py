@@ -0,0 +1,43 @@
+"""make names and emails unique in the database
+
+Revision ID: 0b6d4e8f2a93
+Revises: e7b3f19a5c82
+Create Date: 2026-10-19 21:40:52.618304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b6d4e8f2a93'
+down_revision = 'e7b3f19a5c82'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # duplicates that got past the old checks keep their oldest row's name
+    # and have their ID appended to the others
+    op.execute("""
+        UPDATE shoppinglists SET name = name || ' (' || id || ')'
+        WHERE id NOT IN (SELECT min(id) FROM shoppinglists
+                         GROUP BY user_id, name)
+    """)
+    op.execute("""
+        UPDATE items SET name = name || ' (' || id || ')'
+        WHERE id NOT IN (SELECT min(id) FROM items
+                         GROUP BY shoppinglist_id, name)
+    """)
+    op.create_unique_constraint('uq_shoppinglists_user_id_name',
+                                'shoppinglists', ['user_id', 'name'])
+    op.create_unique_constraint('uq_items_shoppinglist_id_name',
+                                'items', ['shoppinglist_id', 'name'])
+    op.create_index('uq_users_lower_email', 'users',
+                    [sa.text('lower(email)')], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_users_lower_email', table_name='users')
+    op.drop_constraint('uq_items_shoppinglist_id_name', 'items')
+    op.drop_constraint('uq_shoppinglists_user_id_name', 'shoppinglists')
@@ -0,0 +1,35 @@
+"""store background tasks for out of process workers
+
+Revision ID: 1c8f5b2e7a64
+Revises: 6a3e9c1b7d52
+Create Date: 2026-10-20 00:12:05.381942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c8f5b2e7a64'
+down_revision = '6a3e9c1b7d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'background_tasks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('arguments', sa.Text(), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0',
+                  nullable=False),
+        sa.Column('claimed_at', sa.DateTime(), nullable=True),
+        sa.Column('date_created', sa.DateTime(),
+                  server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('background_tasks')
@@ -0,0 +1,38 @@
+"""stamp synced rows with the transaction that changed them
+
+Revision ID: 2f6d9b4e8a31
+Revises: 7e4b2d9f6c18
+Create Date: 2026-10-20 09:31:05.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f6d9b4e8a31'
+down_revision = '7e4b2d9f6c18'
+branch_labels = None
+depends_on = None
+
+# (table, owner column) of the rows that are synced
+SYNCED_TABLES = (('shoppinglists', 'user_id'), ('items', 'shoppinglist_id'),
+                 ('tombstones', 'user_id'))
+
+
+def upgrade():
+    for table, owner in SYNCED_TABLES:
+        op.add_column(table, sa.Column(
+            'change_txid', sa.BigInteger(), nullable=False,
+            server_default=sa.text('txid_current()')))
+        op.drop_index(f'ix_{table}_{owner}_change_seq', table_name=table)
+        op.create_index(f'ix_{table}_{owner}_change_txid', table,
+                        [owner, 'change_txid', 'change_seq'], unique=False)
+
+
+def downgrade():
+    for table, owner in reversed(SYNCED_TABLES):
+        op.drop_index(f'ix_{table}_{owner}_change_txid', table_name=table)
+        op.create_index(f'ix_{table}_{owner}_change_seq', table,
+                        [owner, 'change_seq'], unique=False)
+        op.drop_column(table, 'change_txid')
@@ -0,0 +1,53 @@
+"""add change sequence and tombstones for delta sync
+
+Revision ID: 3c9a1f7d2e41
+Revises: bfea684aecf2
+Create Date: 2026-10-19 09:12:41.218733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a1f7d2e41'
+down_revision = 'bfea684aecf2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.schema.CreateSequence(sa.Sequence('change_sequence')))
+    op.add_column('shoppinglists', sa.Column(
+        'change_seq', sa.BigInteger(), nullable=False,
+        server_default=sa.text("nextval('change_sequence')")))
+    op.add_column('items', sa.Column(
+        'change_seq', sa.BigInteger(), nullable=False,
+        server_default=sa.text("nextval('change_sequence')")))
+    op.create_index('ix_shoppinglists_user_id_change_seq', 'shoppinglists',
+                    ['user_id', 'change_seq'], unique=False)
+    op.create_index('ix_items_shoppinglist_id_change_seq', 'items',
+                    ['shoppinglist_id', 'change_seq'], unique=False)
+    op.create_table('tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('object_type', sa.String(), nullable=False),
+    sa.Column('object_id', sa.Integer(), nullable=False),
+    sa.Column('change_seq', sa.BigInteger(), nullable=False,
+              server_default=sa.text("nextval('change_sequence')")),
+    sa.Column('date_deleted', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstones_user_id_change_seq', 'tombstones',
+                    ['user_id', 'change_seq'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tombstones_user_id_change_seq', table_name='tombstones')
+    op.drop_table('tombstones')
+    op.drop_index('ix_items_shoppinglist_id_change_seq', table_name='items')
+    op.drop_index('ix_shoppinglists_user_id_change_seq',
+                  table_name='shoppinglists')
+    op.drop_column('items', 'change_seq')
+    op.drop_column('shoppinglists', 'change_seq')
+    op.execute(sa.schema.DropSequence(sa.Sequence('change_sequence')))
@@ -0,0 +1,37 @@
+"""cascade the deletion of users and shoppinglists in the database
+
+Revision ID: 4f1a8c6d3e57
+Revises: 0b6d4e8f2a93
+Create Date: 2026-10-19 22:26:08.441970
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1a8c6d3e57'
+down_revision = '0b6d4e8f2a93'
+branch_labels = None
+depends_on = None
+
+# (constraint, table, column, referred table)
+FOREIGN_KEYS = (
+    ('shoppinglists_user_id_fkey', 'shoppinglists', 'user_id', 'users'),
+    ('items_shoppinglist_id_fkey', 'items', 'shoppinglist_id',
+     'shoppinglists'),
+)
+
+
+def replace_foreign_keys(ondelete):
+    for name, table, column, referred_table in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred_table, [column], ['id'],
+                              ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
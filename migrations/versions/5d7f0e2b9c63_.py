@@ -0,0 +1,43 @@
+"""add shard assignments and a checkpoint per shard
+
+Revision ID: 5d7f0e2b9c63
+Revises: 8e2b5d0c4a17
+Create Date: 2026-10-19 18:41:05.218330
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d7f0e2b9c63'
+down_revision = '8e2b5d0c4a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('shard_assignments',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.String(), nullable=False),
+    sa.Column('is_moving', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.add_column('reminder_checkpoints',
+                  sa.Column('shard', sa.String(), server_default='',
+                            nullable=False))
+    op.drop_constraint('reminder_checkpoints_pkey', 'reminder_checkpoints',
+                       type_='primary')
+    op.create_primary_key('reminder_checkpoints_pkey', 'reminder_checkpoints',
+                          ['notify_date', 'shard'])
+
+
+def downgrade():
+    op.execute("DELETE FROM reminder_checkpoints WHERE shard != ''")
+    op.drop_constraint('reminder_checkpoints_pkey', 'reminder_checkpoints',
+                       type_='primary')
+    op.create_primary_key('reminder_checkpoints_pkey', 'reminder_checkpoints',
+                          ['notify_date'])
+    op.drop_column('reminder_checkpoints', 'shard')
+    op.drop_table('shard_assignments')
@@ -0,0 +1,47 @@
+"""move deleted lists and items to a trash they can be restored from
+
+Revision ID: 6a3e9c1b7d52
+Revises: 9d2c5a7e1f40
+Create Date: 2026-10-19 23:31:47.205816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a3e9c1b7d52'
+down_revision = '9d2c5a7e1f40'
+branch_labels = None
+depends_on = None
+
+# (unique index, table, columns)
+UNIQUE_NAMES = (
+    ('uq_shoppinglists_user_id_name', 'shoppinglists', ['user_id', 'name']),
+    ('uq_items_shoppinglist_id_name', 'items', ['shoppinglist_id', 'name']),
+)
+
+
+def upgrade():
+    for _, table, _ in UNIQUE_NAMES:
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(),
+                                       nullable=True))
+        op.create_index(f'ix_{table}_deleted_at', table, ['deleted_at'],
+                        postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    # a name is only taken by the lists and items that aren't in the trash
+    for name, table, columns in UNIQUE_NAMES:
+        op.drop_constraint(name, table)
+        op.create_index(name, table, columns, unique=True,
+                        postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade():
+    # there is no trash to restore from anymore
+    op.execute("DELETE FROM items WHERE deleted_at IS NOT NULL")
+    op.execute("DELETE FROM shoppinglists WHERE deleted_at IS NOT NULL")
+    for name, table, columns in UNIQUE_NAMES:
+        op.drop_index(name, table_name=table)
+        op.create_unique_constraint(name, table, columns)
+    for _, table, _ in UNIQUE_NAMES:
+        op.drop_index(f'ix_{table}_deleted_at', table_name=table)
+        op.drop_column(table, 'deleted_at')
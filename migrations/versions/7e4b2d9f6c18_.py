@@ -0,0 +1,36 @@
+"""record the changes users make to their lists in an audit log
+
+Revision ID: 7e4b2d9f6c18
+Revises: 1c8f5b2e7a64
+Create Date: 2026-10-20 00:47:19.664103
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e4b2d9f6c18'
+down_revision = '1c8f5b2e7a64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'audit_log',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('action', sa.String(), nullable=False),
+        sa.Column('object_type', sa.String(), nullable=False),
+        sa.Column('object_id', sa.Integer(), nullable=False),
+        sa.Column('shoppinglist_id', sa.Integer(), nullable=False),
+        sa.Column('date_created', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_audit_log_user_id_id', 'audit_log', ['user_id', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_audit_log_user_id_id', table_name='audit_log')
+    op.drop_table('audit_log')
@@ -0,0 +1,32 @@
+"""index notify_date and add reminder checkpoints
+
+Revision ID: 8e2b5d0c4a17
+Revises: 3c9a1f7d2e41
+Create Date: 2026-10-19 11:02:17.540912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2b5d0c4a17'
+down_revision = '3c9a1f7d2e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shoppinglists_notify_date_user_id', 'shoppinglists',
+                    ['notify_date', 'user_id', 'id'], unique=False)
+    op.create_table('reminder_checkpoints',
+    sa.Column('notify_date', sa.Date(), nullable=False),
+    sa.Column('last_user_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('notify_date')
+    )
+
+
+def downgrade():
+    op.drop_table('reminder_checkpoints')
+    op.drop_index('ix_shoppinglists_notify_date_user_id',
+                  table_name='shoppinglists')
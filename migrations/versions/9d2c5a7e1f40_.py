@@ -0,0 +1,25 @@
+"""let users delete their accounts
+
+Revision ID: 9d2c5a7e1f40
+Revises: 4f1a8c6d3e57
+Create Date: 2026-10-19 22:58:31.092716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2c5a7e1f40'
+down_revision = '4f1a8c6d3e57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('disabled_at', sa.DateTime(),
+                                     nullable=True))
+
+
+def downgrade():
+    op.drop_column('users', 'disabled_at')
@@ -0,0 +1,30 @@
+"""add a version to shoppinglists and items
+
+Revision ID: a4c81e6f3b25
+Revises: 5d7f0e2b9c63
+Create Date: 2026-10-19 19:12:44.903127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c81e6f3b25'
+down_revision = '5d7f0e2b9c63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shoppinglists',
+                  sa.Column('version', sa.Integer(), server_default='1',
+                            nullable=False))
+    op.add_column('items',
+                  sa.Column('version', sa.Integer(), server_default='1',
+                            nullable=False))
+
+
+def downgrade():
+    op.drop_column('items', 'version')
+    op.drop_column('shoppinglists', 'version')
@@ -0,0 +1,41 @@
+"""hold coalesced has_been_bought changes in a table every worker sees
+
+Revision ID: b5e1c7a3d920
+Revises: 2f6d9b4e8a31
+Create Date: 2026-10-20 10:12:44.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e1c7a3d920'
+down_revision = '2f6d9b4e8a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'pending_bought_states',
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('shoppinglist_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('has_been_bought', sa.Boolean(), nullable=True),
+        sa.Column('toggled', sa.Boolean(), nullable=False),
+        sa.Column('date_created', sa.DateTime(), nullable=False,
+                  server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['item_id'], ['items.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('item_id')
+    )
+    op.create_index('ix_pending_bought_states_user_id_shoppinglist_id',
+                    'pending_bought_states', ['user_id', 'shoppinglist_id'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_pending_bought_states_user_id_shoppinglist_id',
+                  table_name='pending_bought_states')
+    op.drop_table('pending_bought_states')
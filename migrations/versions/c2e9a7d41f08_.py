@@ -0,0 +1,40 @@
+"""add idempotency keys
+
+Revision ID: c2e9a7d41f08
+Revises: a4c81e6f3b25
+Create Date: 2026-10-19 19:48:30.562114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e9a7d41f08'
+down_revision = 'a4c81e6f3b25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotency_keys',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('fingerprint', sa.String(length=64), nullable=False),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('body', sa.Text(), nullable=True),
+    sa.Column('date_created', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'key',
+                        name='uq_idempotency_keys_user_id_key')
+    )
+    op.create_index('ix_idempotency_keys_date_created', 'idempotency_keys',
+                    ['date_created'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_keys_date_created',
+                  table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,31 @@
+"""page the audit log in the order its entries were committed
+
+Revision ID: d4a8c2f61b57
+Revises: b5e1c7a3d920
+Create Date: 2026-10-20 11:02:17.204561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8c2f61b57'
+down_revision = 'b5e1c7a3d920'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('audit_log', sa.Column(
+        'txid', sa.BigInteger(), nullable=False,
+        server_default=sa.text('txid_current()')))
+    op.drop_index('ix_audit_log_user_id_id', table_name='audit_log')
+    op.create_index('ix_audit_log_user_id_txid', 'audit_log',
+                    ['user_id', 'txid', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_audit_log_user_id_txid', table_name='audit_log')
+    op.create_index('ix_audit_log_user_id_id', 'audit_log', ['user_id', 'id'])
+    op.drop_column('audit_log', 'txid')
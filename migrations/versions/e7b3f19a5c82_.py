@@ -0,0 +1,32 @@
+"""let the database timestamp users, shoppinglists and items
+
+Revision ID: e7b3f19a5c82
+Revises: c2e9a7d41f08
+Create Date: 2026-10-19 21:04:17.215839
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3f19a5c82'
+down_revision = 'c2e9a7d41f08'
+branch_labels = None
+depends_on = None
+
+TIMESTAMPS = (('users', 'date_added'),
+              ('shoppinglists', 'date_created'),
+              ('shoppinglists', 'date_modified'),
+              ('items', 'date_added'),
+              ('items', 'date_modified'))
+
+
+def upgrade():
+    for table, column in TIMESTAMPS:
+        op.alter_column(table, column, server_default=sa.func.now())
+
+
+def downgrade():
+    for table, column in TIMESTAMPS:
+        op.alter_column(table, column, server_default=None)
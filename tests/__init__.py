@@ -1,3 +1,4 @@
+import json
 import unittest
 from app import create_app, db
 
@@ -12,6 +13,14 @@ class BaseTests(unittest.TestCase):
         db.create_all()
         self.user_data = dict(email="testor@example.com", password="!0ctoPus")
 
+    def login(self, user_data=None):
+        """ registers and logs in <user_data>, the test user by default, and
+        returns their token"""
+        user_data = user_data or self.user_data
+        self.test_client.post("/api/v1/auth/register", data=user_data)
+        resp = self.test_client.post("/api/v1/auth/login", data=user_data)
+        return json.loads(resp.data)['token']
+
     def tearDown(self):
         db.session.remove()
         db.drop_all()
@@ -0,0 +1,77 @@
+import json
+from tests import BaseTests
+from app import db
+from app.models import User, ShoppingList, Item, Tombstone, AuditEntry
+from app.accounts import purge_account, purge_disabled_accounts
+
+
+class TestAccountDeletion(BaseTests):
+    """ Tests for users deleting their accounts"""
+
+    def setUp(self):
+        super().setUp()
+        self.headers = self.login(self.user_data)
+        self.test_client.post(
+            "/api/v1/shoppinglists", headers=self.headers,
+            data={"name": "groceries", "notify_date": "2018-03-14"})
+        for name in ("beans", "rice", "salt"):
+            self.test_client.post(
+                "/api/v1/shoppinglists/1/items", headers=self.headers,
+                data=dict(name=name, price='3,500/=', quantity='1 kg'))
+        self.test_client.delete(
+            "/api/v1/shoppinglists/1/items/3", headers=self.headers)
+
+    def login(self, user_data):
+        self.test_client.post("/api/v1/auth/register", data=user_data)
+        resp = self.test_client.post("/api/v1/auth/login", data=user_data)
+        return {'Authorization': f'Bearer {json.loads(resp.data)["token"]}'}
+
+    def test_a_deleted_account_is_disabled_then_purged(self):
+        self.app.extensions['audit'].flush()
+        self.assertNotEqual(AuditEntry.query.count(), 0)
+        resp = self.test_client.delete(
+            "/api/v1/auth/account", headers=self.headers)
+        self.assertEqual(resp.status_code, 202)
+
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists", headers=self.headers)
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(json.loads(resp.data)['message'],
+                         "this account has been deleted")
+
+        # background tasks are run before the response in the tests
+        db.session.remove()
+        self.assertEqual(User.query.count(), 0)
+        self.assertEqual(ShoppingList.query.count(), 0)
+        self.assertEqual(Item.query.count(), 0)
+        self.assertEqual(Tombstone.query.count(), 0)
+        self.assertEqual(AuditEntry.query.count(), 0)
+
+        # the email can be registered again
+        resp = self.test_client.post(
+            "/api/v1/auth/register", data=self.user_data)
+        self.assertEqual(resp.status_code, 201)
+
+    def test_a_disabled_account_cannot_log_in(self):
+        User.query.get(1).disabled_at = db.func.now()
+        db.session.commit()
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.assertEqual(resp.status_code, 403)
+
+    def test_accounts_are_purged_in_batches(self):
+        headers = self.login(dict(email="other@example.com",
+                                  password="!0ctoPus"))
+        self.test_client.post(
+            "/api/v1/shoppinglists", headers=headers,
+            data={"name": "groceries", "notify_date": "2018-03-14"})
+
+        User.query.get(1).disabled_at = db.func.now()
+        db.session.commit()
+        # 2 items, 1 list, 1 tombstone and the user
+        self.assertEqual(purge_account(1, batch_size=1), 5)
+        self.assertEqual(purge_disabled_accounts(), 0)
+
+        self.assertEqual([user.email for user in User.query.all()],
+                         ["other@example.com"])
+        self.assertEqual(ShoppingList.query.count(), 1)
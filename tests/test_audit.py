@@ -0,0 +1,137 @@
+import json
+import time
+from datetime import datetime
+from sqlalchemy import event
+from tests import BaseTests
+from app import db
+from app.audit import AuditLog
+from app.models import AuditEntry
+
+
+class TestAuditLog(BaseTests):
+    """ Tests for the log of the changes users make to their lists"""
+
+    def setUp(self):
+        super().setUp()
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.headers = {
+            'Authorization': f'Bearer {json.loads(resp.data)["token"]}'}
+
+    def add_list(self, name):
+        return self.test_client.post(
+            "/api/v1/shoppinglists", headers=self.headers,
+            data={"name": name, "notify_date": "2018-03-14"})
+
+    def get_log(self, query=''):
+        resp = self.test_client.get(f"/api/v1/audit{query}",
+                                    headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(resp.data)
+
+    def test_committed_changes_are_logged(self):
+        self.add_list("groceries")
+        self.test_client.post(
+            "/api/v1/shoppinglists/1/items", headers=self.headers,
+            data=dict(name="beans", price='3,500/=', quantity='1 kg'))
+        self.test_client.patch("/api/v1/shoppinglists/1/items/1",
+                               headers=self.headers, data={"status": "true"})
+        self.test_client.delete("/api/v1/shoppinglists/1",
+                                headers=self.headers)
+        # a duplicate is rolled back, so nothing happened
+        self.assertEqual(self.add_list("groceries").status_code, 201)
+        self.assertEqual(self.add_list("groceries").status_code, 409)
+
+        log = self.get_log()
+        self.assertEqual(
+            [(entry['action'], entry['type'], entry['object_id'])
+             for entry in log['entries']],
+            [("created", "shoppinglist", 1), ("created", "item", 1),
+             ("updated", "item", 1), ("deleted", "shoppinglist", 1),
+             ("created", "shoppinglist", 2)])
+        self.assertEqual(log['entries'][1]['shoppinglist_id'], 1)
+        self.assertFalse(log['has_more'])
+
+    def test_the_log_is_paged_by_cursor(self):
+        for name in ("groceries", "furniture", "cars"):
+            self.add_list(name)
+        first_page = self.get_log("?limit=2")
+        self.assertEqual([entry['object_id']
+                          for entry in first_page['entries']], [1, 2])
+        self.assertTrue(first_page['has_more'])
+
+        last_page = self.get_log(f"?limit=2&after={first_page['cursor']}")
+        self.assertEqual([entry['object_id']
+                          for entry in last_page['entries']], [3])
+        self.assertFalse(last_page['has_more'])
+
+        resp = self.test_client.get("/api/v1/audit?after=one",
+                                    headers=self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_entries_committed_late_are_not_skipped(self):
+        # another worker takes an ID for its batch first but commits last
+        slow = db.engine.connect()
+        transaction = slow.begin()
+        slow.execute(AuditEntry.__table__.insert().values(
+            user_id=1, action="created", object_type="shoppinglist",
+            object_id=1, shoppinglist_id=1, date_created=datetime.now()))
+        try:
+            self.add_list("groceries")
+            page = self.get_log()
+            self.assertEqual(page['entries'], [])
+            transaction.commit()
+        finally:
+            slow.close()
+
+        page = self.get_log(f"?after={page['cursor']}")
+        self.assertEqual([entry['id'] for entry in page['entries']], [1, 2])
+
+    def test_integer_cursors_start_over(self):
+        self.add_list("groceries")
+        self.assertEqual(len(self.get_log("?after=42")['entries']), 1)
+
+    def test_users_only_see_their_own_changes(self):
+        self.add_list("groceries")
+        self.test_client.post("/api/v1/auth/register", data=dict(
+            email="other@example.com", password="!0ctoPus"))
+        resp = self.test_client.post("/api/v1/auth/login", data=dict(
+            email="other@example.com", password="!0ctoPus"))
+        self.headers = {
+            'Authorization': f'Bearer {json.loads(resp.data)["token"]}'}
+        self.assertEqual(self.get_log()['entries'], [])
+
+    def test_changes_are_written_in_batches(self):
+        audit_log = AuditLog(self.app, flush_interval=0, flush_events=3)
+        self.app.extensions['audit'] = audit_log
+        statements = []
+
+        def log_statement(conn, cursor, statement, *args):
+            if "INSERT INTO audit_log" in statement:
+                statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', log_statement)
+        try:
+            for name in ("groceries", "furniture"):
+                self.add_list(name)
+            self.assertEqual(AuditEntry.query.count(), 0)
+            self.add_list("cars")
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', log_statement)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(AuditEntry.query.count(), 3)
+
+
+class TestAuditLogFlusher(BaseTests):
+    """ Tests for writing the audit log from a background thread"""
+
+    def test_changes_are_written_every_interval(self):
+        audit_log = AuditLog(self.app, flush_interval=0.05, flush_events=100)
+        audit_log.record(1, {"action": "created", "type": "shoppinglist",
+                             "id": 1, "shoppinglist_id": 1})
+        self.assertIsNotNone(audit_log.flusher)
+        for _ in range(100):
+            if AuditEntry.query.count():
+                break
+            time.sleep(0.01)
+        self.assertEqual(AuditEntry.query.count(), 1)
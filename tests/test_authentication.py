@@ -1,6 +1,12 @@
 import json
 import time
+from unittest import mock
+
+from prometheus_client import REGISTRY
+from sqlalchemy import event
 from tests import BaseTests
+from app import db
+from app.models import User, BlacklistToken
 
 
 class TestRegisterUserAPI(BaseTests):
@@ -127,6 +133,47 @@ class TestLogin(BaseTests):
             "you need to enter both the email and the password"
         )
 
+    def test_login_is_locked_out_after_repeated_failures(self):
+        self.app.config['LOGIN_MAX_FAILURES_PER_ACCOUNT'] = 2
+        self.test_client.post(
+            "/api/v1/auth/register", data=self.user_data)
+        wrong_password = dict(email='testor@example.com', password='1234567')
+
+        for _ in range(2):
+            resp = self.test_client.post(
+                "/api/v1/auth/login", data=wrong_password)
+            self.assertEqual(resp.status_code, 403)
+
+        # even the right password is refused until the lockout is over
+        with mock.patch.object(User, 'validate_password') as validate:
+            resp = self.test_client.post(
+                "/api/v1/auth/login", data=self.user_data)
+            validate.assert_not_called()
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.headers['Retry-After'], '30')
+        data = json.loads(resp.data)
+        self.assertEqual(data["status"], "failure")
+        self.assertEqual(
+            data["message"],
+            "too many failed login attempts, retry in 30 seconds")
+
+    def test_login_lockouts_are_counted_in_a_metric(self):
+        self.app.config['LOGIN_MAX_FAILURES_PER_IP'] = 1
+        before = REGISTRY.get_sample_value(
+            'login_lockouts_total', {'scope': 'ip'}) or 0
+
+        resp = self.test_client.post(
+            "/api/v1/auth/login",
+            data=dict(email='nobody@example.com', password='1234567'))
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(REGISTRY.get_sample_value(
+            'login_lockouts_total', {'scope': 'ip'}), before + 1)
+
+        # the lockout covers every account tried from that IP
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.assertEqual(resp.status_code, 429)
+
 
 class TestLogout(BaseTests):
     """ Handles all Test operations related to user Logout """
@@ -258,6 +305,40 @@ class TestLogout(BaseTests):
             data["message"], 'token has already expired: please re-login')
 
 
+    def test_logout_fails_if_the_token_cannot_be_blacklisted(self):
+        token = self.login()
+        with mock.patch.object(BlacklistToken, 'save', return_value=False):
+            resp = self.test_client.post(
+                "/api/v1/auth/logout",
+                headers=dict(Authorization=f"Bearer {token}"))
+        self.assertEqual(resp.status_code, 500)
+        data = json.loads(resp.data)
+        self.assertEqual(data["status"], "failure")
+        self.assertEqual(data["message"],
+                         "the token could not be revoked, please try again")
+
+    def test_a_token_is_checked_in_a_single_query(self):
+        self.test_client.post(
+            "/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login",
+            data=self.user_data)
+        token = json.loads(resp.data)['token']
+        statements = []
+
+        def log_statement(conn, cursor, statement, *args):
+            if "blacklisted_tokens" in statement or "users" in statement:
+                statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', log_statement)
+        try:
+            resp = self.test_client.get(
+                "/api/v1/shoppinglists",
+                headers=dict(Authorization=f"Bearer {token}"))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', log_statement)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(statements), 1)
+
 class TestResetPassword(BaseTests):
     """ Handles all Test operations related to
     restting a user's password"""
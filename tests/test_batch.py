@@ -0,0 +1,94 @@
+import json
+from tests import BaseTests
+from app.models import ShoppingList, Item
+
+
+class TestBatch(BaseTests):
+    """ Tests for running several requests in one batch"""
+
+    def setUp(self):
+        super().setUp()
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.token = json.loads(resp.data)['token']
+
+    def post_batch(self, payload, token=None):
+        return self.test_client.post(
+            "/api/v1/batch", data=json.dumps(payload),
+            content_type="application/json",
+            headers={'Authorization': f'Bearer {token or self.token}'})
+
+    def test_sub_requests_are_run_in_order(self):
+        resp = self.post_batch([
+            {"method": "POST", "path": "/api/v1/shoppinglists",
+             "body": {"name": "groceries", "notify_date": "2018-03-14"}},
+            {"method": "POST", "path": "/api/v1/shoppinglists/1/items",
+             "body": {"name": "beans", "price": "3,500/=",
+                      "quantity": "1 kg"}},
+            {"method": "GET", "path": "/api/v1/shoppinglists/1"},
+            {"method": "GET", "path": "/api/v1/shoppinglists/9"}])
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data['status'], 'success')
+        statuses = [response['status'] for response in data['responses']]
+        self.assertEqual(statuses, [201, 201, 200, 404])
+        self.assertEqual(data['responses'][2]['body']['name'], 'groceries')
+        self.assertIn('ETag', data['responses'][2]['headers'])
+
+        # without a transaction, a failed request leaves the others be
+        self.assertEqual(ShoppingList.query.count(), 1)
+        self.assertEqual(Item.query.count(), 1)
+
+    def test_a_transaction_is_committed_when_every_request_succeeds(self):
+        resp = self.post_batch({"transaction": True, "requests": [
+            {"method": "POST", "path": "/api/v1/shoppinglists",
+             "body": {"name": "groceries", "notify_date": "2018-03-14"}},
+            {"method": "POST", "path": "/api/v1/shoppinglists/1/items",
+             "body": {"name": "beans", "price": "3,500/=",
+                      "quantity": "1 kg"}}]})
+        data = json.loads(resp.data)
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(ShoppingList.query.count(), 1)
+        self.assertEqual(Item.query.count(), 1)
+
+    def test_a_failed_request_rolls_the_transaction_back(self):
+        resp = self.post_batch({"transaction": True, "requests": [
+            {"method": "POST", "path": "/api/v1/shoppinglists",
+             "body": {"name": "groceries", "notify_date": "2018-03-14"}},
+            {"method": "POST", "path": "/api/v1/shoppinglists",
+             "body": {"name": "groceries", "notify_date": "2018-03-14"}},
+            {"method": "POST", "path": "/api/v1/shoppinglists",
+             "body": {"name": "hardware", "notify_date": "2018-03-14"}}]})
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data['status'], 'failure')
+        statuses = [response['status'] for response in data['responses']]
+        self.assertEqual(statuses, [201, 409])
+        self.assertEqual(ShoppingList.query.count(), 0)
+
+        # the session is usable again afterwards
+        resp = self.post_batch([{"method": "GET",
+                                 "path": "/api/v1/shoppinglists"}])
+        self.assertEqual(json.loads(resp.data)['responses'][0]['status'], 200)
+
+    def test_malformed_batches_are_refused(self):
+        for payload in ({"requests": []},
+                        [{"method": "HEAD", "path": "/api/v1/shoppinglists"}],
+                        [{"method": "GET", "path": "/api/v1/batch"}],
+                        [{"method": "GET", "path": "/api/v1/export"}],
+                        [{"method": "GET", "path": "/api/v1/export/"}],
+                        [{"method": "POST", "path": "/api/v1/import"}],
+                        [{"method": "GET", "path": "http://example.com/"}],
+                        [{"method": "POST", "path": "/api/v1/shoppinglists",
+                          "body": ["name"]}],
+                        [{"method": "GET", "path": "/api/v1/shoppinglists"}]
+                        * 21):
+            resp = self.post_batch(payload)
+            self.assertEqual(resp.status_code, 400, payload)
+
+    def test_a_batch_needs_a_valid_token(self):
+        resp = self.post_batch(
+            [{"method": "GET", "path": "/api/v1/shoppinglists"}],
+            token="invalid")
+        self.assertIn(resp.status_code, (401, 403))
@@ -0,0 +1,207 @@
+import json
+from sqlalchemy import event
+from tests import BaseTests
+from app import create_app, db
+from app.coalescing import BoughtStateBuffer
+from app.models import Item, PendingBoughtState
+
+
+class TestCoalescing(BaseTests):
+    """ Tests for coalescing the has_been_bought changes of a list"""
+
+    def setUp(self):
+        super().setUp()
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.headers = {
+            'Authorization': f'Bearer {json.loads(resp.data)["token"]}'}
+        self.test_client.post(
+            "/api/v1/shoppinglists", headers=self.headers,
+            data={"name": "groceries", "notify_date": "2018-03-14"})
+        for name in ("beans", "rice"):
+            self.test_client.post(
+                "/api/v1/shoppinglists/1/items", headers=self.headers,
+                data=dict(name=name, price='3,500/=', quantity='1 kg'))
+        self.buffer = self.app.extensions['bought_state']
+
+    def set_status(self, item_id, status, **headers):
+        return self.test_client.patch(
+            f"/api/v1/shoppinglists/1/items/{item_id}", data={"status": status},
+            headers=dict(self.headers, Prefer="respond-async", **headers))
+
+    def stored_states(self):
+        db.session.expire_all()
+        return [(item.has_been_bought, item.version)
+                for item in Item.query.order_by(Item.id)]
+
+    def held_states(self):
+        return [(state.item_id, state.has_been_bought, state.toggled)
+                for state in PendingBoughtState.query.order_by(
+                    PendingBoughtState.item_id)]
+
+    def test_held_states_are_combined(self):
+        self.set_status(1, "toggle")
+        self.set_status(2, "true")
+        self.assertEqual(self.held_states(),
+                         [(1, None, True), (2, True, False)])
+        self.set_status(1, "toggle")
+        self.set_status(2, "toggle")
+        self.assertEqual(self.held_states(),
+                         [(1, None, False), (2, True, True)])
+        self.set_status(2, "true")
+        self.assertEqual(self.held_states(),
+                         [(1, None, False), (2, True, False)])
+
+    def test_changes_are_held_and_written_once_before_a_read(self):
+        for status in ("toggle", "toggle", "toggle"):
+            resp = self.set_status(1, status)
+            self.assertEqual(resp.status_code, 202)
+            self.assertEqual(resp.headers['Preference-Applied'],
+                             'respond-async')
+        self.set_status(2, "true")
+        self.set_status(2, "false")
+        self.assertEqual(self.stored_states(), [(False, 1), (False, 1)])
+
+        updates = []
+
+        def log_statement(conn, cursor, statement, *args):
+            if statement.lstrip().startswith("UPDATE items"):
+                updates.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', log_statement)
+        try:
+            resp = self.test_client.get("/api/v1/shoppinglists/1/items",
+                                        headers=self.headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', log_statement)
+        self.assertEqual(len(updates), 1)
+        self.assertEqual([item['has_been_bought']
+                          for item in json.loads(resp.data)['items']],
+                         [True, False])
+        # the item that ended up as it was isn't touched
+        self.assertEqual(self.stored_states(), [(True, 2), (False, 1)])
+
+    def test_toggling_twice_writes_nothing(self):
+        self.set_status(1, "toggle")
+        self.set_status(1, "toggle")
+        resp = self.test_client.get("/api/v1/shoppinglists/1/items/1",
+                                    headers=self.headers)
+        self.assertFalse(json.loads(resp.data)['has_been_bought'])
+        self.assertEqual(self.stored_states(), [(False, 1), (False, 1)])
+
+    def test_edits_and_deletes_see_the_held_changes_first(self):
+        self.set_status(1, "toggle")
+        resp = self.test_client.patch(
+            "/api/v1/shoppinglists/1/items/1", headers=self.headers,
+            data={"status": "toggle"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(json.loads(resp.data)['data']['has_been_bought'])
+
+        self.set_status(2, "true")
+        self.test_client.delete("/api/v1/shoppinglists/1",
+                                headers=self.headers)
+        self.assertEqual(self.stored_states()[1][0], True)
+
+    def test_held_changes_are_written_once_the_window_is_over(self):
+        self.buffer.window = 0
+        self.set_status(1, "true")
+        self.assertEqual(self.stored_states()[0], (True, 2))
+
+    def test_held_changes_are_kept_if_they_cannot_be_written(self):
+        self.set_status(1, "true")
+
+        def fail_update(conn, cursor, statement, *args):
+            if statement.lstrip().startswith("UPDATE items"):
+                raise RuntimeError("the database went away")
+        event.listen(db.engine, 'before_cursor_execute', fail_update)
+        try:
+            self.buffer.flush_all()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', fail_update)
+        self.assertEqual(self.held_states(), [(1, True, False)])
+        self.assertEqual(self.stored_states()[0], (False, 1))
+
+        resp = self.test_client.get("/api/v1/shoppinglists/1/items/1",
+                                    headers=self.headers)
+        self.assertTrue(json.loads(resp.data)['has_been_bought'])
+
+    def test_held_changes_are_written_by_every_worker(self):
+        self.set_status(1, "true")
+        # another process has a buffer of its own
+        other_worker = create_app("testing")
+        other_worker.extensions['bought_state'].flush_all()
+        self.assertEqual(self.stored_states()[0], (True, 2))
+
+    def test_reads_only_look_for_the_changes_this_worker_held(self):
+        statements = []
+
+        def log_statement(conn, cursor, statement, *args):
+            if "pending_bought_states" in statement:
+                statements.append(statement)
+
+        def read_items():
+            del statements[:]
+            event.listen(db.engine, 'before_cursor_execute', log_statement)
+            try:
+                resp = self.test_client.get(
+                    "/api/v1/shoppinglists/1/items", headers=self.headers)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute',
+                             log_statement)
+            return [item['has_been_bought']
+                    for item in json.loads(resp.data)['items']]
+
+        self.assertEqual(read_items(), [False, False])
+        self.assertEqual(statements, [])
+        self.set_status(1, "true")
+        self.assertEqual(read_items(), [True, False])
+        self.assertNotEqual(statements, [])
+        self.assertEqual(read_items(), [True, False])
+        self.assertEqual(statements, [])
+
+    def test_held_changes_can_be_written_in_the_background(self):
+        self.set_status(1, "true")
+        self.buffer.flush_all()
+        self.assertEqual(self.stored_states()[0], (True, 2))
+        self.assertEqual(self.held_states(), [])
+
+    def test_only_the_items_of_the_user_can_be_changed(self):
+        resp = self.set_status(9, "true")
+        self.assertEqual(resp.status_code, 404)
+        resp = self.set_status("one", "true")
+        self.assertEqual(resp.status_code, 400)
+        resp = self.set_status(1, "maybe")
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.held_states(), [])
+
+    def test_changes_are_written_at_once_unless_asked_otherwise(self):
+        resp = self.test_client.patch(
+            "/api/v1/shoppinglists/1/items/1", headers=self.headers,
+            data={"status": "true"})
+        self.assertEqual(resp.status_code, 200)
+        resp = self.set_status(2, "true", **{"If-Match": '"1"'})
+        self.assertEqual(resp.status_code, 200)
+        resp = self.test_client.patch(
+            "/api/v1/shoppinglists/1/items/1", data={
+                "status": "false", "price": "4,000/="},
+            headers=dict(self.headers, Prefer="respond-async"))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.stored_states(), [(False, 3), (True, 2)])
+
+
+class TestBoughtStateFlusher(BaseTests):
+    """ Tests for writing the held bought states from a background thread"""
+
+    def test_the_flusher_carries_on_after_an_error(self):
+        buffer = BoughtStateBuffer(self.app, window=0, flush_interval=0.01)
+        calls = []
+
+        def flush_all(older_than=0):
+            calls.append(older_than)
+            if len(calls) == 1:
+                raise RuntimeError("the database went away")
+            raise SystemExit  # ends the thread once it carried on
+        buffer.flush_all = flush_all
+        buffer.start()
+        buffer.flusher.join(5)
+        self.assertEqual(calls, [0, 0])
@@ -0,0 +1,68 @@
+import json
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from tests import BaseTests
+from app import db
+from app.models import ShoppingList, Item, User
+
+
+class TestUniqueConstraints(BaseTests):
+    """ Tests for the duplicates that the database refuses"""
+
+    def setUp(self):
+        super().setUp()
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.headers = {
+            'Authorization': f'Bearer {json.loads(resp.data)["token"]}'}
+
+    def post_list(self, name="groceries"):
+        return self.test_client.post(
+            "/api/v1/shoppinglists", headers=self.headers,
+            data={"name": name, "notify_date": "2018-03-14"})
+
+    def test_the_database_refuses_duplicates(self):
+        with self.assertRaises(IntegrityError):
+            User("TESTOR@example.com", "!0ctoPus").save()
+        db.session.rollback()
+
+        ShoppingList(1, "groceries", "2018-03-14").save()
+        with self.assertRaises(IntegrityError):
+            ShoppingList(1, "groceries", "2018-03-15").save()
+        db.session.rollback()
+
+        Item(1, "beans", "1 kg", "3,500/=").save()
+        with self.assertRaises(IntegrityError):
+            Item(1, "beans", "2 kg", "7,000/=").save()
+        db.session.rollback()
+
+    def test_duplicates_are_refused_without_looking_for_them_first(self):
+        self.post_list()
+        statements = []
+
+        def log_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', log_statement)
+        try:
+            resp = self.post_list()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', log_statement)
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(json.loads(resp.data)['message'],
+                         "a shopping list with name 'groceries' already exists")
+        self.assertFalse([statement for statement in statements
+                          if statement.lstrip().startswith("SELECT") and
+                          "FROM shoppinglists" in statement])
+
+    def test_the_request_is_usable_after_a_duplicate(self):
+        self.post_list()
+        self.post_list("hardware")
+        resp = self.test_client.put(
+            "/api/v1/shoppinglists/2", headers=self.headers,
+            data={"name": "groceries", "notify_date": "2018-03-14"})
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(ShoppingList.query.get(2).name, "hardware")
+
+        resp = self.post_list("tools")
+        self.assertEqual(resp.status_code, 201)
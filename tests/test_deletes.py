@@ -0,0 +1,115 @@
+import json
+from sqlalchemy import event
+from tests import BaseTests
+from app import db
+from app.models import User, ShoppingList, Item, Tombstone
+
+
+class TestDeletes(BaseTests):
+    """ Tests for deleting lists and items with a single statement"""
+
+    def setUp(self):
+        super().setUp()
+        self.headers = self.login(self.user_data)
+        self.test_client.post(
+            "/api/v1/shoppinglists", headers=self.headers,
+            data={"name": "groceries", "notify_date": "2018-03-14"})
+        for name in ("beans", "rice"):
+            self.test_client.post(
+                "/api/v1/shoppinglists/1/items", headers=self.headers,
+                data=dict(name=name, price='3,500/=', quantity='1 kg'))
+
+    def login(self, user_data):
+        self.test_client.post("/api/v1/auth/register", data=user_data)
+        resp = self.test_client.post("/api/v1/auth/login", data=user_data)
+        return {'Authorization': f'Bearer {json.loads(resp.data)["token"]}'}
+
+    def delete(self, url, headers=None):
+        statements = []
+
+        def log_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', log_statement)
+        try:
+            resp = self.test_client.delete(
+                url, headers=headers or self.headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', log_statement)
+        writes = [statement for statement in statements
+                  if not statement.lstrip().startswith("SELECT")]
+        return resp, writes
+
+    def test_an_item_is_deleted_with_one_statement(self):
+        resp, writes = self.delete("/api/v1/shoppinglists/1/items/1")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            json.loads(resp.data)['message'],
+            "an item with ID 1 has been successfully deleted")
+        self.assertEqual(len(writes), 1)
+        self.assertEqual([item.name for item in Item.query.filter(
+            Item.deleted_at.is_(None))], ["rice"])
+        # the item is kept in the trash, so there is nothing to tombstone yet
+        self.assertIsNotNone(Item.query.get(1).deleted_at)
+        self.assertEqual(Tombstone.query.count(), 0)
+
+    def test_a_list_and_its_items_are_deleted_with_one_statement(self):
+        resp, writes = self.delete("/api/v1/shoppinglists/1")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(writes), 1)
+        self.assertIsNotNone(ShoppingList.query.get(1).deleted_at)
+        self.assertEqual(Tombstone.query.count(), 0)
+        resp = self.test_client.get("/api/v1/shoppinglists/1/items",
+                                    headers=self.headers)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_missing_lists_and_items_are_reported(self):
+        resp, _ = self.delete("/api/v1/shoppinglists/1/items/9")
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(json.loads(resp.data)['message'],
+                         "item with that ID cannot be found!")
+        resp, _ = self.delete("/api/v1/shoppinglists/9/items/1")
+        self.assertEqual(json.loads(resp.data)['message'],
+                         "shopping list with that ID cannot be found!")
+        resp, _ = self.delete("/api/v1/shoppinglists/one")
+        self.assertEqual(resp.status_code, 400)
+        resp, _ = self.delete("/api/v1/shoppinglists/1/items/one")
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(Tombstone.query.count(), 0)
+
+    def test_trashed_lists_and_items_cannot_be_deleted_again(self):
+        self.delete("/api/v1/shoppinglists/1/items/1")
+        resp, _ = self.delete("/api/v1/shoppinglists/1/items/1")
+        self.assertEqual(resp.status_code, 404)
+        self.delete("/api/v1/shoppinglists/1")
+        resp, _ = self.delete("/api/v1/shoppinglists/1")
+        self.assertEqual(resp.status_code, 404)
+        resp, _ = self.delete("/api/v1/shoppinglists/1/items/2")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_the_lists_of_other_users_cannot_be_deleted(self):
+        headers = self.login(dict(email="other@example.com",
+                                  password="!0ctoPus"))
+        resp, _ = self.delete("/api/v1/shoppinglists/1/items/1", headers)
+        self.assertEqual(resp.status_code, 404)
+        resp, _ = self.delete("/api/v1/shoppinglists/1", headers)
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(Item.query.count(), 2)
+        self.assertEqual(ShoppingList.query.count(), 1)
+
+    def test_deleting_a_user_leaves_their_lists_to_the_database(self):
+        db.session.remove()
+        user = User.query.get(1)
+        statements = []
+
+        def log_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', log_statement)
+        try:
+            user.delete()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', log_statement)
+        self.assertFalse([statement for statement in statements
+                          if "FROM shoppinglists" in statement or
+                          "FROM items" in statement])
+        self.assertEqual(ShoppingList.query.count(), 0)
+        self.assertEqual(Item.query.count(), 0)
@@ -0,0 +1,107 @@
+import json
+from sqlalchemy import event
+from tests import BaseTests
+from app import db
+from app.events import LocalBroker, PostgresBroker
+
+
+class TestEventStream(BaseTests):
+    """ Tests for the shoppinglist change notifications"""
+
+    def login(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        return json.loads(resp.data)['token']
+
+    def test_broker_only_delivers_events_to_the_users_subscribers(self):
+        broker = LocalBroker()
+        mine = broker.subscribe(1)
+        theirs = broker.subscribe(2)
+
+        broker.publish(1, {"action": "created"})
+        self.assertEqual(mine.get_nowait(), {"action": "created"})
+        self.assertTrue(theirs.empty())
+
+        broker.unsubscribe(1, mine)
+        self.assertNotIn(1, broker.subscribers)
+
+    def test_postgres_broker_delivers_events_through_notify(self):
+        broker = PostgresBroker(
+            self.app.config['SQLALCHEMY_DATABASE_URI'], "test_changes")
+        subscription = broker.subscribe(1)
+        self.assertTrue(broker.listening.wait(5))
+
+        broker.publish(1, {"action": "updated"})
+        self.assertEqual(subscription.get(timeout=5), {"action": "updated"})
+
+    def test_postgres_broker_notifies_a_commits_events_at_once(self):
+        broker = PostgresBroker(
+            self.app.config['SQLALCHEMY_DATABASE_URI'], "test_changes")
+        subscription = broker.subscribe(1)
+        self.assertTrue(broker.listening.wait(5))
+        statements = []
+
+        def log_statement(conn, cursor, statement, *args):
+            if "pg_notify" in statement:
+                statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', log_statement)
+        try:
+            broker.publish_all([(1, {"id": 1}), (2, {"id": 2}),
+                                (1, {"id": 3})])
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', log_statement)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual([subscription.get(timeout=5) for _ in range(2)],
+                         [{"id": 1}, {"id": 3}])
+
+    def test_postgres_broker_listens_again_once_its_connection_is_lost(self):
+        broker = PostgresBroker(
+            self.app.config['SQLALCHEMY_DATABASE_URI'], "test_changes",
+            reconnect_delay=0.1)
+        subscription = broker.subscribe(1)
+        self.assertTrue(broker.listening.wait(5))
+
+        broker.listening.clear()
+        db.engine.execute(
+            "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+            "WHERE query = 'LISTEN \"test_changes\"'")
+        self.assertTrue(broker.listening.wait(5))
+
+        broker.publish(1, {"action": "updated"})
+        self.assertEqual(subscription.get(timeout=5), {"action": "updated"})
+
+    def test_stream_receives_changes_made_through_the_views(self):
+        token = self.login()
+
+        resp = self.test_client.get(
+            "/api/v1/events", headers=dict(Authorization=f'Bearer {token}'),
+            buffered=False)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, "text/event-stream")
+        stream = iter(resp.response)
+        self.assertEqual(next(stream), b"retry: 5000\n\n")
+
+        self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.test_client.delete(
+            "/api/v1/shoppinglists/1",
+            headers=dict(Authorization=f'Bearer {token}'))
+
+        for action in ("created", "deleted"):
+            chunk = next(stream).decode()
+            self.assertTrue(chunk.startswith("event: change\ndata: "))
+            event = json.loads(chunk.split("data: ")[1])
+            self.assertEqual(event, {"action": action, "type": "shoppinglist",
+                                     "id": 1, "shoppinglist_id": 1})
+        resp.close()
+
+    def test_stream_fails_for_no_authorization_header(self):
+        resp = self.test_client.get("/api/v1/events")
+        self.assertEqual(resp.status_code, 403)
+        data = json.loads(resp.data)
+        self.assertEqual(
+            data["message"],
+            'Authorization header must be set for a successful request')
@@ -0,0 +1,69 @@
+import gzip
+import json
+from tests import BaseTests
+
+
+class TestExportAPI(BaseTests):
+    """ Tests for the NDJSON export of a user's shoppinglists"""
+
+    def login(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        return json.loads(resp.data)['token']
+
+    def create_lists(self, token):
+        for name in ("groceries", "hardware"):
+            self.test_client.post(
+                "/api/v1/shoppinglists",
+                data={"name": name, "notify_date": "2018-03-14"},
+                headers=dict(Authorization=f'Bearer {token}'))
+        for name in ("beans", "rice"):
+            self.test_client.post(
+                "/api/v1/shoppinglists/1/items",
+                data=dict(name=name, price='3,500/=', quantity='1 kg'),
+                headers=dict(Authorization=f'Bearer {token}'))
+
+    def test_export_streams_a_line_per_shoppinglist(self):
+        token = self.login()
+        self.create_lists(token)
+
+        resp = self.test_client.get(
+            "/api/v1/export", headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+        self.assertNotIn("Content-Encoding", resp.headers)
+
+        lines = [json.loads(line) for line in resp.data.decode().splitlines()]
+        self.assertEqual([line['name'] for line in lines],
+                         ["groceries", "hardware"])
+        self.assertEqual([item['name'] for item in lines[0]['items']],
+                         ["beans", "rice"])
+        self.assertEqual(lines[0]['items'][0]['price'], '3,500/=')
+        self.assertEqual(lines[1]['items'], [])
+
+    def test_export_is_gzipped_when_the_client_accepts_it(self):
+        token = self.login()
+        self.create_lists(token)
+
+        resp = self.test_client.get(
+            "/api/v1/export", headers={'Authorization': f'Bearer {token}',
+                                       'Accept-Encoding': 'gzip'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+
+        lines = gzip.decompress(resp.data).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])['name'], "groceries")
+
+    def test_export_of_an_empty_account_is_empty(self):
+        token = self.login()
+
+        resp = self.test_client.get(
+            "/api/v1/export", headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data, b"")
+
+    def test_export_fails_for_no_authorization_header(self):
+        resp = self.test_client.get("/api/v1/export")
+        self.assertEqual(resp.status_code, 403)
@@ -0,0 +1,86 @@
+import json
+from tests import BaseTests
+from app import db
+from app.models import ShoppingList, Item, IdempotencyKey
+from app.idempotency import delete_expired_keys
+
+
+class TestIdempotencyKeys(BaseTests):
+    """ Tests for replaying retried POST requests"""
+
+    def setUp(self):
+        super().setUp()
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.token = json.loads(resp.data)['token']
+
+    def post_list(self, key, name="groceries"):
+        return self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": name, "notify_date": "2018-03-14"},
+            headers={'Authorization': f'Bearer {self.token}',
+                     'Idempotency-Key': key})
+
+    def test_a_retried_post_is_replayed_instead_of_run_again(self):
+        first = self.post_list("create-groceries")
+        self.assertEqual(first.status_code, 201)
+
+        retry = self.post_list("create-groceries")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(json.loads(retry.data), json.loads(first.data))
+        self.assertEqual(ShoppingList.query.count(), 1)
+
+        # without the key, the duplicate name is refused as before
+        resp = self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(resp.status_code, 409)
+
+    def test_a_key_cannot_be_reused_for_another_request(self):
+        self.post_list("create-list")
+        resp = self.post_list("create-list", name="hardware")
+        self.assertEqual(resp.status_code, 422)
+        self.assertEqual(ShoppingList.query.count(), 1)
+
+    def test_a_retry_of_a_running_request_is_told_to_wait(self):
+        self.post_list("create-groceries")
+        IdempotencyKey.query.update({"status_code": None, "body": None})
+        db.session.commit()
+
+        resp = self.post_list("create-groceries")
+        self.assertEqual(resp.status_code, 409)
+
+    def test_a_retry_of_a_crashed_request_runs_it_again(self):
+        self.post_list("create-groceries")
+        ShoppingList.query.delete()
+        IdempotencyKey.query.update({"status_code": None, "body": None})
+        db.session.commit()
+        self.app.config['IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS'] = -1
+
+        resp = self.post_list("create-groceries")
+        self.assertEqual(resp.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', resp.headers)
+        self.assertEqual(ShoppingList.query.count(), 1)
+
+    def test_retried_item_posts_are_replayed(self):
+        self.post_list("create-groceries")
+        for _ in range(2):
+            resp = self.test_client.post(
+                "/api/v1/shoppinglists/1/items",
+                data=dict(name="beans", price='3,500/=', quantity='1 kg'),
+                headers={'Authorization': f'Bearer {self.token}',
+                         'Idempotency-Key': 'add-beans'})
+            self.assertEqual(resp.status_code, 201)
+        self.assertEqual(Item.query.count(), 1)
+
+    def test_expired_keys_are_deleted(self):
+        self.post_list("create-groceries")
+        self.app.config['IDEMPOTENCY_KEY_TTL_SECONDS'] = -1
+        self.assertEqual(delete_expired_keys(), 1)
+
+        resp = self.post_list("create-groceries")
+        self.assertEqual(resp.status_code, 409)
+        self.assertNotIn('Idempotent-Replayed', resp.headers)
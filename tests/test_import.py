@@ -0,0 +1,181 @@
+import io
+import json
+from sqlalchemy import event
+from tests import BaseTests
+from app import db
+from app.importer import import_shoppinglists
+from app.models import ShoppingList, Item
+
+
+class TestImportAPI(BaseTests):
+    """ Tests for the bulk import of shoppinglists and items"""
+
+    def login(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        return json.loads(resp.data)['token']
+
+    def upload(self, token, content, filename, **form):
+        form["file"] = (io.BytesIO(content.encode()), filename)
+        return self.test_client.post(
+            "/api/v1/import", data=form, content_type="multipart/form-data",
+            headers=dict(Authorization=f'Bearer {token}'))
+
+    def test_import_of_a_csv_file(self):
+        token = self.login()
+        content = ("list_name,notify_date,item_name,price,quantity,has_been_bought\n"
+                   "Groceries,2018-03-14,beans,\"3,500/=\",1 kg,true\n"
+                   "groceries,2018-03-14,rice,\"4,000/=\",2 kg,\n"
+                   "hardware,2018-03-15,,,,\n")
+
+        resp = self.upload(token, content, "lists.csv")
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data["lists_created"], 2)
+        self.assertEqual(data["items_created"], 2)
+        self.assertEqual(data["errors"], [])
+
+        with self.app.app_context():
+            groceries = ShoppingList.query.filter_by(name="groceries").one()
+            beans = Item.query.filter_by(name="beans").one()
+            self.assertEqual(beans.shoppinglist_id, groceries.id)
+            self.assertEqual(beans.price, "3,500/=")
+            self.assertTrue(beans.has_been_bought)
+            self.assertEqual(ShoppingList.query.count(), 2)
+
+    def test_an_imported_chunk_is_logged_once_per_list(self):
+        token = self.login()
+        content = ("list_name,notify_date,item_name,price,quantity\n"
+                   "groceries,2018-03-14,beans,\"3,500/=\",1 kg\n"
+                   "groceries,2018-03-14,rice,\"4,000/=\",2 kg\n"
+                   "hardware,2018-03-15,nails,100,1 kg\n")
+        self.assertEqual(self.upload(token, content, "lists.csv").status_code,
+                         200)
+
+        resp = self.test_client.get(
+            "/api/v1/audit", headers=dict(Authorization=f'Bearer {token}'))
+        entries = json.loads(resp.data)['entries']
+        self.assertEqual(
+            [(entry['action'], entry['type'], entry['object_id'],
+              entry['shoppinglist_id']) for entry in entries],
+            [("imported", "shoppinglist", 1, 1),
+             ("imported", "shoppinglist", 2, 2)])
+
+    def test_lists_and_items_created_meanwhile_are_not_duplicated(self):
+        token = self.login()
+        created = []
+
+        def create_meanwhile(conn, cursor, statement, *args):
+            if statement.startswith("INSERT INTO shoppinglists") and \
+                    not created:
+                created.append(statement)
+                with db.engine.connect() as other:
+                    list_id = other.execute(
+                        ShoppingList.__table__.insert().values(
+                            user_id=1, name="hardware",
+                            notify_date="2018-03-15").returning(
+                                ShoppingList.id)).scalar()
+                    other.execute(Item.__table__.insert().values(
+                        shoppinglist_id=list_id, name="nails"))
+        content = ("list_name,notify_date,item_name,price,quantity\n"
+                   "hardware,2018-03-15,nails,100,1 kg\n"
+                   "hardware,2018-03-15,screws,200,1 kg\n")
+        event.listen(db.engine, 'before_cursor_execute', create_meanwhile)
+        try:
+            resp = self.upload(token, content, "lists.csv")
+        finally:
+            event.remove(db.engine, 'before_cursor_execute',
+                         create_meanwhile)
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual((data["lists_created"], data["items_created"]),
+                         (0, 1))
+        self.assertEqual(data["errors"], [{
+            "line": 2,
+            "message": "an item with name 'nails' already exists in "
+                       "'hardware'"}])
+        self.assertEqual(ShoppingList.query.count(), 1)
+        self.assertEqual(Item.query.count(), 2)
+
+    def test_import_reports_the_rows_it_rejected(self):
+        token = self.login()
+        self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.test_client.post(
+            "/api/v1/shoppinglists/1/items",
+            data=dict(name="beans", price='3,500/=', quantity='1 kg'),
+            headers=dict(Authorization=f'Bearer {token}'))
+        content = "\n".join([
+            json.dumps({"name": "groceries", "notify_date": "2018-03-14",
+                        "items": [{"name": "beans", "price": "1",
+                                   "quantity": "1"},
+                                  {"name": "milk", "price": "2",
+                                   "quantity": "1 l"}]}),
+            "{not json",
+            json.dumps({"name": "old", "notify_date": "2018-02-30",
+                        "items": [{"name": "eggs", "price": "1",
+                                   "quantity": "1"}]}),
+            json.dumps({"name": "hardware", "notify_date": "2018-03-14",
+                        "items": [{"name": "nails"}]}),
+        ])
+
+        resp = self.upload(token, content, "lists.ndjson")
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data["lists_created"], 1)
+        self.assertEqual(data["items_created"], 1)
+        self.assertEqual(data["rejected"], 4)
+        self.assertEqual([error["line"] for error in data["errors"]],
+                         [2, 3, 4, 1])
+        self.assertEqual(data["errors"][3]["message"],
+                         "an item with name 'beans' already exists "
+                         "in 'groceries'")
+
+    def test_export_can_be_imported_again_once_its_dates_passed(self):
+        token = self.login()
+        content = json.dumps({
+            "name": "christmas", "notify_date": "2017-12-01",
+            "items": [{"name": "turkey", "price": "80,000/=",
+                       "quantity": "1", "has_been_bought": True}]}) + "\n"
+
+        resp = self.upload(token, content, "backup.ndjson")
+        data = json.loads(resp.data)
+        self.assertEqual(data["rejected"], 0)
+        self.assertEqual(data["lists_created"], 1)
+        self.assertEqual(data["items_created"], 1)
+
+        resp = self.test_client.get(
+            "/api/v1/export", headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(json.loads(resp.data)["notify_date"], "2017-12-01")
+
+    def test_import_writes_a_chunk_at_a_time(self):
+        self.login()
+        content = "".join(
+            json.dumps({"name": f"list {number}", "notify_date": "2018-03-14",
+                        "items": [{"name": "beans", "price": "1",
+                                   "quantity": "1"}]}) + "\n"
+            for number in range(25))
+
+        with self.app.app_context():
+            report = import_shoppinglists(
+                1, io.BytesIO(content.encode()), "ndjson", chunk_size=4)
+            self.assertEqual(report.lists_created, 25)
+            self.assertEqual(report.items_created, 25)
+            self.assertEqual(Item.query.count(), 25)
+
+    def test_import_fails_without_a_file(self):
+        token = self.login()
+        resp = self.test_client.post(
+            "/api/v1/import", data={},
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(json.loads(resp.data)["message"],
+                         "a 'file' to import must be uploaded")
+
+    def test_import_fails_for_an_unknown_format(self):
+        token = self.login()
+        resp = self.upload(token, "", "lists.xlsx", format="xlsx")
+        self.assertEqual(resp.status_code, 400)
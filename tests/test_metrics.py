@@ -0,0 +1,81 @@
+import os
+import tempfile
+from unittest import mock
+from prometheus_client import REGISTRY
+from tests import BaseTests
+from app.metrics import get_registry
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestMetrics(BaseTests):
+    """ Tests for the metrics exposed to Prometheus"""
+
+    def test_requests_are_timed_and_counted_by_status(self):
+        labels = dict(blueprint="list_blueprint", method="GET")
+        count = sample("http_request_duration_seconds_count", **labels)
+        forbidden = sample("http_requests_total", status="403", **labels)
+
+        resp = self.test_client.get("/api/v1/shoppinglists")
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(
+            sample("http_request_duration_seconds_count", **labels),
+            count + 1)
+        self.assertEqual(sample("http_requests_total", status="403", **labels),
+                         forbidden + 1)
+
+    def test_the_statements_of_a_request_are_counted(self):
+        count = sample("db_statements_per_request_count", blueprint="auth")
+        statements = sample("db_statements_per_request_sum", blueprint="auth")
+        db_time = sample("db_duration_per_request_seconds_sum",
+                         blueprint="auth")
+
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        self.assertEqual(
+            sample("db_statements_per_request_count", blueprint="auth"),
+            count + 1)
+        self.assertGreater(
+            sample("db_statements_per_request_sum", blueprint="auth"),
+            statements)
+        self.assertGreater(
+            sample("db_duration_per_request_seconds_sum", blueprint="auth"),
+            db_time)
+
+    def test_bcrypt_is_timed(self):
+        hashes = sample("bcrypt_duration_seconds_count", operation="hash")
+        checks = sample("bcrypt_duration_seconds_count", operation="check")
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        self.test_client.post("/api/v1/auth/login", data=self.user_data)
+        self.assertEqual(
+            sample("bcrypt_duration_seconds_count", operation="hash"),
+            hashes + 1)
+        self.assertEqual(
+            sample("bcrypt_duration_seconds_count", operation="check"),
+            checks + 1)
+
+    def test_metrics_are_exposed_in_the_prometheus_format(self):
+        self.test_client.get("/api/v1/shoppinglists")
+        resp = self.test_client.get("/metrics")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        body = resp.data.decode()
+        self.assertIn('http_request_duration_seconds_bucket{'
+                      'blueprint="list_blueprint"', body)
+        self.assertIn('db_statements_per_request_bucket', body)
+
+    def test_metrics_can_require_a_token(self):
+        self.app.config['METRICS_TOKEN'] = 'scraper-secret'
+        resp = self.test_client.get("/metrics")
+        self.assertEqual(resp.status_code, 403)
+        resp = self.test_client.get(
+            "/metrics", headers={'Authorization': 'Bearer scraper-secret'})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_the_metrics_of_every_worker_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(os.environ,
+                                 {'prometheus_multiproc_dir': directory}):
+                self.assertIsNot(get_registry(), REGISTRY)
+        self.assertIs(get_registry(), REGISTRY)
@@ -0,0 +1,93 @@
+import json
+from tests import BaseTests
+from app.models import ShoppingList, Item
+
+
+class TestPatch(BaseTests):
+    """ Tests for editing some of the fields of lists and items"""
+
+    def setUp(self):
+        super().setUp()
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.headers = {
+            'Authorization': f'Bearer {json.loads(resp.data)["token"]}'}
+        self.test_client.post(
+            "/api/v1/shoppinglists", headers=self.headers,
+            data={"name": "groceries", "notify_date": "2018-03-14"})
+        self.test_client.post(
+            "/api/v1/shoppinglists/1/items", headers=self.headers,
+            data=dict(name="beans", price='3,500/=', quantity='1 kg'))
+
+    def patch(self, url, data, headers=None):
+        return self.test_client.patch(
+            url, data=data, headers=dict(self.headers, **(headers or {})))
+
+    def test_patching_a_list_leaves_the_other_fields_be(self):
+        resp = self.patch("/api/v1/shoppinglists/1", {"name": "Food"})
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)['data']
+        self.assertEqual(data['name'], 'food')
+        self.assertEqual(data['notify_date'], '2018-03-14')
+        self.assertEqual(resp.headers['ETag'], '"2"')
+
+        resp = self.patch("/api/v1/shoppinglists/1",
+                          {"notify_date": "2018-04-01"})
+        self.assertEqual(resp.status_code, 200)
+        shoppinglist = ShoppingList.query.get(1)
+        self.assertEqual(shoppinglist.name, 'food')
+        self.assertEqual(str(shoppinglist.notify_date), '2018-04-01')
+
+    def test_patching_an_item_leaves_the_other_fields_be(self):
+        resp = self.patch("/api/v1/shoppinglists/1/items/1",
+                          {"price": "4,000/="})
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)['data']
+        self.assertEqual(data['price'], '4,000/=')
+        self.assertEqual(data['name'], 'beans')
+        self.assertEqual(data['quantity'], '1 kg')
+
+    def test_has_been_bought_can_be_toggled(self):
+        for expected in (True, False, True):
+            resp = self.patch("/api/v1/shoppinglists/1/items/1",
+                              {"status": "toggle"})
+            self.assertEqual(resp.status_code, 200)
+            self.assertIs(
+                json.loads(resp.data)['data']['has_been_bought'], expected)
+        self.assertIs(Item.query.get(1).has_been_bought, True)
+
+        resp = self.patch("/api/v1/shoppinglists/1/items/1",
+                          {"status": "false"})
+        self.assertIs(
+            json.loads(resp.data)['data']['has_been_bought'], False)
+
+    def test_invalid_patches_are_refused(self):
+        for url, data in (("/api/v1/shoppinglists/1", {}),
+                          ("/api/v1/shoppinglists/1", {"name": " "}),
+                          ("/api/v1/shoppinglists/1",
+                           {"notify_date": "14-03-2018"}),
+                          ("/api/v1/shoppinglists/1/items/1", {}),
+                          ("/api/v1/shoppinglists/1/items/1", {"price": ""}),
+                          ("/api/v1/shoppinglists/1/items/1",
+                           {"status": "maybe"})):
+            resp = self.patch(url, data)
+            self.assertEqual(resp.status_code, 400, data)
+
+        resp = self.patch("/api/v1/shoppinglists/9", {"name": "food"})
+        self.assertEqual(resp.status_code, 404)
+        resp = self.patch("/api/v1/shoppinglists/1/items/9", {})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_patches_respect_if_match_and_duplicates(self):
+        resp = self.patch("/api/v1/shoppinglists/1/items/1",
+                          {"status": "toggle"}, {"If-Match": '"7"'})
+        self.assertEqual(resp.status_code, 412)
+        self.assertIs(Item.query.get(1).has_been_bought, False)
+
+        self.test_client.post(
+            "/api/v1/shoppinglists/1/items", headers=self.headers,
+            data=dict(name="rice", price='5,000/=', quantity='2 kg'))
+        resp = self.patch("/api/v1/shoppinglists/1/items/2",
+                          {"name": "beans"})
+        self.assertEqual(resp.status_code, 409)
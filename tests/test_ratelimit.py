@@ -0,0 +1,93 @@
+import json
+from tests import BaseTests
+from app.ratelimit import MemoryBackend, LoginThrottle
+
+
+class TestRateLimiting(BaseTests):
+    """ Tests for the per user and per IP token buckets"""
+
+    def test_memory_backend_refuses_requests_once_the_bucket_is_empty(self):
+        backend = MemoryBackend()
+        self.assertEqual(backend.take("key", 2, 3, 0.001), (True, 1))
+        allowed, tokens = backend.take("key", 2, 3, 0.001)
+        self.assertFalse(allowed)
+        self.assertLess(tokens, 2)
+        # other keys have buckets of their own
+        self.assertTrue(backend.take("other", 2, 3, 0.001)[0])
+
+    def test_memory_backend_forgets_the_least_recently_used_first(self):
+        backend = MemoryBackend(max_buckets=2)
+        for key in ("a", "b"):
+            self.assertTrue(backend.take(key, 1, 1, 0.001)[0])
+        self.assertFalse(backend.take("a", 1, 1, 0.001)[0])
+        self.assertTrue(backend.take("c", 1, 1, 0.001)[0])
+        # 'b' was the least recently used, 'a' is still empty
+        self.assertEqual(list(backend.buckets), ["a", "c"])
+        self.assertFalse(backend.take("a", 1, 1, 0.001)[0])
+        self.assertTrue(backend.take("b", 1, 1, 0.001)[0])
+
+    def test_login_throttle_forgets_the_least_recently_failed_first(self):
+        throttle = LoginThrottle(max_entries=3)
+        for email in ("a@example.com", "b@example.com", "c@example.com"):
+            throttle.record_failure(email, "10.0.0.1")
+        self.assertEqual(list(throttle.failures), [
+            "account:b@example.com", "account:c@example.com", "ip:10.0.0.1"])
+        self.assertEqual(throttle.failures["ip:10.0.0.1"][0], 3)
+
+    def test_responses_carry_rate_limit_headers(self):
+        token = self.login()
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.headers['RateLimit-Limit'], '120')
+        self.assertEqual(resp.headers['RateLimit-Remaining'], '119')
+        self.assertIn('RateLimit-Reset', resp.headers)
+
+    def test_requests_beyond_the_users_bucket_are_refused(self):
+        token = self.login()
+        self.app.config['RATELIMIT_USER_BUCKET'] = (2, 0.01)
+
+        for _ in range(2):
+            resp = self.test_client.get(
+                "/api/v1/shoppinglists",
+                headers=dict(Authorization=f'Bearer {token}'))
+            self.assertEqual(resp.status_code, 200)
+
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.headers['RateLimit-Remaining'], '0')
+        self.assertGreater(int(resp.headers['Retry-After']), 0)
+        data = json.loads(resp.data)
+        self.assertEqual(data['status'], 'failure')
+        self.assertTrue(data['message'].startswith("too many requests"))
+
+        # another user is not affected
+        other_token = self.login(
+            dict(self.user_data, email="other@example.com"))
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists",
+            headers=dict(Authorization=f'Bearer {other_token}'))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_public_auth_routes_are_limited_per_ip_with_endpoint_costs(self):
+        self.app.config['RATELIMIT_IP_BUCKET'] = (10, 0.01)
+
+        resp = self.test_client.post(
+            "/api/v1/auth/register", data=self.user_data)
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.headers['RateLimit-Remaining'], '5')
+
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.assertEqual(resp.status_code, 429)
+
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data,
+            environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        self.assertEqual(resp.status_code, 200)
@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+from datetime import date
+
+from tests import BaseTests
+from app.models import User, ShoppingList
+from app.accounts import disable_account
+from app.reminders import FileSender, send_reminders
+
+
+class TestReminders(BaseTests):
+    """ Tests for the notify_date reminder scheduler"""
+
+    def setUp(self):
+        super().setUp()
+        handle, self.reminder_file = tempfile.mkstemp()
+        os.close(handle)
+        self.sender = FileSender(self.reminder_file)
+
+        for email, names in (("ann@example.com", ["groceries", "books",
+                                                  "shoes"]),
+                             ("bob@example.com", ["furniture"]),
+                             ("cat@example.com", ["fruits", "paint"])):
+            user = User(email, "secret")
+            user.save()
+            for name in names:
+                ShoppingList(user.id, name, "2018-03-14").save()
+        ShoppingList(user.id, "later", "2018-03-15").save()
+
+    def tearDown(self):
+        os.remove(self.reminder_file)
+        super().tearDown()
+
+    def sent_reminders(self):
+        with open(self.reminder_file) as reminder_file:
+            return [json.loads(line) for line in reminder_file]
+
+    def test_every_user_gets_one_reminder_with_all_their_due_lists(self):
+        sent = send_reminders(date(2018, 3, 14), self.sender, batch_size=2)
+        self.assertEqual(sent, 3)
+
+        reminders = self.sent_reminders()
+        self.assertEqual(
+            [(reminder['email'], reminder['shoppinglists'])
+             for reminder in reminders],
+            [("ann@example.com", ["groceries", "books", "shoes"]),
+             ("bob@example.com", ["furniture"]),
+             ("cat@example.com", ["fruits", "paint"])])
+
+    def test_reminders_are_not_sent_twice(self):
+        send_reminders(date(2018, 3, 14), self.sender)
+        self.assertEqual(send_reminders(date(2018, 3, 14), self.sender), 0)
+        self.assertEqual(len(self.sent_reminders()), 3)
+
+        # lists due later only get reminded when their day comes
+        self.assertEqual(send_reminders(date(2018, 3, 15), self.sender), 1)
+
+    def test_users_added_after_a_run_are_reminded_on_the_next_run(self):
+        send_reminders(date(2018, 3, 14), self.sender)
+
+        user = User("dan@example.com", "secret")
+        user.save()
+        ShoppingList(user.id, "tools", "2018-03-14").save()
+
+        self.assertEqual(send_reminders(date(2018, 3, 14), self.sender), 1)
+        self.assertEqual(self.sent_reminders()[-1]['shoppinglists'],
+                         ["tools"])
+
+    def test_users_who_deleted_their_account_are_not_reminded(self):
+        # before their account is purged
+        disable_account(User.query.filter_by(email="bob@example.com").one())
+        self.assertEqual(send_reminders(date(2018, 3, 14), self.sender), 2)
+        self.assertEqual([reminder['email']
+                          for reminder in self.sent_reminders()],
+                         ["ann@example.com", "cat@example.com"])
@@ -0,0 +1,97 @@
+import json
+import time
+import unittest
+from tests import BaseTests
+from app import db
+from app.models import ShoppingList, BlacklistToken
+from config import TEST_REPLICA_DATABASE_URL
+
+
+@unittest.skipUnless(TEST_REPLICA_DATABASE_URL,
+                     "TEST_REPLICA_DATABASE_URL is not set")
+class TestReplicaRouting(BaseTests):
+    """ Tests for routing the reads of GET requests to a read replica"""
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['SQLALCHEMY_BINDS'] = {
+            'replica': TEST_REPLICA_DATABASE_URL}
+        self.app.config['REPLICA_BINDS'] = ('replica',)
+        self.replica = db.get_engine(self.app, bind='replica')
+        db.Model.metadata.drop_all(self.replica)
+        db.Model.metadata.create_all(self.replica)
+
+    def tearDown(self):
+        db.session.remove()
+        db.Model.metadata.drop_all(self.replica)
+        super().tearDown()
+
+    def create_list(self):
+        """ creates a list on the primary, which the replica never sees"""
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        token = json.loads(resp.data)['token']
+        resp = self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 201)
+        return token
+
+    def test_get_requests_read_from_the_replica(self):
+        token = self.create_list()
+
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists/1",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 404)
+
+        self.app.config['REPLICA_BINDS'] = ()
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists/1",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_a_stale_replica_is_not_read_from(self):
+        token = self.create_list()
+        self.app.extensions['replicas'].lags['replica'] = (
+            60, time.monotonic())
+
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists/1",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        mapper = ShoppingList.__mapper__
+        with self.app.test_request_context("/api/v1/shoppinglists"):
+            self.app.preprocess_request()
+            self.assertIs(db.session.get_bind(mapper), self.replica)
+            self.assertIs(db.session.get_bind(BlacklistToken.__mapper__),
+                          db.engine)
+
+            db.session.add(BlacklistToken("a-token"))
+            db.session.flush()
+            self.assertIs(db.session.get_bind(mapper), db.engine)
+
+        with self.app.test_request_context("/api/v1/shoppinglists"):
+            self.app.preprocess_request()
+            self.assertIs(db.session.get_bind(mapper), self.replica)
+
+        with self.app.test_request_context("/api/v1/shoppinglists",
+                                           method="POST"):
+            self.app.preprocess_request()
+            self.assertIs(db.session.get_bind(mapper), db.engine)
+
+    def test_a_request_reads_from_a_single_replica(self):
+        self.app.config['SQLALCHEMY_BINDS']['other_replica'] = \
+            TEST_REPLICA_DATABASE_URL
+        self.app.config['REPLICA_BINDS'] = ('replica', 'other_replica')
+        mapper = ShoppingList.__mapper__
+        for _ in range(5):
+            with self.app.test_request_context("/api/v1/shoppinglists"):
+                self.app.preprocess_request()
+                engines = {db.session.get_bind(mapper) for _ in range(10)}
+                self.assertEqual(len(engines), 1)
+            self.assertNotIn('replica', db.session.info)
@@ -0,0 +1,161 @@
+import json
+import unittest
+from datetime import date
+from sqlalchemy import func, select
+from tests import BaseTests
+from app import db
+from app.models import User, ShoppingList, Item, ShardAssignment
+from app.accounts import disable_account
+from app.sharding import init_shards, move_user
+from app.reminders import send_reminders
+from config import TEST_SHARD_DATABASE_URLS
+
+
+@unittest.skipUnless(TEST_SHARD_DATABASE_URLS,
+                     "TEST_SHARD_DATABASE_URLS is not set")
+class TestSharding(BaseTests):
+    """ Tests for spreading the users' lists and items across shards"""
+
+    def setUp(self):
+        super().setUp()
+        urls = TEST_SHARD_DATABASE_URLS.split(',')
+        self.app.config['SQLALCHEMY_BINDS'] = {
+            f'shard_{number}': url for number, url in enumerate(urls)}
+        self.app.config['SHARD_BINDS'] = ('shard_0', 'shard_1')
+        self.shards = [db.get_engine(self.app, bind=shard)
+                       for shard in self.app.config['SHARD_BINDS']]
+        for engine in self.shards:
+            db.Model.metadata.drop_all(engine)
+        init_shards()
+
+    def tearDown(self):
+        db.session.remove()
+        for engine in self.shards:
+            db.Model.metadata.drop_all(engine)
+        super().tearDown()
+
+    def login(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        return json.loads(resp.data)['token']
+
+    def create_list(self, token):
+        self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists",
+            headers=dict(Authorization=f'Bearer {token}'))
+        list_id = json.loads(resp.data)["lists"][0]["id"]
+        self.test_client.post(
+            f"/api/v1/shoppinglists/{list_id}/items",
+            data=dict(name="beans", price='3,500/=', quantity='1 kg'),
+            headers=dict(Authorization=f'Bearer {token}'))
+        return list_id
+
+    def shard_number(self):
+        shard = ShardAssignment.query.get(1).shard
+        return self.app.config['SHARD_BINDS'].index(shard)
+
+    def count_rows(self, model, shard_number):
+        return self.shards[shard_number].execute(
+            select([func.count()]).select_from(model.__table__)).scalar()
+
+    def test_lists_and_items_are_stored_on_the_users_shard(self):
+        token = self.login()
+        list_id = self.create_list(token)
+        shard_number = self.shard_number()
+
+        self.assertEqual(self.count_rows(Item, shard_number), 1)
+        self.assertEqual(self.count_rows(ShoppingList, 1 - shard_number), 0)
+        self.assertEqual(db.engine.execute(
+            select([func.count()]).select_from(
+                ShoppingList.__table__)).scalar(), 0)
+        # the shards hand out IDs that don't collide
+        self.assertEqual(list_id, shard_number + 1)
+
+        resp = self.test_client.get(
+            f"/api/v1/shoppinglists/{list_id}/items",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_rebalance_moves_a_user_to_another_shard(self):
+        token = self.login()
+        list_id = self.create_list(token)
+        source = self.shard_number()
+
+        moved = move_user(1, f'shard_{1 - source}', grace_seconds=0)
+        self.assertEqual(moved, 2)
+        self.assertEqual(self.shard_number(), 1 - source)
+        self.assertEqual(self.count_rows(ShoppingList, source), 0)
+        self.assertEqual(self.count_rows(Item, 1 - source), 1)
+
+        resp = self.test_client.get(
+            f"/api/v1/shoppinglists/{list_id}/items",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)["items"][0]["name"], "beans")
+
+        resp = self.test_client.post(
+            f"/api/v1/shoppinglists/{list_id}/items",
+            data=dict(name="rice", price='4,000/=', quantity='2 kg'),
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 201)
+
+    def test_writes_are_refused_while_the_user_is_moving(self):
+        token = self.login()
+        assignment = ShardAssignment.query.get(1)
+        assignment.is_moving = True
+        db.session.commit()
+
+        resp = self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 503)
+
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_reminders_are_sent_for_the_lists_on_every_shard(self):
+        self.app.config['RATELIMIT_ENABLED'] = False
+        for number in range(4):
+            user_data = dict(email=f"testor{number}@example.com",
+                             password="!0ctoPus")
+            self.test_client.post("/api/v1/auth/register", data=user_data)
+            resp = self.test_client.post("/api/v1/auth/login", data=user_data)
+            token = json.loads(resp.data)['token']
+            self.test_client.post(
+                "/api/v1/shoppinglists",
+                data={"name": "groceries", "notify_date": "2018-03-14"},
+                headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(self.count_rows(ShoppingList, 0), 1)
+        self.assertEqual(self.count_rows(ShoppingList, 1), 3)
+
+        reminded = []
+
+        class Sender:
+            @staticmethod
+            def send(reminders):
+                reminded.extend(reminder.email for reminder in reminders)
+
+        self.assertEqual(send_reminders(date(2018, 3, 14), Sender), 4)
+        self.assertEqual(sorted(reminded),
+                         [f"testor{number}@example.com" for number in range(4)])
+        self.assertEqual(send_reminders(date(2018, 3, 14), Sender), 0)
+
+    def test_users_who_deleted_their_account_are_not_reminded(self):
+        self.create_list(self.login())
+        # the reminders read the copy of the user on their shard
+        disable_account(User.query.get(1))
+
+        class Sender:
+            @staticmethod
+            def send(reminders):
+                raise AssertionError(f"{reminders} were sent")
+
+        self.assertEqual(send_reminders(date(2018, 3, 14), Sender), 0)
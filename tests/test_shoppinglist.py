@@ -532,3 +532,63 @@ class TestShoppingListAPI(BaseTests):
         self.assertIsNone(data['next_page'])
         self.assertEqual(data['previous_page'],
                          '/api/v1/shoppinglists?page=1&limit=1&q=r')
+
+    def test_get_with_expand_embeds_the_items_of_every_list(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        data = json.loads(resp.data)
+        token = data['token']
+
+        self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+
+        self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "furniture", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+
+        self.test_client.post(
+            "/api/v1/shoppinglists/1/items",
+            data=dict(name="beans", price='3,500/=', quantity='1 kg'),
+            headers=dict(Authorization=f'Bearer {token}'))
+
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists?expand=items&limit=1",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data['lists']), 1)
+        self.assertEqual(len(data['lists'][0]['items']), 1)
+        self.assertEqual(data['lists'][0]['items'][0]['name'], 'beans')
+        self.assertEqual(data['next_page'],
+                         '/api/v1/shoppinglists?page=2&limit=1&expand=items')
+
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists?expand=items&limit=1&page=2",
+            headers=dict(Authorization=f'Bearer {token}'))
+        data = json.loads(resp.data)
+        self.assertEqual(data['lists'][0]['name'], 'furniture')
+        self.assertEqual(data['lists'][0]['items'], [])
+
+    def test_get_without_expand_does_not_embed_items(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        data = json.loads(resp.data)
+        token = data['token']
+
+        self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists",
+            headers=dict(Authorization=f'Bearer {token}'))
+        data = json.loads(resp.data)
+        self.assertNotIn('items', data['lists'][0])
@@ -361,3 +361,32 @@ class TestShoppingListByID(BaseTests):
         self.assertEqual(
             data['message'],
             "a shopping list with name 'books' already exists")
+
+    def test_get_shopping_list_by_id_with_expand_embeds_its_items(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        data = json.loads(resp.data)
+        token = data['token']
+
+        self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+
+        for name in ("beans", "rice"):
+            self.test_client.post(
+                "/api/v1/shoppinglists/1/items",
+                data=dict(name=name, price='3,500/=', quantity='1 kg'),
+                headers=dict(Authorization=f'Bearer {token}'))
+
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists/1?expand=items",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data['name'], 'groceries')
+        self.assertEqual([item['name'] for item in data['items']],
+                         ['beans', 'rice'])
+        self.assertFalse(data['items'][0]['has_been_bought'])
@@ -0,0 +1,141 @@
+import json
+from app import db
+from app.models import ShoppingList
+from tests import BaseTests
+
+
+class TestSyncAPI(BaseTests):
+    """ Tests for the incremental sync of shoppinglists and items"""
+
+    def login(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        return json.loads(resp.data)['token']
+
+    def test_sync_without_a_token_returns_everything(self):
+        token = self.login()
+
+        self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.test_client.post(
+            "/api/v1/shoppinglists/1/items",
+            data=dict(name="beans", price='3,500/=', quantity='1 kg'),
+            headers=dict(Authorization=f'Bearer {token}'))
+
+        resp = self.test_client.get(
+            "/api/v1/sync", headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['lists'][0]['name'], 'groceries')
+        self.assertEqual(data['items'][0]['name'], 'beans')
+        self.assertEqual(data['items'][0]['shoppinglist_id'], 1)
+        self.assertFalse(data['has_more'])
+
+        # nothing has changed since the returned token
+        resp = self.test_client.get(
+            f"/api/v1/sync?since={data['token']}",
+            headers=dict(Authorization=f'Bearer {token}'))
+        unchanged = json.loads(resp.data)
+        self.assertEqual(unchanged['token'], data['token'])
+        self.assertEqual(unchanged['lists'], [])
+        self.assertEqual(unchanged['items'], [])
+        self.assertEqual(unchanged['deleted'], {"lists": [], "items": []})
+
+    def test_sync_returns_edits_and_deletions_after_the_token(self):
+        token = self.login()
+
+        for name in ("groceries", "furniture"):
+            self.test_client.post(
+                "/api/v1/shoppinglists",
+                data={"name": name, "notify_date": "2018-03-14"},
+                headers=dict(Authorization=f'Bearer {token}'))
+        self.test_client.post(
+            "/api/v1/shoppinglists/1/items",
+            data=dict(name="beans", price='3,500/=', quantity='1 kg'),
+            headers=dict(Authorization=f'Bearer {token}'))
+
+        resp = self.test_client.get(
+            "/api/v1/sync", headers=dict(Authorization=f'Bearer {token}'))
+        since = json.loads(resp.data)['token']
+
+        self.test_client.put(
+            "/api/v1/shoppinglists/1",
+            data={"name": "food", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.test_client.delete(
+            "/api/v1/shoppinglists/1/items/1",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.test_client.delete(
+            "/api/v1/shoppinglists/2",
+            headers=dict(Authorization=f'Bearer {token}'))
+
+        resp = self.test_client.get(
+            f"/api/v1/sync?since={since}",
+            headers=dict(Authorization=f'Bearer {token}'))
+        data = json.loads(resp.data)
+        self.assertEqual([lst['name'] for lst in data['lists']], ['food'])
+        self.assertEqual(data['items'], [])
+        self.assertEqual(data['deleted'], {"lists": [2], "items": [1]})
+        self.assertNotEqual(data['token'], since)
+
+    def test_sync_holds_back_changes_until_older_transactions_end(self):
+        token = self.login()
+        headers = dict(Authorization=f'Bearer {token}')
+
+        # a slower request takes its change_seq first but commits last
+        slow = db.engine.connect()
+        transaction = slow.begin()
+        slow.execute(ShoppingList.__table__.insert().values(
+            user_id=1, name="slow", notify_date="2018-03-14"))
+        try:
+            self.test_client.post(
+                "/api/v1/shoppinglists",
+                data={"name": "fast", "notify_date": "2018-03-14"},
+                headers=headers)
+            resp = self.test_client.get("/api/v1/sync", headers=headers)
+            data = json.loads(resp.data)
+            self.assertEqual(data['lists'], [])
+            transaction.commit()
+        finally:
+            slow.close()
+
+        resp = self.test_client.get(
+            f"/api/v1/sync?since={data['token']}", headers=headers)
+        data = json.loads(resp.data)
+        self.assertEqual(sorted(lst['name'] for lst in data['lists']),
+                         ['fast', 'slow'])
+
+    def test_sync_starts_over_for_the_integer_tokens_of_old_clients(self):
+        token = self.login()
+        self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=dict(Authorization=f'Bearer {token}'))
+
+        resp = self.test_client.get(
+            "/api/v1/sync?since=42",
+            headers=dict(Authorization=f'Bearer {token}'))
+        data = json.loads(resp.data)
+        self.assertEqual(data['lists'][0]['name'], 'groceries')
+
+    def test_sync_fails_if_the_token_is_invalid(self):
+        token = self.login()
+        resp = self.test_client.get(
+            "/api/v1/sync?since=yesterday",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 400)
+        data = json.loads(resp.data)
+        self.assertEqual(data['status'], 'failure')
+        self.assertEqual(data['message'], "the sync token is invalid")
+
+    def test_sync_fails_for_no_authorization_header(self):
+        resp = self.test_client.get("/api/v1/sync")
+        self.assertEqual(resp.status_code, 403)
+        data = json.loads(resp.data)
+        self.assertEqual(
+            data["message"],
+            'Authorization header must be set for a successful request')
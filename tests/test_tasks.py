@@ -0,0 +1,136 @@
+import json
+import threading
+from tests import BaseTests
+from app import db
+from app.models import BlacklistToken, BackgroundTask
+from app.tasks import (task, run_in_background, ThreadExecutor,
+                       DatabaseExecutor)
+
+ran = []
+release = threading.Event()
+
+
+@task
+def record_run(value):
+    ran.append(value)
+
+
+@task
+def wait_for_release():
+    release.wait(5)
+    ran.append("released")
+
+
+@task
+def fail():
+    raise RuntimeError("this task always fails")
+
+
+def not_a_task():
+    pass  # pragma: no cover
+
+
+class TestTasks(BaseTests):
+    """ Tests for running work after the response, in the background"""
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['TASKS_EAGER'] = False
+        ran.clear()
+        release.clear()
+
+    def tearDown(self):
+        release.set()
+        self.app.extensions['tasks'].shutdown(5)
+        super().tearDown()
+
+    def logout(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        token = json.loads(resp.data)['token']
+        resp = self.test_client.post(
+            "/api/v1/auth/logout",
+            headers=dict(Authorization=f'Bearer {token}'))
+        self.assertEqual(resp.status_code, 200)
+        return token
+
+    def test_logging_out_blacklists_the_token_before_answering(self):
+        token = self.logout()
+        db.session.remove()
+        self.assertTrue(BlacklistToken.is_blacklisted(token))
+
+    def test_requests_do_not_wait_for_their_tasks(self):
+        with self.app.test_request_context():
+            run_in_background(wait_for_release)
+        self.assertEqual(ran, [])
+        release.set()
+        self.app.extensions['tasks'].shutdown(5)
+        self.assertEqual(ran, ["released"])
+
+    def test_tasks_of_a_request_wait_for_it_to_commit(self):
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+            run_in_background(record_run, "committed")
+            self.app.extensions['tasks'].shutdown(5)
+            self.assertEqual(ran, [])
+            db.session.commit()
+        self.app.extensions['tasks'].shutdown(5)
+        self.assertEqual(ran, ["committed"])
+
+    def test_tasks_of_a_request_that_failed_are_dropped(self):
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+            run_in_background(record_run, "rolled back")
+            db.session.rollback()
+            db.session.commit()
+        self.app.extensions['tasks'].shutdown(5)
+        self.assertEqual(ran, [])
+
+    def test_shutting_down_drains_the_queue(self):
+        executor = ThreadExecutor(self.app, workers=1, max_queued=10)
+        executor.submit("wait_for_release", [], {})
+        for value in range(3):
+            executor.submit("record_run", [value], {})
+        release.set()
+        executor.shutdown(5)
+        self.assertEqual(ran, ["released", 0, 1, 2])
+
+    def test_a_failing_task_does_not_stop_the_workers(self):
+        executor = ThreadExecutor(self.app, workers=1)
+        executor.submit("fail", [], {})
+        executor.submit("record_run", ["after"], {})
+        executor.shutdown(5)
+        self.assertEqual(ran, ["after"])
+
+    def test_only_registered_tasks_can_be_run(self):
+        with self.assertRaises(ValueError):
+            run_in_background(not_a_task)
+
+    def test_tasks_can_be_stored_for_another_process(self):
+        executor = DatabaseExecutor(self.app, max_attempts=2)
+        self.app.extensions['tasks'] = executor
+        with self.app.test_request_context():
+            run_in_background(record_run, "stored")
+        self.assertEqual(BackgroundTask.query.count(), 1)
+        self.assertEqual(ran, [])
+
+        self.assertEqual(executor.run_pending(), 1)
+        self.assertEqual(ran, ["stored"])
+        self.assertEqual(BackgroundTask.query.count(), 0)
+
+    def test_stored_tasks_are_retried_until_their_last_attempt(self):
+        executor = DatabaseExecutor(self.app, max_attempts=2)
+        executor.submit("fail", [], {})
+        executor.submit("record_run", ["stored"], {})
+        self.assertEqual(executor.run_pending(), 1)
+        self.assertEqual(ran, ["stored"])
+
+        failed = BackgroundTask.query.one()
+        self.assertEqual((failed.name, failed.attempts), ("fail", 1))
+        self.assertIsNone(executor.claim())  # until its claim times out
+
+        executor.claim_timeout = 0
+        self.assertEqual(executor.run_pending(), 0)
+        self.assertIsNone(executor.claim())
+        self.assertEqual(BackgroundTask.query.one().attempts, 2)
@@ -0,0 +1,67 @@
+import json
+from sqlalchemy import event
+from tests import BaseTests
+from app import db
+from app.models import ShoppingList, User
+
+
+class TestTimestamps(BaseTests):
+    """ Tests for the columns that are filled in by the database"""
+
+    def setUp(self):
+        super().setUp()
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.log_statement)
+
+    def tearDown(self):
+        event.remove(db.engine, 'before_cursor_execute', self.log_statement)
+        super().tearDown()
+
+    def log_statement(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_saving_reads_back_the_generated_columns_with_the_insert(self):
+        user = User("testor@example.com", "!0ctoPus")
+        user.save()
+        shoppinglist = ShoppingList(user.id, "groceries", "2018-03-14")
+        del self.statements[:]
+        shoppinglist.save()
+
+        self.assertIsNotNone(shoppinglist.date_created)
+        self.assertEqual(shoppinglist.date_created, shoppinglist.date_modified)
+        self.assertEqual(shoppinglist.version, 1)
+        self.assertIsNotNone(shoppinglist.change_seq)
+        self.assertEqual(len(self.statements), 1)
+        self.assertIn("RETURNING", self.statements[0])
+
+    def test_rows_are_timestamped_when_they_are_written(self):
+        user = User("testor@example.com", "!0ctoPus")
+        user.save()
+        first = ShoppingList(user.id, "groceries", "2018-03-14")
+        first.save()
+        second = ShoppingList(user.id, "hardware", "2018-03-14")
+        second.save()
+        self.assertLess(first.date_created, second.date_created)
+
+        second.name = "tools"
+        second.save()
+        self.assertLess(second.date_created, second.date_modified)
+        self.assertEqual(second.version, 2)
+
+    def test_creating_an_item_writes_it_with_one_statement(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        headers = {'Authorization': f'Bearer {json.loads(resp.data)["token"]}'}
+        self.test_client.post(
+            "/api/v1/shoppinglists", headers=headers,
+            data={"name": "groceries", "notify_date": "2018-03-14"})
+
+        del self.statements[:]
+        resp = self.test_client.post(
+            "/api/v1/shoppinglists/1/items", headers=headers,
+            data=dict(name="beans", price='3,500/=', quantity='1 kg'))
+        self.assertEqual(resp.status_code, 201)
+        writes = [statement for statement in self.statements
+                  if not statement.lstrip().startswith("SELECT")]
+        self.assertEqual(len(writes), 1)
@@ -0,0 +1,188 @@
+import json
+from datetime import timedelta
+from tests import BaseTests
+from app import db
+from app.models import ShoppingList, Item, Tombstone
+from app.trash import purge_trash
+
+
+class TestTrash(BaseTests):
+    """ Tests for restoring deleted lists and items from the trash"""
+
+    def setUp(self):
+        super().setUp()
+        self.headers = self.login(self.user_data)
+        for name in ("groceries", "furniture"):
+            self.test_client.post(
+                "/api/v1/shoppinglists", headers=self.headers,
+                data={"name": name, "notify_date": "2018-03-14"})
+        for name in ("beans", "rice"):
+            self.add_item(1, name)
+
+    def login(self, user_data):
+        self.test_client.post("/api/v1/auth/register", data=user_data)
+        resp = self.test_client.post("/api/v1/auth/login", data=user_data)
+        return {'Authorization': f'Bearer {json.loads(resp.data)["token"]}'}
+
+    def add_item(self, list_id, name):
+        return self.test_client.post(
+            f"/api/v1/shoppinglists/{list_id}/items", headers=self.headers,
+            data=dict(name=name, price='3,500/=', quantity='1 kg'))
+
+    def get_trash(self, query=''):
+        resp = self.test_client.get(f"/api/v1/trash{query}",
+                                    headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(resp.data)
+
+    def sync(self, since=0):
+        resp = self.test_client.get(f"/api/v1/sync?since={since}",
+                                    headers=self.headers)
+        return json.loads(resp.data)
+
+    def expire_trash(self):
+        for model in (ShoppingList, Item):
+            model.query.filter(model.deleted_at.isnot(None)).update(
+                {model.deleted_at: db.func.now() - timedelta(days=31)},
+                synchronize_session=False)
+        db.session.commit()
+
+    def test_a_deleted_list_can_be_restored_with_its_items(self):
+        self.test_client.delete("/api/v1/shoppinglists/1",
+                                headers=self.headers)
+        trash = self.get_trash()
+        self.assertEqual([shoppinglist['name']
+                          for shoppinglist in trash['lists']], ['groceries'])
+        self.assertIn('deleted_at', trash['lists'][0])
+        self.assertEqual(trash['items'], [])
+
+        resp = self.test_client.post(
+            "/api/v1/trash/shoppinglists/1/restore", headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)['message'],
+                         "shopping list with ID 1 restored successfully")
+        resp = self.test_client.get("/api/v1/shoppinglists/1/items",
+                                    headers=self.headers)
+        self.assertEqual(len(json.loads(resp.data)['items']), 2)
+        self.assertEqual(self.get_trash()['lists'], [])
+
+    def test_a_deleted_item_can_be_restored(self):
+        self.test_client.delete("/api/v1/shoppinglists/1/items/1",
+                                headers=self.headers)
+        self.assertEqual([item['name'] for item in self.get_trash()['items']],
+                         ['beans'])
+
+        resp = self.test_client.post(
+            "/api/v1/trash/shoppinglists/1/items/1/restore",
+            headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+        resp = self.test_client.get("/api/v1/shoppinglists/1/items/1",
+                                    headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_the_trash_is_paged(self):
+        for item_id in (1, 2):
+            self.test_client.delete(f"/api/v1/shoppinglists/1/items/{item_id}",
+                                    headers=self.headers)
+        self.test_client.delete("/api/v1/shoppinglists/2",
+                                headers=self.headers)
+
+        first_page = self.get_trash("?limit=1")
+        self.assertEqual([shoppinglist['name']
+                          for shoppinglist in first_page['lists']],
+                         ['furniture'])
+        self.assertEqual([item['name'] for item in first_page['items']],
+                         ['rice'])
+        self.assertEqual(first_page['next_page'],
+                         "/api/v1/trash?page=2&limit=1")
+        self.assertIsNone(first_page['previous_page'])
+
+        last_page = self.get_trash("?page=2&limit=1")
+        self.assertEqual(last_page['lists'], [])
+        self.assertEqual([item['name'] for item in last_page['items']],
+                         ['beans'])
+        self.assertIsNone(last_page['next_page'])
+        self.assertEqual(last_page['previous_page'],
+                         "/api/v1/trash?page=1&limit=1")
+
+    def test_only_what_is_in_the_trash_can_be_restored(self):
+        resp = self.test_client.post(
+            "/api/v1/trash/shoppinglists/1/restore", headers=self.headers)
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(json.loads(resp.data)['message'],
+                         "shopping list with that ID isn't in the trash")
+        resp = self.test_client.post(
+            "/api/v1/trash/shoppinglists/1/items/1/restore",
+            headers=self.headers)
+        self.assertEqual(resp.status_code, 404)
+        resp = self.test_client.post(
+            "/api/v1/trash/shoppinglists/one/restore", headers=self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+        # nor the lists of other users
+        self.test_client.delete("/api/v1/shoppinglists/1",
+                                headers=self.headers)
+        self.headers = self.login(dict(email="other@example.com",
+                                       password="!0ctoPus"))
+        self.assertEqual(self.get_trash()['lists'], [])
+        resp = self.test_client.post(
+            "/api/v1/trash/shoppinglists/1/restore", headers=self.headers)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_a_trashed_name_can_be_reused_but_not_restored_over(self):
+        self.test_client.delete("/api/v1/shoppinglists/1/items/1",
+                                headers=self.headers)
+        self.assertEqual(self.add_item(1, "beans").status_code, 201)
+        resp = self.test_client.post(
+            "/api/v1/trash/shoppinglists/1/items/1/restore",
+            headers=self.headers)
+        self.assertEqual(resp.status_code, 409)
+
+        self.test_client.delete("/api/v1/shoppinglists/2",
+                                headers=self.headers)
+        resp = self.test_client.post(
+            "/api/v1/shoppinglists", headers=self.headers,
+            data={"name": "furniture", "notify_date": "2018-03-14"})
+        self.assertEqual(resp.status_code, 201)
+        resp = self.test_client.post(
+            "/api/v1/trash/shoppinglists/2/restore", headers=self.headers)
+        self.assertEqual(resp.status_code, 409)
+        self.assertIsNotNone(ShoppingList.query.get(2).deleted_at)
+
+    def test_sync_reports_trashed_and_restored_lists(self):
+        token = self.sync()['token']
+        self.test_client.delete("/api/v1/shoppinglists/1",
+                                headers=self.headers)
+        changes = self.sync(token)
+        self.assertEqual(changes['deleted'], {"lists": [1], "items": []})
+        self.assertEqual(changes['lists'], [])
+
+        self.test_client.post("/api/v1/trash/shoppinglists/1/restore",
+                              headers=self.headers)
+        changes = self.sync(changes['token'])
+        self.assertEqual([shoppinglist['id']
+                          for shoppinglist in changes['lists']], [1])
+        self.assertEqual([item['id'] for item in changes['items']], [1, 2])
+        self.assertEqual(changes['deleted'], {"lists": [], "items": []})
+
+    def test_expired_trash_is_purged_in_batches_with_tombstones(self):
+        self.add_item(2, "chair")
+        self.test_client.delete("/api/v1/shoppinglists/1",
+                                headers=self.headers)
+        self.test_client.delete("/api/v1/shoppinglists/2/items/3",
+                                headers=self.headers)
+        self.expire_trash()
+        self.add_item(2, "table")
+        self.test_client.delete("/api/v1/shoppinglists/2/items/4",
+                                headers=self.headers)
+
+        self.assertEqual(purge_trash(2592000, batch_size=1), 4)
+        db.session.remove()
+        self.assertEqual(ShoppingList.query.count(), 1)
+        self.assertEqual([item.name for item in Item.query.all()], ["table"])
+        self.assertEqual(
+            sorted((tombstone.object_type, tombstone.object_id)
+                   for tombstone in Tombstone.query.all()),
+            [("item", 3), ("shoppinglist", 1)])
+        # the item that was deleted recently can still be restored
+        self.assertEqual(len(self.get_trash()['items']), 1)
@@ -0,0 +1,80 @@
+import json
+from flask import jsonify
+from sqlalchemy import event
+from tests import BaseTests
+from app import db
+from app.events import get_broker, publish_change
+from app.models import ShoppingList, User
+
+
+class TestUnitOfWork(BaseTests):
+    """ Tests for committing the changes of a request together"""
+
+    def setUp(self):
+        super().setUp()
+
+        @self.app.route("/test/stage/<int:status_code>")
+        def stage_a_user(status_code):
+            User("staged@example.com", "!0ctoPus").save()
+            return jsonify({}), status_code
+
+        @self.app.route("/test/raise")
+        def raise_after_staging():
+            User("staged@example.com", "!0ctoPus").save()
+            raise RuntimeError("the view failed")
+
+    def count_users(self):
+        """ counts the users that have been committed, as seen by another
+        connection than the session's"""
+        return db.engine.execute("SELECT count(*) FROM users").scalar()
+
+    def test_the_changes_of_a_successful_request_are_committed(self):
+        self.test_client.get("/test/stage/200")
+        self.assertEqual(self.count_users(), 1)
+
+    def test_the_changes_of_a_failed_request_are_rolled_back(self):
+        self.test_client.get("/test/stage/400")
+        self.assertEqual(self.count_users(), 0)
+
+        self.app.config['PROPAGATE_EXCEPTIONS'] = False
+        resp = self.test_client.get("/test/raise")
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(self.count_users(), 0)
+
+    def test_saving_outside_a_request_commits_right_away(self):
+        User("testor@example.com", "!0ctoPus").save()
+        self.assertEqual(self.count_users(), 1)
+
+    def test_a_request_is_committed_once(self):
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        headers = {'Authorization': f'Bearer {json.loads(resp.data)["token"]}'}
+        self.test_client.post(
+            "/api/v1/shoppinglists", headers=headers,
+            data={"name": "groceries", "notify_date": "2018-03-14"})
+
+        commits = []
+
+        def count_commit(session):
+            commits.append(session)
+        event.listen(db.session, 'after_commit', count_commit)
+        try:
+            resp = self.test_client.delete(
+                "/api/v1/shoppinglists/1", headers=headers)
+        finally:
+            event.remove(db.session, 'after_commit', count_commit)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(commits), 1)
+        self.assertIsNotNone(ShoppingList.query.get(1).deleted_at)
+
+    def test_changes_are_published_once_they_are_committed(self):
+        subscription = get_broker().subscribe(1)
+        publish_change(1, "created", "shoppinglist", 1, 1)
+        db.session.rollback()
+        self.assertTrue(subscription.empty())
+
+        publish_change(1, "created", "shoppinglist", 2, 2)
+        self.assertTrue(subscription.empty())
+        db.session.commit()
+        self.assertEqual(subscription.get_nowait()["id"], 2)
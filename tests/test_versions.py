@@ -0,0 +1,91 @@
+import json
+from tests import BaseTests
+
+
+class TestOptimisticConcurrency(BaseTests):
+    """ Tests for refusing edits made to stale shoppinglists and items"""
+
+    def setUp(self):
+        super().setUp()
+        self.test_client.post("/api/v1/auth/register", data=self.user_data)
+        resp = self.test_client.post(
+            "/api/v1/auth/login", data=self.user_data)
+        self.token = json.loads(resp.data)['token']
+        self.test_client.post(
+            "/api/v1/shoppinglists",
+            data={"name": "groceries", "notify_date": "2018-03-14"},
+            headers=self.headers())
+        self.test_client.post(
+            "/api/v1/shoppinglists/1/items",
+            data=dict(name="beans", price='3,500/=', quantity='1 kg'),
+            headers=self.headers())
+
+    def headers(self, **headers):
+        headers['Authorization'] = f'Bearer {self.token}'
+        return headers
+
+    def test_shoppinglist_edits_are_refused_once_the_etag_is_stale(self):
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists/1", headers=self.headers())
+        etag = resp.headers['ETag']
+        self.assertEqual(etag, '"1"')
+
+        resp = self.test_client.put(
+            "/api/v1/shoppinglists/1",
+            data={"name": "furniture", "notify_date": "2018-07-14"},
+            headers=self.headers(**{'If-Match': etag}))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['ETag'], '"2"')
+
+        # another device still holds the first version
+        resp = self.test_client.put(
+            "/api/v1/shoppinglists/1",
+            data={"name": "books", "notify_date": "2018-07-14"},
+            headers=self.headers(**{'If-Match': etag}))
+        # werkzeug sends 412 responses without a body, like 304 ones
+        self.assertEqual(resp.status_code, 412)
+        self.assertEqual(resp.headers['ETag'], '"2"')
+
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists/1", headers=self.headers())
+        self.assertEqual(json.loads(resp.data)['name'], 'furniture')
+
+    def test_shoppinglist_edits_without_if_match_are_unconditional(self):
+        resp = self.test_client.put(
+            "/api/v1/shoppinglists/1",
+            data={"name": "furniture", "notify_date": "2018-07-14"},
+            headers=self.headers())
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.test_client.put(
+            "/api/v1/shoppinglists/1",
+            data={"name": "furniture", "notify_date": "2018-07-14"},
+            headers=self.headers(**{'If-Match': '"2"'}))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)['message'],
+                         "No changes were made to the list")
+
+    def test_item_edits_are_refused_once_the_etag_is_stale(self):
+        resp = self.test_client.get(
+            "/api/v1/shoppinglists/1/items/1", headers=self.headers())
+        etag = resp.headers['ETag']
+
+        resp = self.test_client.put(
+            "/api/v1/shoppinglists/1/items/1",
+            data=dict(name="beans", price='4,000/=', quantity='1 kg'),
+            headers=self.headers(**{'If-Match': etag}))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)['data']['price'], '4,000/=')
+
+        resp = self.test_client.put(
+            "/api/v1/shoppinglists/1/items/1",
+            data=dict(name="beans", price='5,000/=', quantity='1 kg'),
+            headers=self.headers(**{'If-Match': etag}))
+        self.assertEqual(resp.status_code, 412)
+
+        resp = self.test_client.put(
+            "/api/v1/shoppinglists/1/items/1",
+            data=dict(name="beans", price='5,000/=', quantity='1 kg'),
+            headers=self.headers(**{'If-Match': '*'}))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['ETag'], '"3"')